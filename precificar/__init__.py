@@ -0,0 +1 @@
+"""Módulos de apoio do app de precificação (sem dependência do Streamlit)."""
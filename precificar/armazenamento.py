@@ -0,0 +1,625 @@
+"""
+Armazenamento dos conjuntos de dados do app (precificação e papelaria).
+
+Todos os backends têm a mesma interface (`carregar`, `salvar_varios`, `contem`),
+com o nome do conjunto igual ao caminho do CSV no repositório
+(ex.: "produtos_papelaria.csv"):
+
+- `ArmazenamentoGitHub`: o comportamento original, CSV inteiro no repositório
+  (leitura pelo cache de CSVs, gravação pelo gravador em segundo plano);
+- `ArmazenamentoSQLite`: arquivo local, uma linha da tabela por linha do DF,
+  indexada pela coluna-chave (o produto). Salvar grava só as linhas novas ou
+  alteradas e apaga as removidas;
+- `ArmazenamentoParquet`: um snapshot local por conjunto, gravado de uma vez;
+- `ArmazenamentoRegistro`: registro local de operações só de acréscimo
+  (inclusão/edição/exclusão de linha), reaplicado sobre um snapshot que é
+  refeito periodicamente (compactação).
+
+`ArmazenamentoReplicado` lê e grava num backend local e repete as gravações
+numa réplica (o GitHub); na primeira leitura de um conjunto que ainda não existe
+localmente, e numa recarga pedida (`revalidar=True`), ele é copiado da réplica.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from precificar.autosave import obter_gravador
+from precificar.cache_csv import obter_carregador
+from precificar.rastreamento import Alteracoes, hash_linhas
+
+DIRETORIO_DADOS = os.environ.get(
+    "PRECIFICAR_DADOS_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "dados"),
+)
+# Coluna(s) que identificam a linha em cada conjunto (os demais usam a primeira coluna)
+COLUNAS_CHAVE = {
+    "precificacao.csv": "Produto",
+    "produtos_papelaria.csv": "Produto",
+    "insumos_papelaria.csv": "Nome",
+    "categorias_papelaria.csv": "Campo",
+    "composicao_papelaria.csv": ("Produto", "Insumo"),
+}
+BACKENDS = ("github", "sqlite", "parquet", "registro")
+# Operações acumuladas no registro antes da compactação (no mínimo; ou o tamanho do snapshot)
+LIMITE_OPERACOES = int(os.environ.get("PRECIFICAR_REGISTRO_LIMITE", "500"))
+
+
+class Armazenamento:
+    """Interface comum dos backends."""
+
+    def carregar(self, nome: str, revalidar: bool = False) -> pd.DataFrame:
+        """DataFrame do conjunto `nome` (vazio se ainda não existe)."""
+        raise NotImplementedError
+
+    def contem(self, nome: str) -> bool:
+        raise NotImplementedError
+
+    @property
+    def le_do_github(self) -> bool:
+        """`carregar(nome, revalidar=True)` busca o conjunto no GitHub (e não só na cópia local)."""
+        return False
+
+    def salvar_varios(self, dataframes: dict, mensagem: str = "Atualização via app",
+                      alteracoes: Optional[dict] = None):
+        """
+        Grava vários conjuntos (nome -> DataFrame) juntos (mesmo commit / mesma transação).
+        `alteracoes` (nome -> Alteracoes do rastreador) é opcional: os backends que gravam por
+        operação usam para não comparar o DF inteiro com o que está gravado.
+        """
+        raise NotImplementedError
+
+    def salvar(self, nome: str, df: pd.DataFrame, mensagem: str = "Atualização via app"):
+        self.salvar_varios({nome: df}, mensagem)
+
+
+class ArmazenamentoGitHub(Armazenamento):
+    """CSVs no repositório: leitura com cache/ETag, gravação agendada (debounce, um commit por lote)."""
+
+    def __init__(self, token: str, repo: str, branch: str = "main", ttl: Optional[float] = None):
+        self.token = token
+        self.repo = repo
+        self.branch = branch
+        self.ttl = ttl
+
+    def _url(self, nome: str) -> str:
+        return f"https://raw.githubusercontent.com/{self.repo}/{self.branch}/{nome}"
+
+    @property
+    def le_do_github(self) -> bool:
+        return True
+
+    def carregar(self, nome: str, revalidar: bool = False) -> pd.DataFrame:
+        # Erros de rede já são tratados no carregador (retorna a última versão ou DF vazio)
+        return obter_carregador().carregar(self._url(nome), revalidar=revalidar, ttl=self.ttl)
+
+    def contem(self, nome: str) -> bool:
+        return not self.carregar(nome).empty
+
+    def salvar_varios(self, dataframes: dict, mensagem: str = "Atualização via app",
+                      alteracoes: Optional[dict] = None):
+        obter_gravador().agendar_varios(self.token, self.repo, dataframes, self.branch, mensagem)
+        # Novas sessões já carregam a versão salva, sem esperar o CDN do raw.githubusercontent
+        for nome, df in dataframes.items():
+            obter_carregador().atualizar(self._url(nome), df)
+
+
+def _registros_json(df: pd.DataFrame) -> list:
+    """Cada linha como JSON {coluna: valor} (NaN vira null), na ordem das colunas."""
+    colunas = [str(c) for c in df.columns]
+    valores = df.astype(object).where(df.notna(), None).to_numpy().tolist()
+    return [json.dumps(dict(zip(colunas, linha)), ensure_ascii=False, default=str) for linha in valores]
+
+
+def _df_de_registros(colunas: list, registros: list) -> pd.DataFrame:
+    """DataFrame a partir das linhas {coluna: valor} gravadas por _registros_json."""
+    df = pd.DataFrame.from_records(registros, columns=colunas)
+    # Colunas só com nulos voltam como float (NaN), como no read_csv do CSV
+    for col in df.columns[(df.dtypes == object).to_numpy() & df.isna().all().to_numpy()]:
+        df[col] = float("nan")
+    return df
+
+
+def chaves_linhas(df: pd.DataFrame, colunas) -> tuple:
+    """
+    (chave única de cada linha, valor da coluna-chave). `colunas` é o nome da coluna-chave ou uma
+    tupla de colunas (a chave junta os valores; o valor devolvido é o da primeira). Valores
+    repetidos ganham um sufixo de ocorrência.
+    """
+    colunas = (colunas,) if isinstance(colunas, str) else tuple(colunas or ())
+    if not colunas or any(c not in df.columns for c in colunas):
+        return [str(i) for i in range(len(df))], [None] * len(df)
+    partes = [
+        df[c].astype(object).where(df[c].notna(), None).map(lambda v: "" if v is None else str(v)) for c in colunas
+    ]
+    valores = partes[0]
+    for parte in partes[1:]:
+        valores = valores + "\x1e" + parte
+    ocorrencia = valores.groupby(valores, sort=False).cumcount()
+    return [f"{v}\x1f{n}" for v, n in zip(valores, ocorrencia)], partes[0].tolist()
+
+
+def _chave_livre(chaves, chave: str) -> str:
+    """`chave` (de chaves_linhas) com o sufixo de ocorrência aumentado até não estar em `chaves`."""
+    valor, separador, n = chave.rpartition("\x1f")
+    if not separador:
+        valor, n = chave, -1
+    while chave in chaves:
+        n = int(n) + 1
+        chave = f"{valor}\x1f{n}"
+    return chave
+
+
+class ArmazenamentoSQLite(Armazenamento):
+    """
+    Conjuntos num arquivo SQLite, uma linha por linha do DF (JSON), indexada pela coluna-chave.
+
+    O hash de cada linha gravada fica em memória: salvar compara o DF com ele e só faz
+    upsert das linhas novas/alteradas e delete das removidas. A ordem das linhas é mantida;
+    só uma reordenação (rara no app) renumera todas.
+    """
+
+    def __init__(self, caminho: Optional[str] = None, colunas_chave: Optional[dict] = None):
+        self.caminho = caminho or os.path.join(DIRETORIO_DADOS, "precificar.sqlite3")
+        self.colunas_chave = COLUNAS_CHAVE if colunas_chave is None else colunas_chave
+        if self.caminho != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.caminho)), exist_ok=True)
+        self._conexao = sqlite3.connect(self.caminho, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._estado = {}  # nome -> {chave: (hash, ordem)} do que está gravado
+        with self._conexao:
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.executescript("""
+                CREATE TABLE IF NOT EXISTS conjuntos (nome TEXT PRIMARY KEY, colunas TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS linhas (
+                    conjunto TEXT NOT NULL,
+                    chave TEXT NOT NULL,
+                    valor_chave TEXT,
+                    ordem INTEGER NOT NULL,
+                    hash TEXT NOT NULL,
+                    dados TEXT NOT NULL,
+                    PRIMARY KEY (conjunto, chave)
+                );
+                CREATE INDEX IF NOT EXISTS linhas_valor_chave ON linhas (conjunto, valor_chave);
+            """)
+
+    def _colunas(self, nome: str) -> Optional[list]:
+        linha = self._conexao.execute("SELECT colunas FROM conjuntos WHERE nome = ?", (nome,)).fetchone()
+        return json.loads(linha[0]) if linha else None
+
+    def _montar_df(self, colunas: list, registros: list) -> pd.DataFrame:
+        return _df_de_registros(colunas, [json.loads(r) for r in registros])
+
+    def contem(self, nome: str) -> bool:
+        with self._lock:
+            return self._colunas(nome) is not None
+
+    def carregar(self, nome: str, revalidar: bool = False) -> pd.DataFrame:
+        with self._lock:
+            colunas = self._colunas(nome)
+            if colunas is None:
+                return pd.DataFrame()
+            linhas = self._conexao.execute(
+                "SELECT chave, ordem, hash, dados FROM linhas WHERE conjunto = ? ORDER BY ordem", (nome,)
+            ).fetchall()
+            self._estado[nome] = {chave: (h, ordem) for chave, ordem, h, _ in linhas}
+        return self._montar_df(colunas, [dados for *_, dados in linhas])
+
+    def linhas(self, nome: str, valor_chave) -> pd.DataFrame:
+        """Só as linhas do conjunto com `valor_chave` na coluna-chave (ex.: um produto), pelo índice."""
+        with self._lock:
+            colunas = self._colunas(nome)
+            if colunas is None:
+                return pd.DataFrame()
+            registros = [r for (r,) in self._conexao.execute(
+                "SELECT dados FROM linhas WHERE conjunto = ? AND valor_chave = ? ORDER BY ordem",
+                (nome, str(valor_chave)),
+            )]
+        return self._montar_df(colunas, registros)
+
+    def _estado_gravado(self, nome: str) -> dict:
+        if nome not in self._estado:
+            self._estado[nome] = {
+                chave: (h, ordem) for chave, h, ordem in self._conexao.execute(
+                    "SELECT chave, hash, ordem FROM linhas WHERE conjunto = ?", (nome,)
+                )
+            }
+        return self._estado[nome]
+
+    def _salvar_conjunto(self, nome: str, df: pd.DataFrame):
+        """Diferença entre `df` e o gravado, aplicada na transação aberta pelo chamador."""
+        colunas = [str(c) for c in df.columns]
+        chaves, valores_chave = chaves_linhas(df, self.colunas_chave.get(nome, colunas[0] if colunas else None))
+        # Hash vetorizado das linhas (o mesmo do rastreador): só as linhas alteradas viram JSON
+        hashes = [format(h, "016x") for h in hash_linhas(df)]
+        gravado = self._estado_gravado(nome)
+
+        if self._colunas(nome) != colunas:
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO conjuntos (nome, colunas) VALUES (?, ?)", (nome, json.dumps(colunas))
+            )
+            gravado = {c: ("", ordem) for c, (_, ordem) in gravado.items()}  # Colunas mudaram: regrava tudo
+
+        novas = set(chaves)
+        removidas = [c for c in gravado if c not in novas]
+        if removidas:
+            self._conexao.executemany(
+                "DELETE FROM linhas WHERE conjunto = ? AND chave = ?", [(nome, c) for c in removidas]
+            )
+
+        # Ordem: se as linhas que continuam mantêm a ordem relativa e as novas estão no fim,
+        # só as novas recebem número; senão, renumera tudo
+        ordens = [gravado[c][1] for c in chaves if c in gravado]
+        ultima_mantida = max((i for i, c in enumerate(chaves) if c in gravado), default=-1)
+        em_ordem = all(a < b for a, b in zip(ordens, ordens[1:])) and all(
+            c in gravado for c in chaves[:ultima_mantida + 1]
+        )
+        if em_ordem:
+            ordem = {c: gravado[c][1] for c in chaves if c in gravado}
+            proxima = max(ordens, default=-1) + 1
+            for c in chaves[ultima_mantida + 1:]:
+                ordem[c] = proxima
+                proxima += 1
+        else:
+            ordem = {c: i for i, c in enumerate(chaves)}
+            self._conexao.executemany(
+                "UPDATE linhas SET ordem = ? WHERE conjunto = ? AND chave = ?",
+                [(ordem[c], nome, c) for c in chaves if c in gravado and gravado[c][1] != ordem[c]],
+            )
+
+        alteradas = [i for i, (c, h) in enumerate(zip(chaves, hashes)) if c not in gravado or gravado[c][0] != h]
+        if alteradas:
+            registros = _registros_json(df.iloc[alteradas])
+            self._conexao.executemany(
+                "INSERT INTO linhas (conjunto, chave, valor_chave, ordem, hash, dados) VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (conjunto, chave) DO UPDATE SET"
+                " valor_chave = excluded.valor_chave, ordem = excluded.ordem,"
+                " hash = excluded.hash, dados = excluded.dados",
+                [(nome, chaves[i], valores_chave[i], ordem[chaves[i]], hashes[i], r)
+                 for i, r in zip(alteradas, registros)],
+            )
+        return {c: (h, ordem[c]) for c, h in zip(chaves, hashes)}
+
+    def salvar_varios(self, dataframes: dict, mensagem: str = "Atualização via app",
+                      alteracoes: Optional[dict] = None):
+        with self._lock:
+            novos_estados = {}
+            try:
+                with self._conexao:
+                    for nome, df in dataframes.items():
+                        novos_estados[nome] = self._salvar_conjunto(nome, df)
+            except Exception:
+                # Transação desfeita: o estado em memória volta a ser lido do disco
+                for nome in dataframes:
+                    self._estado.pop(nome, None)
+                raise
+            self._estado.update(novos_estados)
+
+
+class ArmazenamentoParquet(Armazenamento):
+    """Um arquivo Parquet por conjunto, regravado inteiro (escrita atômica) a cada salvamento."""
+
+    def __init__(self, diretorio: Optional[str] = None):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError("O backend Parquet precisa do pacote `pyarrow`.") from e
+        self.diretorio = diretorio or os.path.join(DIRETORIO_DADOS, "parquet")
+        self._lock = threading.Lock()
+
+    def _caminho(self, nome: str) -> str:
+        return os.path.join(self.diretorio, os.path.splitext(nome)[0] + ".parquet")
+
+    def contem(self, nome: str) -> bool:
+        return os.path.exists(self._caminho(nome))
+
+    def carregar(self, nome: str, revalidar: bool = False) -> pd.DataFrame:
+        try:
+            return pd.read_parquet(self._caminho(nome))
+        except (OSError, ValueError):
+            return pd.DataFrame()
+
+    def salvar_varios(self, dataframes: dict, mensagem: str = "Atualização via app",
+                      alteracoes: Optional[dict] = None):
+        os.makedirs(self.diretorio, exist_ok=True)
+        with self._lock:
+            for nome, df in dataframes.items():
+                caminho = self._caminho(nome)
+                tmp = caminho + ".tmp"
+                try:
+                    df.to_parquet(tmp, index=False)
+                except (TypeError, ValueError):
+                    # Colunas com tipos misturados (ex.: números e textos): grava como texto
+                    df = df.copy()
+                    for col in df.select_dtypes(include=["object"]).columns:
+                        df[col] = df[col].map(lambda v: v if v is None or pd.isna(v) else str(v))
+                    df.to_parquet(tmp, index=False)
+                os.replace(tmp, caminho)
+
+
+@dataclass
+class _EstadoRegistro:
+    colunas: Optional[list]
+    linhas: dict  # chave -> (hash, {coluna: valor}), na ordem das linhas do DF
+    seq: int  # número da última operação aplicada
+    operacoes: int  # operações no registro desde o último snapshot
+    base: Optional[tuple] = None  # Alteracoes.versao do último salvamento feito por este processo
+
+
+class ArmazenamentoRegistro(Armazenamento):
+    """
+    Registro de operações só de acréscimo (append-only) + snapshot, por conjunto.
+
+    Salvar acrescenta ao `<conjunto>.log.jsonl` uma linha por linha do DF incluída, editada
+    ou excluída (uma alteração de preço de insumo vira a edição do insumo e dos produtos
+    repreçados). Com as `alteracoes` do rastreador só essas linhas são hasheadas e gravadas, e
+    o custo é proporcional ao que mudou, não ao tamanho do catálogo; sem elas (ou se outra
+    sessão salvou desde o último salvamento desta) o DF inteiro é comparado. Carregar
+    lê o snapshot e reaplica o registro. Quando o registro passa do tamanho do snapshot (e
+    de `limite_operacoes`), ele é compactado num snapshot novo, então a compactação sai
+    amortizada pelas operações que a provocaram. Mudança de colunas ou reordenação das
+    linhas grava o snapshot direto.
+
+    Cada operação tem um número de sequência e o snapshot guarda o último que contém: uma
+    queda entre a troca do snapshot e a limpeza do registro não reaplica nada duas vezes, e
+    uma linha incompleta no fim do registro (queda no meio da gravação) é ignorada.
+    """
+
+    def __init__(self, diretorio: Optional[str] = None, colunas_chave: Optional[dict] = None,
+                 limite_operacoes: int = LIMITE_OPERACOES):
+        self.diretorio = diretorio or os.path.join(DIRETORIO_DADOS, "registro")
+        self.colunas_chave = COLUNAS_CHAVE if colunas_chave is None else colunas_chave
+        self.limite_operacoes = limite_operacoes
+        self._lock = threading.Lock()
+        self._estado = {}  # nome -> _EstadoRegistro
+
+    def _caminhos(self, nome: str) -> tuple:
+        base = os.path.join(self.diretorio, os.path.splitext(nome)[0])
+        return base + ".snapshot.jsonl", base + ".log.jsonl"
+
+    @staticmethod
+    def _ler_linhas(caminho: str):
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                for texto in f:
+                    try:
+                        yield json.loads(texto)
+                    except ValueError:
+                        continue  # Linha cortada por uma queda no meio da gravação
+        except FileNotFoundError:
+            return
+
+    def _carregar_estado(self, nome: str) -> _EstadoRegistro:
+        if nome in self._estado:
+            return self._estado[nome]
+        caminho_snapshot, caminho_log = self._caminhos(nome)
+        estado = _EstadoRegistro(None, {}, 0, 0)
+        for k, item in enumerate(self._ler_linhas(caminho_snapshot)):
+            if k == 0:
+                estado.colunas, estado.seq = item["colunas"], item["seq"]
+            else:
+                estado.linhas[item["chave"]] = (item["hash"], item["linha"])
+        for op in self._ler_linhas(caminho_log):
+            if op["seq"] <= estado.seq:
+                continue  # Já está no snapshot
+            if op["op"] == "excluir":
+                estado.linhas.pop(op["chave"], None)
+            else:
+                estado.linhas[op["chave"]] = (op["hash"], op["linha"])
+            estado.seq = op["seq"]
+            estado.operacoes += 1
+        self._estado[nome] = estado
+        return estado
+
+    def contem(self, nome: str) -> bool:
+        with self._lock:
+            return self._carregar_estado(nome).colunas is not None
+
+    def carregar(self, nome: str, revalidar: bool = False) -> pd.DataFrame:
+        with self._lock:
+            estado = self._carregar_estado(nome)
+            if estado.colunas is None:
+                return pd.DataFrame()
+            if estado.operacoes > max(self.limite_operacoes, len(estado.linhas)):
+                self._compactar(nome, estado)
+            return _df_de_registros(estado.colunas, [linha for _, linha in estado.linhas.values()])
+
+    def compactar(self, nome: str):
+        """Grava o estado atual como snapshot e esvazia o registro."""
+        with self._lock:
+            estado = self._carregar_estado(nome)
+            if estado.colunas is not None:
+                self._compactar(nome, estado)
+
+    def _compactar(self, nome: str, estado: _EstadoRegistro):
+        caminho_snapshot, caminho_log = self._caminhos(nome)
+        os.makedirs(self.diretorio, exist_ok=True)
+        tmp = caminho_snapshot + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"seq": estado.seq, "colunas": estado.colunas}, ensure_ascii=False) + "\n")
+            for chave, (h, linha) in estado.linhas.items():
+                f.write(json.dumps({"chave": chave, "hash": h, "linha": linha}, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, caminho_snapshot)
+        # Depois da troca do snapshot: as operações que ficarem no registro têm seq <= snapshot
+        with open(caminho_log, "w", encoding="utf-8"):
+            pass
+        estado.operacoes = 0
+
+    def _salvar_conjunto(self, nome: str, df: pd.DataFrame, alteracoes: Optional[Alteracoes] = None):
+        estado = self._carregar_estado(nome)
+        # As posições do rastreador só valem se o que está gravado é o salvamento anterior da mesma
+        # sessão; se outra sessão salvou no meio (ou a posição é desconhecida), compara o DF inteiro
+        if not (
+            alteracoes is not None and alteracoes.origem is not None and estado.base == alteracoes.base
+            and self._salvar_alteracoes(nome, estado, df, alteracoes)
+        ):
+            self._salvar_comparando(nome, estado, df)
+        estado.base = None if alteracoes is None else alteracoes.versao
+
+    def _salvar_alteracoes(self, nome: str, estado: _EstadoRegistro, df: pd.DataFrame,
+                           alteracoes: Alteracoes) -> bool:
+        """
+        Registra só as linhas que o rastreador aponta (editadas, incluídas no fim, excluídas):
+        nenhum hash ou chave das demais linhas é calculado. Retorna False se as posições não se
+        encaixam no que está gravado (ex.: colunas mudaram), e aí o DF inteiro é comparado.
+        """
+        origem, linhas = alteracoes.origem, estado.linhas
+        mantidas = origem[origem >= 0]
+        if (
+            estado.colunas != [str(c) for c in df.columns] or len(origem) != len(df)
+            or (origem[len(mantidas):] >= 0).any() or (len(mantidas) and mantidas[-1] >= len(linhas))
+            or (np.diff(mantidas) <= 0).any()
+        ):
+            return False
+
+        gravadas = list(linhas)
+        operacoes = []
+        for posicao in np.setdiff1d(np.arange(len(gravadas)), mantidas, assume_unique=True).tolist():
+            estado.seq += 1
+            operacoes.append({"seq": estado.seq, "op": "excluir", "chave": gravadas[posicao]})
+            del linhas[gravadas[posicao]]
+
+        alteradas = sorted(set(p for p in alteracoes.editadas if p < len(mantidas)) | set(range(len(mantidas), len(df))))
+        if alteradas:
+            trecho = df.iloc[alteradas]
+            hashes = [format(h, "016x") for h in hash_linhas(trecho)]
+            registros = [json.loads(r) for r in _registros_json(trecho)]
+            colunas = [str(c) for c in df.columns]
+            novas, _ = chaves_linhas(df.iloc[len(mantidas):], self.colunas_chave.get(nome, colunas[0] if colunas else None))
+            agora = time.time()
+            for i, h, linha in zip(alteradas, hashes, registros):
+                if i < len(mantidas):
+                    chave = gravadas[int(origem[i])]
+                    if linhas[chave][0] == h:
+                        continue  # Marcada, mas igual ao que está gravado
+                    op = "editar"
+                else:
+                    chave, op = _chave_livre(linhas, novas[i - len(mantidas)]), "incluir"
+                estado.seq += 1
+                operacoes.append({"seq": estado.seq, "em": agora, "op": op, "chave": chave, "hash": h, "linha": linha})
+                linhas[chave] = (h, linha)
+        self._anexar(nome, estado, operacoes)
+        return True
+
+    def _salvar_comparando(self, nome: str, estado: _EstadoRegistro, df: pd.DataFrame):
+        colunas = [str(c) for c in df.columns]
+        chaves, _ = chaves_linhas(df, self.colunas_chave.get(nome, colunas[0] if colunas else None))
+        hashes = [format(h, "016x") for h in hash_linhas(df)]
+        linhas = estado.linhas
+
+        # Só dá para registrar operações se as linhas mantidas continuam na mesma ordem e as novas
+        # estão no fim (é o que o registro reproduz); senão, e se as colunas mudaram, vai snapshot
+        novas = set(chaves)
+        mantidas = [c for c in chaves if c in linhas]
+        ultima_mantida = max((i for i, c in enumerate(chaves) if c in linhas), default=-1)
+        incremental = (
+            estado.colunas == colunas
+            and mantidas == [c for c in linhas if c in novas]
+            and len(mantidas) == ultima_mantida + 1
+        )
+        if not incremental:
+            registros = [json.loads(r) for r in _registros_json(df)]
+            estado.colunas = colunas
+            estado.linhas = {c: (h, linha) for c, h, linha in zip(chaves, hashes, registros)}
+            estado.seq += 1
+            self._compactar(nome, estado)
+            return
+
+        alteradas = [i for i, (c, h) in enumerate(zip(chaves, hashes)) if c not in linhas or linhas[c][0] != h]
+        registros = [json.loads(r) for r in _registros_json(df.iloc[alteradas])]
+        operacoes = []
+        for c in [c for c in linhas if c not in novas]:
+            estado.seq += 1
+            operacoes.append({"seq": estado.seq, "op": "excluir", "chave": c})
+            del linhas[c]
+        agora = time.time()
+        for i, linha in zip(alteradas, registros):
+            estado.seq += 1
+            c = chaves[i]
+            operacoes.append({"seq": estado.seq, "em": agora, "op": "editar" if c in linhas else "incluir",
+                              "chave": c, "hash": hashes[i], "linha": linha})
+            linhas[c] = (hashes[i], linha)
+        self._anexar(nome, estado, operacoes)
+
+    def _anexar(self, nome: str, estado: _EstadoRegistro, operacoes: list):
+        if not operacoes:
+            return
+        os.makedirs(self.diretorio, exist_ok=True)
+        with open(self._caminhos(nome)[1], "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(op, ensure_ascii=False, default=str) + "\n" for op in operacoes))
+            f.flush()
+            os.fsync(f.fileno())
+        estado.operacoes += len(operacoes)
+        if estado.operacoes > max(self.limite_operacoes, len(estado.linhas)):
+            self._compactar(nome, estado)
+
+    def salvar_varios(self, dataframes: dict, mensagem: str = "Atualização via app",
+                      alteracoes: Optional[dict] = None):
+        with self._lock:
+            for nome, df in dataframes.items():
+                try:
+                    self._salvar_conjunto(nome, df, (alteracoes or {}).get(nome))
+                except Exception:
+                    self._estado.pop(nome, None)  # Relê do disco na próxima vez
+                    raise
+
+
+class ArmazenamentoReplicado(Armazenamento):
+    """Lê e grava no backend `principal`; as gravações são repetidas na `replica` (ex.: GitHub)."""
+
+    def __init__(self, principal: Armazenamento, replica: Optional[Armazenamento] = None):
+        self.principal = principal
+        self.replica = replica
+
+    def contem(self, nome: str) -> bool:
+        return self.principal.contem(nome) or (self.replica is not None and self.replica.contem(nome))
+
+    def carregar(self, nome: str, revalidar: bool = False) -> pd.DataFrame:
+        """
+        Lê do backend local. Na primeira execução (conjunto ainda não existe localmente) ou com
+        `revalidar=True` (recarga pedida pelo usuário), traz o conjunto da réplica e sobrescreve a
+        cópia local; se a réplica não devolver nada (ex.: falha de rede), fica a cópia local.
+        """
+        if self.replica is not None and (revalidar or not self.principal.contem(nome)):
+            df = self.replica.carregar(nome, revalidar=revalidar)
+            if not df.empty:
+                self.principal.salvar(nome, df)
+                return df
+        return self.principal.carregar(nome)
+
+    @property
+    def le_do_github(self) -> bool:
+        return self.replica is not None
+
+    def salvar_varios(self, dataframes: dict, mensagem: str = "Atualização via app",
+                      alteracoes: Optional[dict] = None):
+        self.principal.salvar_varios(dataframes, mensagem, alteracoes)
+        if self.replica is not None:
+            self.replica.salvar_varios(dataframes, mensagem)
+
+
+_locais = {}
+_locais_lock = threading.Lock()
+
+
+def obter_armazenamento_local(tipo: str) -> Armazenamento:
+    """Instância única do backend local `tipo` ("sqlite", "parquet" ou "registro"), compartilhada pelo processo."""
+    with _locais_lock:
+        if tipo not in _locais:
+            if tipo == "sqlite":
+                _locais[tipo] = ArmazenamentoSQLite()
+            elif tipo == "parquet":
+                _locais[tipo] = ArmazenamentoParquet()
+            elif tipo == "registro":
+                _locais[tipo] = ArmazenamentoRegistro()
+            else:
+                raise ValueError(f"Backend de armazenamento desconhecido: {tipo!r} (use um de {BACKENDS})")
+        return _locais[tipo]
@@ -0,0 +1,317 @@
+"""
+Gravação em segundo plano dos CSVs no GitHub.
+
+O rerun do Streamlit só agenda o salvamento (`agendar`) e segue em frente. Uma
+thread do processo agrupa as alterações de cada arquivo numa janela de debounce
+e faz um único PUT na API de conteúdos, reaproveitando o sha devolvido pelo PUT
+anterior em vez de buscá-lo com um GET a cada vez. O que estiver pendente é
+gravado ao encerrar o processo.
+
+Quando vários arquivos do mesmo repositório estão pendentes juntos (ex.: os três
+CSVs da papelaria), eles vão num único commit pela Git Data API
+(árvore → commit → ref), mantendo os arquivos consistentes entre si.
+
+Um envio que falha volta para a fila com backoff exponencial (a menos que uma
+versão mais nova do arquivo já tenha sido agendada), então o salvamento não se
+perde até a próxima edição.
+"""
+import atexit
+import base64
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import pandas as pd
+
+from precificar import cliente_http
+
+DEBOUNCE_PADRAO = float(os.environ.get("PRECIFICAR_AUTOSAVE_DEBOUNCE", "5"))  # segundos sem novas alterações
+ESPERA_MAXIMA_PADRAO = float(os.environ.get("PRECIFICAR_AUTOSAVE_MAX", "30"))  # atraso máximo de um salvamento
+# Configurável para testes contra um servidor GitHub falso local
+GITHUB_API = os.environ.get("PRECIFICAR_GITHUB_API", "https://api.github.com")
+BACKOFF_BASE = 2.0  # segundos até a nova tentativa de um envio que falhou; dobra a cada falha
+BACKOFF_MAXIMO = 300.0
+
+
+def _sha_blob(conteudo: bytes) -> str:
+    """sha que o git atribui ao blob com este conteúdo (o mesmo devolvido pela API de conteúdos)."""
+    return hashlib.sha1(b"blob %d\0" % len(conteudo) + conteudo).hexdigest()
+
+
+def commit_multiplos_arquivos(token: str, repo: str, arquivos: dict, branch: str = "main",
+                              mensagem: str = "Atualização via app", base: Optional[tuple] = None,
+                              api: Optional[str] = None) -> tuple:
+    """
+    Grava vários arquivos num único commit pela Git Data API.
+
+    `arquivos` mapeia caminho -> conteúdo (str). `base` é o par (sha do commit, sha da árvore)
+    do topo da branch, se já conhecido; sem ele o topo é consultado. O conteúdo vai embutido
+    na árvore (a API cria os blobs), então o custo é constante: árvore + commit + ref,
+    mais 2 GETs quando `base` não é informado. Retorna o novo (sha do commit, sha da árvore).
+    Levanta RuntimeError se alguma etapa falhar; um 422 na atualização da ref significa que
+    a branch andou desde `base`.
+    """
+    api = api or GITHUB_API
+    headers = {"Authorization": f"token {token}", "Accept": "application/vnd.github+json"}
+    url_git = f"{api}/repos/{repo}/git"
+
+    def _checar(r, etapa):
+        if r.status_code not in (200, 201):
+            raise RuntimeError(f"{etapa} ({r.status_code}): {r.text}")
+        return r.json()
+
+    if base is None:
+        ref = _checar(cliente_http.get(f"{url_git}/ref/heads/{branch}", headers=headers), "ler ref")
+        commit_topo = ref["object"]["sha"]
+        commit = _checar(cliente_http.get(f"{url_git}/commits/{commit_topo}", headers=headers), "ler commit")
+        base = (commit_topo, commit["tree"]["sha"])
+
+    entradas = [
+        {"path": caminho, "mode": "100644", "type": "blob", "content": conteudo}
+        for caminho, conteudo in arquivos.items()
+    ]
+    arvore = _checar(
+        cliente_http.post(f"{url_git}/trees", headers=headers, json={"base_tree": base[1], "tree": entradas}),
+        "criar árvore",
+    )
+    novo_commit = _checar(
+        cliente_http.post(
+            f"{url_git}/commits", headers=headers,
+            json={"message": mensagem, "tree": arvore["sha"], "parents": [base[0]]},
+        ),
+        "criar commit",
+    )
+    # PATCH sem force: só avança se a branch ainda aponta para base (fast-forward)
+    r = cliente_http.requisitar(
+        "PATCH", f"{url_git}/refs/heads/{branch}", headers=headers, json={"sha": novo_commit["sha"]}
+    )
+    _checar(r, "atualizar ref")
+    return novo_commit["sha"], arvore["sha"]
+
+
+@dataclass
+class _Pendente:
+    token: str
+    repo: str
+    path: str
+    branch: str
+    df: pd.DataFrame
+    mensagem: str
+    primeiro_em: float
+    ultimo_em: float
+    tentativas: int = 0  # Envios que falharam
+    proxima_em: float = 0.0  # Não reenviar antes deste instante (backoff)
+
+
+class GravadorGitHub:
+    """Fila de salvamentos por arquivo, descarregada por uma thread com debounce."""
+
+    def __init__(self, debounce: float = DEBOUNCE_PADRAO, espera_maxima: float = ESPERA_MAXIMA_PADRAO,
+                 api: Optional[str] = None):
+        self.debounce = debounce
+        self.espera_maxima = espera_maxima
+        self.api = api or GITHUB_API
+        self._pendentes = {}  # (repo, branch, path) -> _Pendente
+        self._shas = {}  # (repo, branch, path) -> sha do blob no último PUT
+        self._erros = {}  # (repo, branch, path) -> mensagem do último erro
+        self._topos = {}  # (repo, branch) -> (sha do commit, sha da árvore) do último commit feito aqui
+        self._em_envio = 0  # Grupos retirados da fila e ainda não enviados
+        self._cond = threading.Condition()
+        # Serializa os envios: dois PUTs do mesmo arquivo não podem usar o mesmo sha
+        self._envio_lock = threading.Lock()
+        self._thread = None
+        atexit.register(self.descarregar)
+
+    def agendar(self, token: str, repo: str, path: str, dataframe: pd.DataFrame,
+                branch: str = "main", mensagem: str = "Atualização via app"):
+        """Agenda `dataframe` para ser gravado em `path`; substitui o que estava pendente para o arquivo."""
+        self.agendar_varios(token, repo, {path: dataframe}, branch, mensagem)
+
+    def agendar_varios(self, token: str, repo: str, dataframes: dict,
+                       branch: str = "main", mensagem: str = "Atualização via app"):
+        """Agenda vários arquivos (caminho -> DataFrame) de uma vez; eles serão gravados no mesmo commit."""
+        agora = time.monotonic()
+        with self._cond:
+            for path, dataframe in dataframes.items():
+                chave = (repo, branch, path)
+                anterior = self._pendentes.get(chave)
+                primeiro_em = anterior.primeiro_em if anterior else agora
+                # Cópia: a sessão pode alterar o DF in-place antes de o envio acontecer.
+                # Um arquivo em backoff continua esperando a nova tentativa.
+                self._pendentes[chave] = _Pendente(
+                    token, repo, path, branch, dataframe.copy(), mensagem, primeiro_em, agora,
+                    anterior.tentativas if anterior else 0, anterior.proxima_em if anterior else 0.0,
+                )
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="autosave-github", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def pendentes(self) -> int:
+        with self._cond:
+            return len(self._pendentes)
+
+    def consumir_erros(self) -> list:
+        """Retorna (e limpa) as mensagens de erro dos últimos envios."""
+        with self._cond:
+            erros = list(self._erros.values())
+            self._erros.clear()
+        return erros
+
+    def esperar(self, timeout: Optional[float] = None) -> bool:
+        """Espera a fila esvaziar (usado em testes). Retorna False se estourar o `timeout`."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pendentes and not self._em_envio, timeout)
+
+    def descarregar(self):
+        """Envia imediatamente tudo o que está pendente (usado no encerramento do processo)."""
+        with self._cond:
+            prontos = list(self._pendentes.values())
+            self._pendentes.clear()
+        for grupo in self._agrupar(prontos):
+            self._enviar(grupo)
+
+    # --- Thread de envio ---
+    def _separar_prontos(self, agora: float):
+        prontos, espera = [], None
+        for chave, pendente in list(self._pendentes.items()):
+            limite = min(pendente.ultimo_em + self.debounce, pendente.primeiro_em + self.espera_maxima)
+            limite = max(limite, pendente.proxima_em)
+            if agora >= limite:
+                prontos.append(self._pendentes.pop(chave))
+            else:
+                espera = limite - agora if espera is None else min(espera, limite - agora)
+        # Leva junto os demais arquivos pendentes do mesmo repositório/branch: vão no mesmo commit
+        repos = {(p.repo, p.branch) for p in prontos}
+        for chave in [c for c in self._pendentes if (c[0], c[1]) in repos]:
+            prontos.append(self._pendentes.pop(chave))
+        return prontos, espera
+
+    @staticmethod
+    def _agrupar(pendentes: list) -> list:
+        grupos = {}
+        for p in pendentes:
+            grupos.setdefault((p.repo, p.branch), []).append(p)
+        return list(grupos.values())
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                prontos, espera = self._separar_prontos(time.monotonic())
+                while not prontos:
+                    self._cond.wait(timeout=espera)
+                    prontos, espera = self._separar_prontos(time.monotonic())
+                grupos = self._agrupar(prontos)
+                self._em_envio += len(grupos)
+            for grupo in grupos:
+                try:
+                    self._enviar(grupo)
+                finally:
+                    with self._cond:
+                        self._em_envio -= 1
+                        self._cond.notify_all()
+
+    def _reagendar(self, grupo: list, erro: str):
+        """Devolve à fila os arquivos de um envio que falhou, com backoff, e registra o erro para a UI."""
+        agora = time.monotonic()
+        with self._cond:
+            for p in grupo:
+                chave = (p.repo, p.branch, p.path)
+                if chave in self._pendentes:
+                    continue  # Uma versão mais nova já foi agendada e substitui esta
+                p.tentativas += 1
+                p.proxima_em = agora + min(BACKOFF_BASE * (2 ** (p.tentativas - 1)), BACKOFF_MAXIMO)
+                self._pendentes[chave] = p
+            espera = min(p.proxima_em for p in grupo) - agora
+            self._erros[(grupo[0].repo, grupo[0].branch, grupo[0].path if len(grupo) == 1 else "lote")] = (
+                f"{erro} (nova tentativa em {max(espera, 0):.0f} s)"
+            )
+            self._cond.notify_all()
+
+    def _buscar_sha(self, url: str, headers: dict, branch: str) -> Optional[str]:
+        r = cliente_http.get(url, headers=headers, params={"ref": branch})
+        return r.json().get("sha") if r.status_code == 200 else None
+
+    def _enviar(self, grupo: list):
+        with self._envio_lock:
+            if len(grupo) == 1:
+                self._enviar_arquivo(grupo[0])
+            else:
+                self._enviar_lote(grupo)
+
+    def _enviar_arquivo(self, p: _Pendente):
+        """Um único arquivo: PUT na API de conteúdos (1 requisição com o sha em cache)."""
+        chave = (p.repo, p.branch, p.path)
+        url = f"{self.api}/repos/{p.repo}/contents/{p.path}"
+        headers = {"Authorization": f"token {p.token}"}
+        try:
+            conteudo_b64 = base64.b64encode(p.df.to_csv(index=False).encode()).decode()
+            sha = self._shas.get(chave)
+            if sha is None:
+                sha = self._buscar_sha(url, headers, p.branch)
+            for tentativa in range(2):
+                payload = {"message": p.mensagem, "content": conteudo_b64, "branch": p.branch}
+                if sha:
+                    payload["sha"] = sha
+                r = cliente_http.put(url, headers=headers, json=payload)
+                # 409/422: o arquivo mudou por fora do app e o sha guardado ficou velho
+                if r.status_code in (409, 422) and tentativa == 0:
+                    sha = self._buscar_sha(url, headers, p.branch)
+                    continue
+                break
+            if r.status_code in (200, 201):
+                resposta = r.json()
+                self._shas[chave] = resposta.get("content", {}).get("sha")
+                commit = resposta.get("commit") or {}
+                if commit.get("sha") and commit.get("tree", {}).get("sha"):
+                    self._topos[(p.repo, p.branch)] = (commit["sha"], commit["tree"]["sha"])
+                else:
+                    self._topos.pop((p.repo, p.branch), None)
+            else:
+                self._shas.pop(chave, None)
+                self._reagendar([p], f"❌ Erro ao salvar `{p.path}`: {r.text}")
+        except Exception as e:
+            self._shas.pop(chave, None)
+            self._reagendar([p], f"❌ Erro ao salvar `{p.path}`: {e}")
+
+    def _enviar_lote(self, grupo: list):
+        """Vários arquivos do mesmo repositório/branch: um único commit pela Git Data API."""
+        p0 = grupo[0]
+        chave_repo = (p0.repo, p0.branch)
+        arquivos = {p.path: p.df.to_csv(index=False) for p in grupo}
+        mensagens = list(dict.fromkeys(p.mensagem for p in grupo))
+        mensagem = mensagens[0] if len(mensagens) == 1 else "; ".join(mensagens)
+        try:
+            base = self._topos.get(chave_repo)
+            try:
+                topo = commit_multiplos_arquivos(p0.token, p0.repo, arquivos, p0.branch, mensagem,
+                                                 base=base, api=self.api)
+            except RuntimeError:
+                if base is None:
+                    raise
+                # A branch andou desde o último commit feito aqui: refaz a partir do topo atual
+                topo = commit_multiplos_arquivos(p0.token, p0.repo, arquivos, p0.branch, mensagem, api=self.api)
+            self._topos[chave_repo] = topo
+            for caminho, conteudo in arquivos.items():
+                self._shas[(p0.repo, p0.branch, caminho)] = _sha_blob(conteudo.encode())
+        except Exception as e:
+            self._topos.pop(chave_repo, None)
+            for p in grupo:
+                self._shas.pop((p.repo, p.branch, p.path), None)
+            self._reagendar(grupo, f"❌ Erro ao salvar {', '.join(f'`{c}`' for c in arquivos)}: {e}")
+
+
+_gravador = None
+_gravador_lock = threading.Lock()
+
+
+def obter_gravador() -> GravadorGitHub:
+    """Instância única do gravador, compartilhada por todas as sessões do processo."""
+    global _gravador
+    with _gravador_lock:
+        if _gravador is None:
+            _gravador = GravadorGitHub()
+        return _gravador
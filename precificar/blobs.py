@@ -0,0 +1,162 @@
+"""
+Armazém de imagens endereçado por conteúdo.
+
+As fotos enviadas pelo uploader são gravadas uma única vez, identificadas pelo
+SHA-256 do conteúdo (envios repetidos da mesma foto não ocupam espaço de novo),
+e o DataFrame/CSV guarda só a referência ("sha256:<hex>.<ext>"). As imagens são
+reduzidas antes de gravar. Quando os dados do app vão para o GitHub, elas também são
+publicadas no repositório (pasta `imagens/`), então a referência continua válida em
+outro servidor; com um backend só local, ficam no disco, junto com os dados.
+"""
+import base64
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from precificar import cliente_http
+from precificar.autosave import GITHUB_API
+from precificar.miniaturas import reduzir_imagem
+
+DIRETORIO_BLOBS = os.environ.get(
+    "PRECIFICAR_BLOBS_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "blobs"),
+)
+LARGURA_MAXIMA_PADRAO = 1600  # px; None desliga a redução
+PASTA_REMOTA = "imagens"
+
+_PADRAO_REF = re.compile(r"^sha256:([0-9a-f]{64})\.([a-z0-9]{1,5})$")
+
+
+def eh_referencia(valor) -> bool:
+    """True se `valor` é uma referência do armazém (e não bytes, URL ou vazio)."""
+    return isinstance(valor, str) and _PADRAO_REF.match(valor) is not None
+
+
+def _partes(ref: str) -> tuple:
+    m = _PADRAO_REF.match(ref or "")
+    if m is None:
+        raise ValueError(f"Referência de imagem inválida: {ref!r}")
+    return m.group(1), m.group(2)
+
+
+class ArmazemImagens:
+    """Blobs em disco (um arquivo por hash), com cópia no GitHub para sobreviver a reinícios."""
+
+    def __init__(self, diretorio: str = DIRETORIO_BLOBS):
+        self.diretorio = diretorio
+        self._lock = threading.Lock()
+        self._publicados = set()  # (repo, branch, ref) já enviados por este processo
+        self._erros = []
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="blobs-github")
+
+    def _caminho(self, ref: str) -> str:
+        hexa, ext = _partes(ref)
+        return os.path.join(self.diretorio, hexa[:2], f"{hexa}.{ext}")
+
+    def _gravar(self, ref: str, conteudo: bytes):
+        caminho = self._caminho(ref)
+        if os.path.exists(caminho):
+            return  # Mesmo hash = mesmo conteúdo
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        tmp = f"{caminho}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(conteudo)
+        os.replace(tmp, caminho)
+
+    def guardar(self, conteudo: bytes, largura_maxima: Optional[int] = LARGURA_MAXIMA_PADRAO) -> str:
+        """
+        Grava a imagem (reduzida para caber em `largura_maxima`, se informado) e retorna a referência.
+        Conteúdo que o Pillow não consegue abrir é guardado como veio.
+        """
+        ext = "bin"
+        if largura_maxima:
+            try:
+                conteudo, ext = reduzir_imagem(conteudo, largura_maxima)
+            except Exception:
+                pass
+        ref = f"sha256:{hashlib.sha256(conteudo).hexdigest()}.{ext}"
+        self._gravar(ref, conteudo)
+        return ref
+
+    def ler(self, ref: str, url_base: Optional[str] = None) -> Optional[bytes]:
+        """
+        Bytes da imagem `ref`. Se não estiver no disco (ex.: servidor reiniciado) e `url_base` for
+        informado, baixa `url_base/imagens/<hash>.<ext>`, confere o hash e guarda localmente.
+        """
+        if not eh_referencia(ref):
+            return None
+        caminho = self._caminho(ref)
+        try:
+            with open(caminho, "rb") as f:
+                return f.read()
+        except OSError:
+            pass
+        if not url_base:
+            return None
+        hexa, ext = _partes(ref)
+        try:
+            resposta = cliente_http.get(f"{url_base.rstrip('/')}/{PASTA_REMOTA}/{hexa}.{ext}")
+            resposta.raise_for_status()
+        except Exception:
+            return None
+        conteudo = resposta.content
+        if hashlib.sha256(conteudo).hexdigest() != hexa:
+            return None
+        try:
+            self._gravar(ref, conteudo)
+        except OSError:
+            pass
+        return conteudo
+
+    # --- Cópia no GitHub ---
+    def publicar(self, ref: str, token: str, repo: str, branch: str = "main"):
+        """
+        Envia o blob para `imagens/` no repositório, em segundo plano. Como o nome é o hash,
+        o arquivo nunca é sobrescrito: se já existe, não há nada a fazer.
+        """
+        chave = (repo, branch, ref)
+        with self._lock:
+            if chave in self._publicados:
+                return
+            self._publicados.add(chave)
+        self._executor.submit(self._publicar, ref, token, repo, branch)
+
+    def _publicar(self, ref: str, token: str, repo: str, branch: str):
+        hexa, ext = _partes(ref)
+        url = f"{GITHUB_API}/repos/{repo}/contents/{PASTA_REMOTA}/{hexa}.{ext}"
+        headers = {"Authorization": f"token {token}"}
+        try:
+            with open(self._caminho(ref), "rb") as f:
+                conteudo_b64 = base64.b64encode(f.read()).decode()
+            r = cliente_http.put(url, headers=headers, json={
+                "message": f"🖼️ Imagem de produto {hexa[:12]}", "content": conteudo_b64, "branch": branch,
+            })
+            # 422 sem sha: o arquivo (o mesmo conteúdo) já está no repositório
+            if r.status_code not in (200, 201, 422):
+                raise RuntimeError(f"{r.status_code}: {r.text}")
+        except Exception as e:
+            with self._lock:
+                self._publicados.discard((repo, branch, ref))
+                self._erros.append(f"❌ Erro ao enviar a imagem `{hexa[:12]}` para o GitHub: {e}")
+
+    def consumir_erros(self) -> list:
+        """Retorna (e limpa) as mensagens de erro das publicações."""
+        with self._lock:
+            erros, self._erros = self._erros, []
+        return erros
+
+
+_armazem = None
+_armazem_lock = threading.Lock()
+
+
+def obter_armazem() -> ArmazemImagens:
+    """Instância única do armazém, compartilhada por todas as sessões do processo."""
+    global _armazem
+    with _armazem_lock:
+        if _armazem is None:
+            _armazem = ArmazemImagens()
+        return _armazem
@@ -0,0 +1,161 @@
+"""
+Carregamento de CSVs do GitHub com cache.
+
+Mantém, para cada URL, o DataFrame já interpretado num cache do processo e uma
+cópia do arquivo em disco. Dentro do TTL a leitura é só memória; depois dele o
+arquivo é revalidado com If-None-Match / If-Modified-Since e um 304 reaproveita
+o que já está parseado.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from io import StringIO
+from typing import Optional
+
+import pandas as pd
+
+from precificar import cliente_http
+
+DIRETORIO_CACHE = os.environ.get(
+    "PRECIFICAR_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "csv"),
+)
+TTL_PADRAO = float(os.environ.get("PRECIFICAR_CSV_TTL", "300"))  # segundos
+
+
+@dataclass
+class _EntradaCache:
+    df: pd.DataFrame
+    etag: Optional[str]
+    last_modified: Optional[str]
+    verificado_em: float
+
+
+class CarregadorCSV:
+    """Cache de CSVs remotos em memória + espelho em disco, com revalidação condicional."""
+
+    def __init__(self, diretorio: str = DIRETORIO_CACHE, ttl: float = TTL_PADRAO):
+        self.diretorio = diretorio
+        self.ttl = ttl
+        self._entradas = {}
+        self._lock = threading.Lock()
+        # Um lock por URL evita que várias sessões baixem o mesmo arquivo ao mesmo tempo
+        self._locks_url = {}
+
+    # --- Espelho em disco ---
+    def _caminhos(self, url: str):
+        chave = hashlib.sha256(url.encode()).hexdigest()[:32]
+        base = os.path.join(self.diretorio, chave)
+        return base + ".csv", base + ".json"
+
+    def _ler_espelho(self, url: str) -> Optional[_EntradaCache]:
+        caminho_csv, caminho_meta = self._caminhos(url)
+        try:
+            with open(caminho_meta, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            df = pd.read_csv(caminho_csv)
+        except (OSError, ValueError, pd.errors.ParserError):
+            return None
+        # Força revalidação: não sabemos há quanto tempo o espelho foi gravado por outro processo
+        return _EntradaCache(df, meta.get("etag"), meta.get("last_modified"), 0.0)
+
+    def _gravar_espelho(self, url: str, texto: str, etag, last_modified):
+        caminho_csv, caminho_meta = self._caminhos(url)
+        try:
+            os.makedirs(self.diretorio, exist_ok=True)
+            # Grava em arquivo temporário e troca atomicamente para não deixar espelho pela metade
+            for caminho, conteudo in (
+                (caminho_csv, texto),
+                (caminho_meta, json.dumps({"url": url, "etag": etag, "last_modified": last_modified})),
+            ):
+                tmp = caminho + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(conteudo)
+                os.replace(tmp, caminho)
+        except OSError:
+            pass  # O espelho é só otimização; falha de disco não pode quebrar o carregamento
+
+    # --- API pública ---
+    def carregar(self, url: str, revalidar: bool = False, ttl: Optional[float] = None) -> pd.DataFrame:
+        """
+        Retorna uma cópia do DataFrame do CSV em `url`.
+
+        `revalidar=True` ignora o TTL e consulta o servidor (ainda de forma condicional).
+        Em caso de erro de rede devolve a última versão conhecida, ou um DataFrame vazio.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            lock_url = self._locks_url.setdefault(url, threading.Lock())
+
+        with lock_url:
+            entrada = self._entradas.get(url)
+            if entrada is None:
+                entrada = self._ler_espelho(url)
+
+            if entrada is not None and not revalidar and time.time() - entrada.verificado_em < ttl:
+                return entrada.df.copy()
+
+            headers = {}
+            if entrada is not None:
+                if entrada.etag:
+                    headers["If-None-Match"] = entrada.etag
+                if entrada.last_modified:
+                    headers["If-Modified-Since"] = entrada.last_modified
+
+            try:
+                response = cliente_http.get(url, headers=headers)
+                if response.status_code == 304 and entrada is not None:
+                    entrada.verificado_em = time.time()
+                else:
+                    response.raise_for_status()
+                    texto = response.text
+                    etag = response.headers.get("ETag")
+                    last_modified = response.headers.get("Last-Modified")
+                    entrada = _EntradaCache(pd.read_csv(StringIO(texto)), etag, last_modified, time.time())
+                    self._gravar_espelho(url, texto, etag, last_modified)
+            except Exception:
+                if entrada is None:
+                    return pd.DataFrame()
+                # Mantém a versão antiga (memória ou espelho) até a próxima tentativa
+
+            self._entradas[url] = entrada
+            return entrada.df.copy()
+
+    def atualizar(self, url: str, df: pd.DataFrame):
+        """
+        Publica no cache uma versão que o próprio app acabou de salvar, para que novas sessões
+        já a vejam sem esperar o CDN do raw.githubusercontent. Os validadores antigos são mantidos:
+        quando o arquivo remoto mudar, a revalidação traz a versão nova.
+        """
+        with self._lock:
+            anterior = self._entradas.get(url)
+            self._entradas[url] = _EntradaCache(
+                df.copy(),
+                anterior.etag if anterior else None,
+                anterior.last_modified if anterior else None,
+                time.time(),
+            )
+
+    def invalidar(self, url: Optional[str] = None):
+        """Descarta o cache em memória de `url` (ou de todas as URLs)."""
+        with self._lock:
+            if url is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(url, None)
+
+
+_carregador = None
+_carregador_lock = threading.Lock()
+
+
+def obter_carregador() -> CarregadorCSV:
+    """Instância única do carregador, compartilhada por todas as sessões do processo."""
+    global _carregador
+    with _carregador_lock:
+        if _carregador is None:
+            _carregador = CarregadorCSV()
+        return _carregador
@@ -0,0 +1,283 @@
+"""
+Catálogo compartilhado entre as sessões do Streamlit.
+
+Cada conjunto de dados (produtos da precificação, insumos, produtos, campos e
+composição da papelaria) é carregado uma única vez por processo e guardado numa
+versão numerada. As sessões recebem cópias rasas: com o copy-on-write do pandas
+(padrão no pandas 3; no pandas 2 é ligado ao importar este módulo), uma
+coluna só é duplicada quando a sessão a altera, então a memória acompanha o
+tamanho do catálogo e não o número de sessões.
+
+Ao salvar, a sessão publica o seu DataFrame informando a versão em que se baseou.
+Se outra sessão publicou antes, as alterações são mescladas por linha (pela
+coluna-chave do conjunto) sobre a versão atual, em vez de uma sobrescrever a
+outra. Com as `Alteracoes` do rastreador da sessão, tanto a verificação de que nada
+mudou quanto a mesclagem olham só as linhas marcadas. As sessões sem alterações
+pendentes adotam a versão mais nova no rerun.
+
+`pre_carregar` busca todos os conjuntos em paralelo quando o processo sobe; uma
+sessão que pede um conjunto ainda em download espera só por ele.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from precificar.armazenamento import chaves_linhas
+from precificar.precificacao import atribuir_linhas
+from precificar.rastreamento import Alteracoes, hash_linhas
+
+# As cópias rasas entregues às sessões só ficam isoladas com copy-on-write (opcional no pandas 2)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+# Coluna(s) que identificam a linha de cada conjunto na mesclagem (os demais usam a primeira coluna)
+COLUNAS_CHAVE = {
+    "produtos_manuais": "Produto",
+    "produtos": "Produto",
+    "insumos": "Nome",
+    "campos": "Campo",
+    "composicao": ("Produto", "Insumo"),
+}
+# Versões antigas guardadas por conjunto, usadas como base da mesclagem
+VERSOES_NO_HISTORICO = 8
+
+
+@dataclass
+class _Conjunto:
+    versao: int
+    df: pd.DataFrame
+    historico: OrderedDict = field(default_factory=OrderedDict)  # versão -> DataFrame
+    marcas: dict = field(default_factory=dict)  # versão -> Alteracoes.versao de quem a publicou
+
+
+def _chaves_com_valores(df: pd.DataFrame, colunas_chave: tuple, valores: pd.Series) -> dict:
+    """
+    {posição: chave de chaves_linhas} das linhas de `df` cuja primeira coluna-chave tem um dos
+    `valores`. Todas as linhas com o mesmo valor entram, então o sufixo de ocorrência sai igual
+    ao calculado sobre o DF inteiro, sem montar a chave de cada linha.
+    """
+    coluna = df[colunas_chave[0]]
+    mascara = coluna.isin(valores.dropna()).to_numpy()
+    if valores.isna().any():
+        mascara |= coluna.isna().to_numpy()
+    posicoes = np.flatnonzero(mascara)
+    chaves, _ = chaves_linhas(df.iloc[posicoes], colunas_chave)
+    return dict(zip(posicoes.tolist(), chaves))
+
+
+def _diferencas_marcadas(base: Optional[pd.DataFrame], atual: pd.DataFrame, meu: pd.DataFrame, colunas_chave,
+                         alteracoes: Optional[Alteracoes]) -> Optional[tuple]:
+    """
+    (linhas alteradas de `meu`, chaves de `meu`, chaves excluídas, posições das chaves em `atual`)
+    a partir das posições do rastreador (`alteracoes.origem` relativa a `base`): só as linhas
+    marcadas são hasheadas e só as chaves com os valores envolvidos são montadas. None quando as
+    posições não servem (sem base, colunas novas, coluna-chave ausente): aí _mesclar compara tudo.
+    """
+    colunas_chave = (colunas_chave,) if isinstance(colunas_chave, str) else tuple(colunas_chave or ())
+    if base is None or alteracoes is None or alteracoes.origem is None or not colunas_chave:
+        return None
+    origem = alteracoes.origem
+    if (
+        len(origem) != len(meu) or (origem >= len(base)).any()
+        or any(c not in base.columns or c not in atual.columns for c in meu.columns)
+        or any(c not in meu.columns for c in colunas_chave)
+    ):
+        return None
+
+    marcadas = np.array(sorted({p for p in alteracoes.editadas if p < len(meu)}), dtype=np.int64)
+    marcadas = marcadas[origem[marcadas] >= 0]
+    comuns = list(meu.columns)
+    diferentes = hash_linhas(meu.iloc[marcadas][comuns]) != hash_linhas(base.iloc[origem[marcadas]][comuns])
+    editadas = marcadas[diferentes]
+    alteradas = sorted(editadas.tolist() + np.flatnonzero(origem < 0).tolist())
+    excluidas = np.setdiff1d(np.arange(len(base)), origem[origem >= 0])
+
+    primeira = colunas_chave[0]
+    chaves_meu = _chaves_com_valores(meu, colunas_chave, meu[primeira].iloc[alteradas])
+    # Linhas excluídas e as editadas que mudaram de chave (renomeadas) saem da versão atual
+    na_base = np.concatenate([excluidas, origem[editadas]])
+    chaves_base = _chaves_com_valores(base, colunas_chave, base[primeira].iloc[na_base])
+    renomeadas = {chaves_base[int(origem[i])] for i in editadas.tolist()} - {chaves_meu[i] for i in alteradas}
+    chaves_excluidas = {chaves_base[p] for p in excluidas.tolist()} | renomeadas
+
+    valores = pd.concat([meu[primeira].iloc[alteradas], base[primeira].iloc[na_base]])
+    posicao_atual = {c: p for p, c in _chaves_com_valores(atual, colunas_chave, valores).items()}
+    return alteradas, chaves_meu, chaves_excluidas, posicao_atual
+
+
+def _mesclar(base: Optional[pd.DataFrame], atual: pd.DataFrame, meu: pd.DataFrame, colunas_chave,
+             alteracoes: Optional[Alteracoes] = None) -> pd.DataFrame:
+    """
+    Aplica sobre `atual` as alterações de `meu` em relação a `base` (linhas incluídas, editadas
+    e excluídas). Na mesma linha alterada pelas duas sessões, vale a de `meu`. Sem `base`
+    (versão antiga demais), nenhuma linha é excluída: só as de `meu` são gravadas por cima.
+    Com `alteracoes` relativas a `base`, o custo acompanha as linhas marcadas e não o catálogo.
+    """
+    marcadas = _diferencas_marcadas(base, atual, meu, colunas_chave, alteracoes)
+    if marcadas is not None:
+        alteradas, chaves_meu, excluidas, posicao_atual = marcadas
+    else:
+        chaves_meu, _ = chaves_linhas(meu, colunas_chave)
+        chaves_atual, _ = chaves_linhas(atual, colunas_chave)
+        if base is not None:
+            # Compara só as colunas que existem nas duas versões (uma coluna nova não torna todas as linhas "editadas")
+            comuns = [c for c in meu.columns if c in base.columns]
+            chaves_base, _ = chaves_linhas(base, colunas_chave)
+            hash_base = dict(zip(chaves_base, hash_linhas(base[comuns])))
+            hashes_meu = hash_linhas(meu[comuns])
+            excluidas = set(chaves_base) - set(chaves_meu)
+        else:
+            hash_base, hashes_meu, excluidas = {}, hash_linhas(meu), set()
+        alteradas = [i for i, (c, h) in enumerate(zip(chaves_meu, hashes_meu)) if hash_base.get(c) != h]
+        posicao_atual = {c: i for i, c in enumerate(chaves_atual)}
+
+    colunas = list(meu.columns) + [c for c in atual.columns if c not in meu.columns]
+    colunas_novas = [c for c in meu.columns if c not in atual.columns]
+    resultado = atual.reindex(columns=colunas)
+    for linhas, cols in ((alteradas, list(meu.columns)), (range(len(meu)), colunas_novas)):
+        # Linhas alteradas: todas as colunas; demais linhas: só as colunas que a sessão criou
+        if not cols:
+            continue
+        pares = [(posicao_atual[chaves_meu[i]], i) for i in linhas if chaves_meu[i] in posicao_atual]
+        if pares:
+            destino = np.array([d for d, _ in pares])
+            origem = [o for _, o in pares]
+            for col in cols:
+                atribuir_linhas(resultado, col, destino, meu[col].to_numpy()[origem])
+    if excluidas:
+        mantidas = np.ones(len(atual), dtype=bool)
+        mantidas[[posicao_atual[c] for c in excluidas if c in posicao_atual]] = False
+        resultado = resultado[mantidas]
+    novas = [i for i in alteradas if chaves_meu[i] not in posicao_atual]
+    if novas:
+        resultado = pd.concat([resultado, meu.iloc[novas].reindex(columns=colunas)])
+    return resultado.reset_index(drop=True)
+
+
+class CatalogoCompartilhado:
+    """Versões dos DataFrames do app compartilhadas por todas as sessões do processo."""
+
+    def __init__(self, colunas_chave: Optional[dict] = None, versoes_no_historico: int = VERSOES_NO_HISTORICO):
+        self.colunas_chave = COLUNAS_CHAVE if colunas_chave is None else colunas_chave
+        self.versoes_no_historico = versoes_no_historico
+        self._lock = threading.Lock()
+        self._locks_nome = {}
+        self._conjuntos = {}
+        self._pre_carregamentos = {}  # nome -> Future do pre_carregar
+
+    def _chave(self, nome: str, df: pd.DataFrame):
+        return self.colunas_chave.get(nome, df.columns[0] if len(df.columns) else None)
+
+    def _gravar(self, nome: str, df: pd.DataFrame, marca: Optional[tuple] = None) -> int:
+        """
+        Nova versão de `nome` (com o lock tomado). `marca` é a Alteracoes.versao do rastreador da
+        sessão que a publicou: as posições das próximas Alteracoes dessa sessão são relativas a ela.
+        """
+        conjunto = self._conjuntos.get(nome)
+        versao = conjunto.versao + 1 if conjunto else 1
+        df = df.copy(deep=False)  # A sessão continua alterando o próprio DF; o copy-on-write isola os dois
+        if conjunto is None:
+            conjunto = self._conjuntos[nome] = _Conjunto(versao, df)
+        conjunto.versao, conjunto.df = versao, df
+        conjunto.historico[versao] = df
+        conjunto.marcas[versao] = marca
+        while len(conjunto.historico) > self.versoes_no_historico:
+            conjunto.marcas.pop(conjunto.historico.popitem(last=False)[0], None)
+        return versao
+
+    def versao(self, nome: str) -> Optional[int]:
+        """Versão atual de `nome`, ou None se ainda não foi carregado."""
+        with self._lock:
+            conjunto = self._conjuntos.get(nome)
+            return conjunto.versao if conjunto else None
+
+    def obter(self, nome: str, carregar: Optional[Callable[[], pd.DataFrame]] = None) -> tuple:
+        """
+        (versão, cópia rasa do DF) de `nome`. Na primeira vez, `carregar()` é chamado uma única
+        vez para todo o processo (as outras sessões esperam por ele). Um resultado vazio não é
+        guardado (ex.: falha de rede): a próxima sessão tenta de novo. Versão 0 = não guardado.
+        """
+        with self._lock:
+            conjunto = self._conjuntos.get(nome)
+            if conjunto is not None:
+                return conjunto.versao, conjunto.df.copy(deep=False)
+            pendente = self._pre_carregamentos.get(nome)
+        if pendente is not None:
+            wait([pendente])  # Se o pré-carregamento falhou ou veio vazio, `carregar` tenta de novo
+        return self._carregar_uma_vez(nome, carregar)
+
+    def _carregar_uma_vez(self, nome: str, carregar: Optional[Callable[[], pd.DataFrame]]) -> tuple:
+        with self._lock:
+            conjunto = self._conjuntos.get(nome)
+            if conjunto is not None:
+                return conjunto.versao, conjunto.df.copy(deep=False)
+            lock_nome = self._locks_nome.setdefault(nome, threading.Lock())
+        if carregar is None:
+            return 0, pd.DataFrame()
+
+        with lock_nome:
+            with self._lock:
+                conjunto = self._conjuntos.get(nome)
+                if conjunto is not None:  # Outra sessão carregou enquanto esperávamos
+                    return conjunto.versao, conjunto.df.copy(deep=False)
+            df = carregar()
+            if df.empty:
+                return 0, df
+            with self._lock:
+                return self._gravar(nome, df), df.copy(deep=False)
+
+    def pre_carregar(self, carregadores: dict) -> dict:
+        """
+        Carrega em paralelo os conjuntos `carregadores` (nome -> função de carga) que ainda não
+        estão no catálogo, sem bloquear. Retorna nome -> Future; `obter` espera o do nome pedido.
+        """
+        executor = ThreadPoolExecutor(max_workers=max(len(carregadores), 1), thread_name_prefix="catalogo")
+        with self._lock:
+            for nome, carregar in carregadores.items():
+                if nome not in self._conjuntos and nome not in self._pre_carregamentos:
+                    self._pre_carregamentos[nome] = executor.submit(self._carregar_uma_vez, nome, carregar)
+            futuros = dict(self._pre_carregamentos)
+        executor.shutdown(wait=False)
+        return futuros
+
+    def substituir(self, nome: str, df: pd.DataFrame) -> int:
+        """Publica `df` como nova versão sem mesclar (ex.: recarga do arquivo persistido)."""
+        with self._lock:
+            return self._gravar(nome, df)
+
+    def publicar(self, nome: str, df: pd.DataFrame, versao_base: Optional[int],
+                 alteracoes: Optional[Alteracoes] = None) -> tuple:
+        """
+        Publica o DF alterado por uma sessão que partiu da `versao_base`.
+        Retorna (nova versão, DF publicado, mesclado): com `mesclado=True` o DF publicado inclui
+        alterações de outras sessões e deve substituir o da sessão.
+
+        `alteracoes` (do rastreador do DF, desde o último salvamento) evita hashear o DF inteiro:
+        diz se algo mudou e, numa mesclagem a partir de uma versão que a própria sessão publicou,
+        quais linhas olhar.
+        """
+        marca = None if alteracoes is None else alteracoes.versao
+        with self._lock:
+            conjunto = self._conjuntos.get(nome)
+            if conjunto is None:
+                return self._gravar(nome, df, marca), df, False
+            if versao_base == conjunto.versao:
+                atual = conjunto.df
+                if tuple(df.columns) == tuple(atual.columns) and len(df) == len(atual) and (
+                    not alteracoes.editadas and np.array_equal(alteracoes.origem, np.arange(len(df)))
+                    if alteracoes is not None and alteracoes.origem is not None
+                    else np.array_equal(hash_linhas(df), hash_linhas(atual))
+                ):
+                    return conjunto.versao, df, False  # Nada mudou nos dados (ex.: só o frete)
+                return self._gravar(nome, df, marca), df, False
+            base = conjunto.historico.get(versao_base)
+            # As posições do rastreador só valem se a base é a versão que esta sessão publicou por último
+            if alteracoes is not None and conjunto.marcas.get(versao_base) != alteracoes.base:
+                alteracoes = None
+            mesclado = _mesclar(base, conjunto.df, df, self._chave(nome, df), alteracoes)
+            return self._gravar(nome, mesclado), mesclado.copy(deep=False), True
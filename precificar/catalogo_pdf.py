@@ -0,0 +1,162 @@
+"""
+Catálogo de produtos em PDF para clientes (foto, nome, cor, marca e preços), com reportlab.
+
+As fotos vêm do cache de miniaturas (baixadas e reduzidas em paralelo, uma vez
+por URL). Enquanto uma página é desenhada, as fotos da página seguinte já estão
+sendo baixadas; cada página é finalizada (showPage) assim que fica pronta e só
+as fotos dela ficam em memória. `gerar_catalogo_pdf` também conta as fotos que
+não puderam ser obtidas, para o PDF com "Sem foto" no lugar delas não ir para o
+cache de relatórios.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Optional
+
+import pandas as pd
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from precificar.blobs import eh_referencia, obter_armazem
+from precificar.formatacao import formatar_brl_serie
+from precificar.miniaturas import LARGURA_CATALOGO, obter_miniaturas
+
+# Colunas do DF usadas pelo catálogo (e portanto na chave do cache de relatórios)
+COLUNAS_CATALOGO = ["Produto", "Cor", "Marca", "Preço à Vista", "Preço no Cartão", "Imagem_URL", "Imagem"]
+COLUNAS_GRADE = 3
+LINHAS_GRADE = 4
+MARGEM = 12 * mm
+TOPO = 22 * mm  # espaço do título
+RODAPE = 12 * mm
+DOWNLOADS_PARALELOS = 8
+
+
+def _texto_pdf(serie: pd.Series) -> list:
+    """As fontes padrão do PDF usam WinAnsi (cp1252): caracteres fora dele viram '?'."""
+    return serie.fillna("").astype(str).map(lambda t: t.encode("cp1252", "replace").decode("cp1252")).tolist()
+
+
+def _cortar(c: canvas.Canvas, texto: str, fonte: str, tamanho: float, largura: float) -> str:
+    """Corta o texto com reticências para caber em `largura`."""
+    if c.stringWidth(texto, fonte, tamanho) <= largura:
+        return texto
+    while texto and c.stringWidth(texto + "...", fonte, tamanho) > largura:
+        texto = texto[:-1]
+    return texto + "..."
+
+
+def _tem_foto(linha: dict) -> bool:
+    """O produto aponta para uma foto (upload no armazém ou URL)."""
+    url = linha.get("Imagem_URL")
+    return eh_referencia(linha.get("Imagem")) or (isinstance(url, str) and url.startswith("http"))
+
+
+def _foto(linha: dict, url_base_imagens: Optional[str]) -> Optional[bytes]:
+    """Miniatura da foto do produto: armazém de imagens (upload) ou Imagem_URL."""
+    miniaturas = obter_miniaturas()
+    ref = linha.get("Imagem")
+    if eh_referencia(ref):
+        original = obter_armazem().ler(ref, url_base_imagens)
+        if original is not None:
+            return miniaturas.obter_de_bytes(original, LARGURA_CATALOGO)
+    url = linha.get("Imagem_URL")
+    if isinstance(url, str) and url.startswith("http"):
+        return miniaturas.obter(url, LARGURA_CATALOGO)
+    return None
+
+
+def gerar_catalogo_pdf(df: pd.DataFrame, url_base_imagens: Optional[str] = None,
+                       titulo: str = "Catálogo de Produtos") -> tuple:
+    """
+    Gera o catálogo em grade (3 x 4 produtos por página A4). Retorna (bytes do PDF, quantidade
+    de produtos com foto que saíram como "Sem foto" porque a foto não pôde ser obtida).
+    """
+    saida = BytesIO()
+    c = canvas.Canvas(saida, pagesize=A4, pageCompression=1)
+    c.setTitle(titulo)
+    largura_pag, altura_pag = A4
+    por_pagina = COLUNAS_GRADE * LINHAS_GRADE
+    largura_celula = (largura_pag - 2 * MARGEM) / COLUNAS_GRADE
+    altura_celula = (altura_pag - TOPO - RODAPE) / LINHAS_GRADE
+    lado_foto = min(largura_celula - 6 * mm, altura_celula - 24 * mm)
+
+    n = len(df)
+    nomes = _texto_pdf(df["Produto"]) if "Produto" in df.columns else [""] * n
+    cores = _texto_pdf(df["Cor"]) if "Cor" in df.columns else [""] * n
+    marcas = _texto_pdf(df["Marca"]) if "Marca" in df.columns else [""] * n
+    vazio = pd.Series([0.0] * n, index=df.index)
+    precos_vista = formatar_brl_serie(df["Preço à Vista"] if "Preço à Vista" in df.columns else vazio).tolist()
+    precos_cartao = formatar_brl_serie(df["Preço no Cartão"] if "Preço no Cartão" in df.columns else vazio).tolist()
+    colunas_foto = [col for col in ("Imagem", "Imagem_URL") if col in df.columns]
+    linhas_foto = df[colunas_foto].to_dict("records") if colunas_foto else [{}] * n
+
+    total_paginas = max(1, -(-n // por_pagina))
+    titulo_pdf = titulo.encode("cp1252", "replace").decode("cp1252")
+    fotos_faltando = 0
+
+    with ThreadPoolExecutor(max_workers=DOWNLOADS_PARALELOS) as executor:
+        def baixar_pagina(pagina):
+            inicio = pagina * por_pagina
+            return [executor.submit(_foto, linha, url_base_imagens) for linha in linhas_foto[inicio:inicio + por_pagina]]
+
+        proxima = baixar_pagina(0) if n else []
+        for pagina in range(total_paginas):
+            atuais = proxima
+            # Já pede as fotos da página seguinte enquanto esta é desenhada
+            proxima = baixar_pagina(pagina + 1) if pagina + 1 < total_paginas else []
+
+            c.setFont("Helvetica-Bold", 16)
+            c.drawCentredString(largura_pag / 2, altura_pag - 14 * mm, titulo_pdf)
+            c.setFont("Helvetica", 8)
+            c.drawCentredString(largura_pag / 2, 7 * mm, f"Página {pagina + 1}/{total_paginas}")
+            if not n:
+                c.setFont("Helvetica", 11)
+                c.drawCentredString(largura_pag / 2, altura_pag / 2, "Nenhum produto cadastrado.")
+
+            for k, futuro in enumerate(atuais):
+                i = pagina * por_pagina + k
+                col, lin = k % COLUNAS_GRADE, k // COLUNAS_GRADE
+                x = MARGEM + col * largura_celula
+                y_topo = altura_pag - TOPO - lin * altura_celula
+                centro = x + largura_celula / 2
+                largura_texto = largura_celula - 4 * mm
+
+                c.setStrokeColorRGB(0.85, 0.85, 0.85)
+                c.roundRect(x + 1 * mm, y_topo - altura_celula + 1 * mm, largura_celula - 2 * mm,
+                            altura_celula - 2 * mm, 2 * mm)
+
+                foto = futuro.result()
+                y_foto = y_topo - 3 * mm - lado_foto
+                if foto:
+                    try:
+                        c.drawImage(ImageReader(BytesIO(foto)), centro - lado_foto / 2, y_foto, lado_foto, lado_foto,
+                                    preserveAspectRatio=True, anchor="c", mask="auto")
+                    except Exception:
+                        foto = None
+                if not foto:
+                    fotos_faltando += _tem_foto(linhas_foto[i])
+                    c.setFont("Helvetica", 9)
+                    c.setFillColorRGB(0.6, 0.6, 0.6)
+                    c.drawCentredString(centro, y_foto + lado_foto / 2, "Sem foto")
+
+                c.setFillColorRGB(0, 0, 0)
+                y = y_foto - 5 * mm
+                c.setFont("Helvetica-Bold", 10)
+                c.drawCentredString(centro, y, _cortar(c, nomes[i], "Helvetica-Bold", 10, largura_texto))
+                detalhes = " | ".join(t for t in (cores[i], marcas[i]) if t.strip())
+                if detalhes:
+                    y -= 4 * mm
+                    c.setFont("Helvetica", 8)
+                    c.drawCentredString(centro, y, _cortar(c, detalhes, "Helvetica", 8, largura_texto))
+                y -= 5 * mm
+                c.setFont("Helvetica-Bold", 10)
+                c.drawCentredString(centro, y, f"À vista: {precos_vista[i]}")
+                y -= 4 * mm
+                c.setFont("Helvetica", 8)
+                c.drawCentredString(centro, y, f"Cartão: {precos_cartao[i]}")
+
+            c.showPage()
+
+    c.save()
+    return saida.getvalue(), fotos_faltando
@@ -0,0 +1,132 @@
+"""
+Cliente HTTP compartilhado (GitHub e Telegram).
+
+Uma única `requests.Session` por processo mantém as conexões keep-alive em pool,
+então um salvamento (GET + PUT na API do GitHub) reaproveita o mesmo handshake
+TLS. Todas as chamadas têm timeout, repetição com backoff exponencial em 429/5xx
+e um limite de requisições simultâneas por host.
+"""
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TIMEOUT_PADRAO = (5, 30)  # (conexão, leitura) em segundos
+TENTATIVAS_PADRAO = 3
+BACKOFF_BASE = 0.5  # segundos; dobra a cada tentativa
+BACKOFF_MAXIMO = 30.0
+STATUS_REPETIVEIS = {429, 500, 502, 503, 504}
+METODOS_IDEMPOTENTES = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+# Limite de requisições simultâneas por host (os demais usam LIMITE_HOST_PADRAO)
+LIMITES_POR_HOST = {
+    "api.github.com": 4,
+    "raw.githubusercontent.com": 8,
+    "api.telegram.org": 2,
+}
+LIMITE_HOST_PADRAO = 8
+
+_sessao = None
+_sessao_lock = threading.Lock()
+_semaforos = {}
+_semaforos_lock = threading.Lock()
+
+
+def obter_sessao() -> requests.Session:
+    """Sessão única do processo, com pool de conexões por host."""
+    global _sessao
+    with _sessao_lock:
+        if _sessao is None:
+            sessao = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=0)
+            sessao.mount("https://", adaptador)
+            sessao.mount("http://", adaptador)
+            _sessao = sessao
+        return _sessao
+
+
+def _semaforo_host(url: str) -> threading.BoundedSemaphore:
+    host = urlsplit(url).hostname or ""
+    with _semaforos_lock:
+        if host not in _semaforos:
+            _semaforos[host] = threading.BoundedSemaphore(LIMITES_POR_HOST.get(host, LIMITE_HOST_PADRAO))
+        return _semaforos[host]
+
+
+def _espera_backoff(tentativa: int, response: Optional[requests.Response] = None) -> float:
+    """Tempo de espera antes da próxima tentativa; respeita Retry-After / retry_after do Telegram."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is None and "telegram" in (urlsplit(response.url).hostname or ""):
+            try:
+                retry_after = response.json().get("parameters", {}).get("retry_after")
+            except ValueError:
+                retry_after = None
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), BACKOFF_MAXIMO)
+        except (TypeError, ValueError):
+            pass
+    return min(BACKOFF_BASE * (2 ** tentativa), BACKOFF_MAXIMO)
+
+
+def _rebobinar_arquivos(files):
+    """Volta os arquivos de upload ao início para que uma nova tentativa envie o conteúdo inteiro."""
+    if not files:
+        return
+    for valor in (files.values() if isinstance(files, dict) else [v for _, v in files]):
+        arquivo = valor[1] if isinstance(valor, tuple) else valor
+        if hasattr(arquivo, "seek"):
+            arquivo.seek(0)
+
+
+def requisitar(metodo: str, url: str, tentativas: int = TENTATIVAS_PADRAO,
+               repetir_nao_idempotente: bool = False, **kwargs) -> requests.Response:
+    """
+    Faz uma requisição pela sessão compartilhada.
+
+    429 é sempre repetido (a requisição não foi processada). 5xx e erros de conexão só são
+    repetidos em métodos idempotentes, a menos que `repetir_nao_idempotente=True`, para não
+    duplicar mensagens no Telegram. A última resposta (ou exceção) é devolvida ao chamador.
+    """
+    metodo = metodo.upper()
+    kwargs.setdefault("timeout", TIMEOUT_PADRAO)
+    pode_repetir_falha = metodo in METODOS_IDEMPOTENTES or repetir_nao_idempotente
+    sessao = obter_sessao()
+    semaforo = _semaforo_host(url)
+
+    for tentativa in range(tentativas):
+        ultima = tentativa == tentativas - 1
+        _rebobinar_arquivos(kwargs.get("files"))
+        try:
+            with semaforo:
+                response = sessao.request(metodo, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if ultima or not pode_repetir_falha:
+                raise
+            time.sleep(_espera_backoff(tentativa))
+            continue
+
+        repetivel = response.status_code == 429 or (
+            response.status_code in STATUS_REPETIVEIS and pode_repetir_falha
+        )
+        if not repetivel or ultima:
+            return response
+        response.close()  # Devolve a conexão ao pool (com stream=True o corpo não foi lido)
+        time.sleep(_espera_backoff(tentativa, response))
+    return response
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return requisitar("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return requisitar("POST", url, **kwargs)
+
+
+def put(url: str, **kwargs) -> requests.Response:
+    return requisitar("PUT", url, **kwargs)
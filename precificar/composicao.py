@@ -0,0 +1,228 @@
+"""
+Composição (ficha técnica) dos produtos da papelaria em formato longo.
+
+Cada linha é (Produto, Insumo, Quantidade). O custo de todos os produtos sai de
+uma única multiplicação esparsa "matriz produto × insumo" pelo vetor de preços
+dos insumos, feita com np.bincount (equivalente a um produto CSR), sem precisar
+interpretar o texto da coluna "Insumos Usados" com ast.literal_eval.
+"""
+import ast
+
+import numpy as np
+import pandas as pd
+
+from precificar import motor_precificacao as motor
+
+COLUNAS_COMPOSICAO = ["Produto", "Insumo", "Quantidade"]
+
+
+def composicao_vazia() -> pd.DataFrame:
+    return pd.DataFrame({
+        "Produto": pd.Series(dtype=object),
+        "Insumo": pd.Series(dtype=object),
+        "Quantidade": pd.Series(dtype=float),
+    })
+
+
+def normalizar_composicao(df: pd.DataFrame) -> pd.DataFrame:
+    """Garante as colunas e tipos da tabela de composição (ex.: logo após ler o CSV)."""
+    if df is None or df.empty:
+        return composicao_vazia()
+    df = df.reindex(columns=COLUNAS_COMPOSICAO).copy()
+    df["Produto"] = df["Produto"].astype(str)
+    df["Insumo"] = df["Insumo"].astype(str)
+    df["Quantidade"] = pd.to_numeric(df["Quantidade"], errors="coerce").fillna(0.0)
+    return df.reset_index(drop=True)
+
+
+def explodir_insumos_usados(produtos: pd.DataFrame) -> pd.DataFrame:
+    """
+    Migra a coluna legada "Insumos Usados" (repr de lista de dicts) para o formato longo.
+    Usado uma única vez, quando ainda não existe o CSV de composição.
+    """
+    linhas = []
+    if produtos is None or produtos.empty or "Insumos Usados" not in produtos.columns:
+        return composicao_vazia()
+    for produto, texto in zip(produtos["Produto"], produtos["Insumos Usados"]):
+        try:
+            itens = ast.literal_eval(texto) if isinstance(texto, str) else []
+        except (ValueError, SyntaxError):
+            itens = []
+        if not isinstance(itens, list):
+            continue
+        for item in itens:
+            if isinstance(item, dict) and item.get("Insumo"):
+                linhas.append((str(produto), str(item["Insumo"]), item.get("Quantidade Usada", 0.0)))
+    return normalizar_composicao(pd.DataFrame(linhas, columns=COLUNAS_COMPOSICAO))
+
+
+def vetor_precos(insumos: pd.DataFrame) -> pd.Series:
+    """Preço unitário por nome de insumo (primeira ocorrência de cada nome)."""
+    if insumos is None or insumos.empty or "Nome" not in insumos.columns:
+        return pd.Series(dtype=float)
+    precos = pd.to_numeric(insumos["Preço Unitário (R$)"], errors="coerce").fillna(0.0)
+    return pd.Series(precos.to_numpy(), index=insumos["Nome"].astype(str)).groupby(level=0, sort=False).first()
+
+
+def custos_produtos(composicao: pd.DataFrame, insumos: pd.DataFrame, produtos=None) -> pd.Series:
+    """
+    Custo total (R$) de cada produto = Σ quantidade × preço unitário do insumo.
+
+    Uma única operação vetorizada sobre toda a composição. Insumos que não existem mais
+    contam com preço 0. `produtos` (opcional) fixa a ordem/lista do resultado; produtos
+    sem composição ficam com custo 0.
+    """
+    precos = vetor_precos(insumos)
+    if composicao.empty:
+        indice = pd.Index(produtos if produtos is not None else [], dtype=object)
+        return pd.Series(0.0, index=indice)
+
+    codigos_prod, nomes_prod = pd.factorize(composicao["Produto"], sort=False)
+    preco_linha = precos.reindex(composicao["Insumo"]).fillna(0.0).to_numpy()
+    valores = composicao["Quantidade"].to_numpy(dtype=float) * preco_linha
+    custos = pd.Series(np.bincount(codigos_prod, weights=valores, minlength=len(nomes_prod)), index=nomes_prod)
+    if produtos is not None:
+        custos = custos.reindex(pd.Index(produtos).astype(str)).fillna(0.0)
+    return custos
+
+
+def itens_do_produto(composicao: pd.DataFrame, produto: str) -> pd.DataFrame:
+    """Linhas (Insumo, Quantidade) da composição de um produto."""
+    return composicao.loc[composicao["Produto"] == str(produto), ["Insumo", "Quantidade"]]
+
+
+def definir_composicao(composicao: pd.DataFrame, produto: str, itens: dict) -> pd.DataFrame:
+    """Substitui a composição de `produto` por `itens` (insumo -> quantidade)."""
+    restante = composicao[composicao["Produto"] != str(produto)]
+    novos = pd.DataFrame({
+        "Produto": [str(produto)] * len(itens),
+        "Insumo": [str(i) for i in itens.keys()],
+        "Quantidade": [float(q) for q in itens.values()],
+    })
+    if restante.empty:
+        return normalizar_composicao(novos)
+    return pd.concat([restante, novos], ignore_index=True)
+
+
+def renomear_produto(composicao: pd.DataFrame, antigo: str, novo: str) -> pd.DataFrame:
+    composicao = composicao.copy()
+    composicao.loc[composicao["Produto"] == str(antigo), "Produto"] = str(novo)
+    return composicao
+
+
+def remover_produto(composicao: pd.DataFrame, produto: str) -> pd.DataFrame:
+    return composicao[composicao["Produto"] != str(produto)].reset_index(drop=True)
+
+
+def renomear_insumo(composicao: pd.DataFrame, antigo: str, novo: str) -> pd.DataFrame:
+    composicao = composicao.copy()
+    composicao.loc[composicao["Insumo"] == str(antigo), "Insumo"] = str(novo)
+    return composicao
+
+
+class IndiceReverso:
+    """
+    Índices derivados de uma tabela de composição: insumo -> produtos que o usam e
+    produto -> posições das suas linhas. Vale para o objeto DataFrame usado na construção;
+    como as funções deste módulo sempre devolvem um DF novo, basta comparar identidade.
+    """
+
+    def __init__(self, composicao: pd.DataFrame):
+        self.composicao = composicao
+        if composicao.empty:
+            self.produtos_por_insumo = {}
+            self.linhas_por_produto = {}
+        else:
+            self.produtos_por_insumo = {
+                insumo: set(produtos) for insumo, produtos in composicao.groupby("Insumo", sort=False)["Produto"]
+            }
+            self.linhas_por_produto = composicao.groupby("Produto", sort=False).indices
+
+    def valido_para(self, composicao: pd.DataFrame) -> bool:
+        return self.composicao is composicao
+
+    def produtos_afetados(self, insumos) -> set:
+        afetados = set()
+        for insumo in insumos:
+            afetados |= self.produtos_por_insumo.get(str(insumo), set())
+        return afetados
+
+    def composicao_de(self, produtos) -> pd.DataFrame:
+        """Sub-tabela com as linhas dos `produtos` (custa O(linhas desses produtos))."""
+        posicoes = [self.linhas_por_produto[p] for p in produtos if p in self.linhas_por_produto]
+        if not posicoes:
+            return self.composicao.iloc[0:0]
+        return self.composicao.iloc[np.sort(np.concatenate(posicoes))]
+
+
+def descrever_insumos_usados(itens: pd.DataFrame, insumos: pd.DataFrame) -> list:
+    """Lista de dicts no formato da coluna legada "Insumos Usados", com os preços atuais."""
+    precos = vetor_precos(insumos)
+    unidades = {}
+    if insumos is not None and not insumos.empty and "Unidade" in insumos.columns:
+        unidades = dict(zip(insumos["Nome"].astype(str)[::-1], insumos["Unidade"].astype(str)[::-1]))
+    descricao = []
+    for insumo, qtd in zip(itens["Insumo"], itens["Quantidade"]):
+        preco = float(precos.get(insumo, 0.0))
+        descricao.append({
+            "Insumo": insumo,
+            "Quantidade Usada": float(qtd),
+            "Unidade": unidades.get(insumo, ""),
+            "Preço Unitário (R$)": preco,
+            "Custo": float(qtd) * preco,
+        })
+    return descricao
+
+
+def repreciar_por_insumos(produtos: pd.DataFrame, composicao: pd.DataFrame, insumos: pd.DataFrame,
+                          insumos_alterados, indice: IndiceReverso = None):
+    """
+    Recalcula custo e preços apenas dos produtos que usam algum dos `insumos_alterados`.
+
+    Retorna (produtos atualizado, posições alteradas em `produtos`, resumo). O resumo tem uma
+    linha por produto afetado com custo e preço à vista antes/depois. A margem de cada produto
+    é mantida; preços seguem a mesma regra do formulário (zero quando o custo é zero).
+    """
+    if indice is None or not indice.valido_para(composicao):
+        indice = IndiceReverso(composicao)
+    afetados = indice.produtos_afetados(insumos_alterados)
+    colunas_resumo = ["Produto", "Custo Anterior", "Custo Novo", "Preço à Vista Anterior", "Preço à Vista Novo"]
+    if not afetados or produtos.empty:
+        return produtos, np.array([], dtype=int), pd.DataFrame(columns=colunas_resumo)
+
+    sub = indice.composicao_de(afetados)
+    custos = custos_produtos(sub, insumos)
+
+    nomes = produtos["Produto"].astype(str)
+    posicoes = np.flatnonzero(nomes.isin(afetados).to_numpy())
+    if not len(posicoes):
+        return produtos, posicoes, pd.DataFrame(columns=colunas_resumo)
+
+    produtos = produtos.copy()
+    nomes_afetados = nomes.iloc[posicoes]
+    custo_novo = custos.reindex(nomes_afetados).fillna(0.0).to_numpy()
+    margem = pd.to_numeric(produtos["Margem (%)"].iloc[posicoes], errors="coerce").fillna(0.0).to_numpy()
+    vista_novo = np.where(custo_novo > 0, motor.preco_a_vista(custo_novo, margem), 0.0)
+    cartao_novo = np.where(vista_novo > 0, motor.preco_cartao(vista_novo), 0.0)
+
+    resumo = pd.DataFrame({
+        "Produto": nomes_afetados.to_numpy(),
+        "Custo Anterior": pd.to_numeric(produtos["Custo Total"].iloc[posicoes], errors="coerce").to_numpy(),
+        "Custo Novo": custo_novo,
+        "Preço à Vista Anterior": pd.to_numeric(produtos["Preço à Vista"].iloc[posicoes], errors="coerce").to_numpy(),
+        "Preço à Vista Novo": vista_novo,
+    })
+
+    for col, valores in (("Custo Total", custo_novo), ("Preço à Vista", vista_novo), ("Preço no Cartão", cartao_novo)):
+        produtos[col] = pd.to_numeric(produtos[col], errors="coerce").astype(float)
+        produtos.iloc[posicoes, produtos.columns.get_loc(col)] = valores
+
+    if "Insumos Usados" in produtos.columns:
+        # Mantém o retrato legível da composição coerente com os novos preços
+        produtos["Insumos Usados"] = produtos["Insumos Usados"].astype(object)
+        j = produtos.columns.get_loc("Insumos Usados")
+        for pos, nome in zip(posicoes, nomes_afetados):
+            itens = sub[sub["Produto"] == nome]
+            produtos.iloc[pos, j] = str(descrever_insumos_usados(itens, insumos))
+
+    return produtos, posicoes, resumo
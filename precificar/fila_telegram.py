@@ -0,0 +1,381 @@
+"""
+Fila de saída (outbox) das mensagens do Telegram.
+
+O rerun do Streamlit só grava a mensagem numa fila SQLite em disco e segue em
+frente; uma thread do processo esvazia a fila respeitando os limites do Telegram
+(uma mensagem por segundo por chat, 20 por minuto em grupos, 30 por segundo no
+total). Falhas temporárias (429, 5xx, rede) voltam para a fila com backoff
+exponencial — ou o `retry_after` informado pelo Telegram — e sobrevivem a um
+reinício do servidor. Fotos consecutivas para o mesmo chat/tópico vão juntas
+num álbum (`sendMediaGroup`, até 10 por vez).
+
+A entrega é "pelo menos uma vez": se a conexão cair depois de o Telegram
+receber a mensagem, ela pode ser reenviada.
+
+O token do bot não vai para o disco: a fila guarda só uma impressão digital
+(sha256) dele e mantém o token em memória. Depois de um reinício, as mensagens
+pendentes esperam o app registrar o token de novo (`registrar_token`).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from precificar import cliente_http
+from precificar.miniaturas import LARGURA_TELEGRAM, obter_miniaturas
+
+CAMINHO_FILA = os.environ.get(
+    "PRECIFICAR_TELEGRAM_FILA",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "telegram.sqlite3"),
+)
+# Configurável para testes contra um servidor Telegram falso local
+TELEGRAM_API = os.environ.get("PRECIFICAR_TELEGRAM_API", "https://api.telegram.org")
+
+INTERVALO_CHAT = 1.0  # segundos entre mensagens para o mesmo chat privado
+INTERVALO_GRUPO = 3.0  # grupos/canais (id negativo): 20 mensagens por minuto
+INTERVALO_GLOBAL = 1 / 30  # 30 mensagens por segundo para o bot inteiro
+MAX_FOTOS_ALBUM = 10
+MAX_TENTATIVAS = 8
+BACKOFF_BASE = 2.0  # segundos; dobra a cada tentativa
+BACKOFF_MAXIMO = 600.0
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS mensagens (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    token TEXT NOT NULL,
+    metodo TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    thread_id INTEGER,
+    dados TEXT NOT NULL,
+    agrupar INTEGER NOT NULL DEFAULT 0,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    proxima_em REAL NOT NULL,
+    criada_em REAL NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendente',
+    erro TEXT
+);
+CREATE INDEX IF NOT EXISTS mensagens_pendentes ON mensagens (estado, id);
+CREATE TABLE IF NOT EXISTS arquivos (
+    mensagem_id INTEGER NOT NULL,
+    campo TEXT NOT NULL,
+    nome TEXT NOT NULL,
+    tipo TEXT,
+    conteudo BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS arquivos_mensagem ON arquivos (mensagem_id);
+"""
+
+
+def _impressao_token(token: str) -> str:
+    """O que a fila grava no lugar do token (identifica o bot sem permitir usá-lo)."""
+    return "sha256:" + hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+def _intervalo_chat(chat_id: str) -> float:
+    return INTERVALO_GRUPO if str(chat_id).startswith("-") else INTERVALO_CHAT
+
+
+class FilaTelegram:
+    """Outbox persistente (SQLite), esvaziada por uma thread com limite de taxa por chat."""
+
+    def __init__(self, caminho: str = CAMINHO_FILA, api: Optional[str] = None):
+        self.caminho = caminho
+        self.api = api or TELEGRAM_API
+        if caminho != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.row_factory = sqlite3.Row
+        with self._conexao:
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.executescript(_ESQUEMA)
+        self._cond = threading.Condition()
+        self._tokens = {}  # impressão digital -> token (só em memória)
+        self._migrar_tokens()
+        self._liberado_em = {}  # chat_id -> instante a partir do qual pode receber a próxima mensagem
+        self._global_em = 0.0
+        self._erros = []
+        self._thread = None
+        if self.pendentes():
+            self._iniciar()  # Mensagens que ficaram na fila de uma execução anterior
+
+    def _migrar_tokens(self):
+        """Filas gravadas por versões anteriores têm o token em texto puro: troca pela impressão digital."""
+        antigos = [linha[0] for linha in self._conexao.execute(
+            "SELECT DISTINCT token FROM mensagens WHERE token NOT LIKE 'sha256:%'"
+        )]
+        if not antigos:
+            return
+        with self._conexao:
+            for token in antigos:
+                self._tokens[_impressao_token(token)] = token
+                self._conexao.execute("UPDATE mensagens SET token = ? WHERE token = ?", (_impressao_token(token), token))
+        # Não deixa o texto antigo em páginas livres do arquivo nem no WAL
+        self._conexao.execute("VACUUM")
+        self._conexao.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def registrar_token(self, token: str):
+        """Deixa a fila usar `token` (ex.: na subida do app, para as mensagens que ficaram pendentes)."""
+        with self._cond:
+            self._tokens[_impressao_token(token)] = token
+            if self.pendentes():
+                self._iniciar()
+            self._cond.notify_all()
+
+    # --- Inclusão na fila ---
+    def enfileirar(self, token: str, metodo: str, chat_id, dados: Optional[dict] = None,
+                   arquivos: Optional[dict] = None, thread_id: Optional[int] = None,
+                   agrupar: bool = False) -> int:
+        """
+        Grava a chamada `metodo` da Bot API na fila e retorna o id da mensagem.
+        `arquivos` mapeia o campo do formulário -> (nome, bytes, tipo MIME).
+        """
+        agora = time.time()
+        impressao = _impressao_token(token)
+        with self._cond:
+            self._tokens[impressao] = token
+            with self._conexao:
+                cursor = self._conexao.execute(
+                    "INSERT INTO mensagens (token, metodo, chat_id, thread_id, dados, agrupar, proxima_em, criada_em)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (impressao, metodo, str(chat_id), thread_id, json.dumps(dados or {}), int(agrupar), agora, agora),
+                )
+                mensagem_id = cursor.lastrowid
+                for campo, (nome, conteudo, tipo) in (arquivos or {}).items():
+                    self._conexao.execute(
+                        "INSERT INTO arquivos (mensagem_id, campo, nome, tipo, conteudo) VALUES (?, ?, ?, ?, ?)",
+                        (mensagem_id, campo, nome, tipo, sqlite3.Binary(conteudo)),
+                    )
+            self._iniciar()
+            self._cond.notify()
+        return mensagem_id
+
+    def enviar_mensagem(self, token: str, chat_id, texto: str, thread_id: Optional[int] = None,
+                        parse_mode: Optional[str] = None) -> int:
+        dados = {"text": texto}
+        if parse_mode:
+            dados["parse_mode"] = parse_mode
+        return self.enfileirar(token, "sendMessage", chat_id, dados, thread_id=thread_id)
+
+    def enviar_documento(self, token: str, chat_id, conteudo: bytes, nome: str, legenda: str = "",
+                         thread_id: Optional[int] = None, tipo: str = "application/pdf") -> int:
+        return self.enfileirar(token, "sendDocument", chat_id, {"caption": legenda},
+                               {"document": (nome, conteudo, tipo)}, thread_id=thread_id)
+
+    def enviar_foto(self, token: str, chat_id, foto, legenda: str = "", thread_id: Optional[int] = None,
+                    agrupar: bool = True) -> int:
+        """
+        `foto` são os bytes da imagem ou uma URL. Para URLs, a versão reduzida do cache de
+        miniaturas é obtida na hora do envio (na thread da fila, não no rerun).
+        Com `agrupar`, fotos seguidas para o mesmo chat/tópico vão no mesmo álbum.
+        """
+        if isinstance(foto, (bytes, bytearray)):
+            return self.enfileirar(token, "sendPhoto", chat_id, {"caption": legenda},
+                                   {"photo": ("foto.jpg", bytes(foto), "image/jpeg")}, thread_id, agrupar)
+        return self.enfileirar(token, "sendPhoto", chat_id, {"caption": legenda, "photo": foto},
+                               thread_id=thread_id, agrupar=agrupar)
+
+    # --- Estado ---
+    def pendentes(self) -> int:
+        with self._cond:
+            return self._conexao.execute("SELECT COUNT(*) FROM mensagens WHERE estado = 'pendente'").fetchone()[0]
+
+    def consumir_erros(self) -> list:
+        """Retorna (e limpa) as mensagens de erro dos envios que desistiram."""
+        with self._cond:
+            erros, self._erros = self._erros, []
+        return erros
+
+    def esperar(self, timeout: Optional[float] = None) -> bool:
+        """Espera a fila esvaziar (usado em testes/encerramento). Retorna False se estourar o `timeout`."""
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._conexao.execute("SELECT 1 FROM mensagens WHERE estado = 'pendente' LIMIT 1").fetchone():
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._cond.wait(timeout=0.1 if restante is None else min(restante, 0.1))
+        return True
+
+    # --- Thread de envio ---
+    def _iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="fila-telegram", daemon=True)
+            self._thread.start()
+
+    def _proximo_lote(self, agora: float):
+        """
+        Próximo envio permitido agora: a mensagem mais antiga de um chat liberado (a ordem
+        dentro de cada chat é mantida) e, se for uma foto agrupável, as fotos agrupáveis
+        seguintes do mesmo chat/tópico. Retorna (lote, segundos até o próximo possível).
+        Um chat cuja mensagem mais antiga é de um token ainda não registrado fica parado.
+        """
+        if agora < self._global_em:
+            return None, self._global_em - agora
+        linhas = self._conexao.execute(
+            "SELECT * FROM mensagens WHERE estado = 'pendente' ORDER BY id"
+        ).fetchall()
+        vistos = set()
+        espera = None
+        for i, linha in enumerate(linhas):
+            chat = linha["chat_id"]
+            if chat in vistos:
+                continue
+            vistos.add(chat)
+            if linha["token"] not in self._tokens:
+                continue
+            pronto_em = max(linha["proxima_em"], self._liberado_em.get(chat, 0.0))
+            if pronto_em > agora:
+                espera = pronto_em - agora if espera is None else min(espera, pronto_em - agora)
+                continue
+            lote = [linha]
+            if linha["metodo"] == "sendPhoto" and linha["agrupar"]:
+                for seguinte in linhas[i + 1:]:
+                    if seguinte["chat_id"] != chat:
+                        continue
+                    if (len(lote) >= MAX_FOTOS_ALBUM or seguinte["metodo"] != "sendPhoto" or not seguinte["agrupar"]
+                            or seguinte["token"] != linha["token"] or seguinte["thread_id"] != linha["thread_id"]
+                            or seguinte["proxima_em"] > agora):
+                        break
+                    lote.append(seguinte)
+            return lote, None
+        return None, espera
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                lote, espera = self._proximo_lote(time.time())
+                while lote is None:
+                    self._cond.wait(timeout=espera)
+                    lote, espera = self._proximo_lote(time.time())
+            self._enviar(lote)
+
+    def _arquivos(self, mensagem_id: int) -> list:
+        with self._cond:
+            return self._conexao.execute(
+                "SELECT campo, nome, tipo, conteudo FROM arquivos WHERE mensagem_id = ?", (mensagem_id,)
+            ).fetchall()
+
+    @staticmethod
+    def _foto_da_url(dados: dict, arquivos: dict, campo: str):
+        """Troca a URL da foto pela miniatura em cache, quando disponível (o Telegram não precisa baixá-la)."""
+        url = dados.get("photo")
+        if isinstance(url, str) and url.startswith("http"):
+            foto = obter_miniaturas().obter(url, LARGURA_TELEGRAM)
+            if foto is not None:
+                del dados["photo"]
+                arquivos[campo] = ("foto.jpg", foto, "image/jpeg")
+
+    def _montar(self, lote: list) -> tuple:
+        """(método, campos do formulário, arquivos) da requisição do lote."""
+        linha = lote[0]
+        campos = {"chat_id": linha["chat_id"]}
+        if linha["thread_id"] is not None:
+            campos["message_thread_id"] = linha["thread_id"]
+        arquivos = {}
+
+        if len(lote) == 1:
+            dados = json.loads(linha["dados"])
+            for a in self._arquivos(linha["id"]):
+                arquivos[a["campo"]] = (a["nome"], bytes(a["conteudo"]), a["tipo"])
+            if linha["metodo"] == "sendPhoto" and "photo" not in arquivos:
+                self._foto_da_url(dados, arquivos, "photo")
+            campos.update({k: v for k, v in dados.items() if v not in (None, "")})
+            return linha["metodo"], campos, arquivos
+
+        midias = []
+        for k, item in enumerate(lote):
+            dados = json.loads(item["dados"])
+            campo = f"foto{k}"
+            for a in self._arquivos(item["id"]):
+                arquivos[campo] = (a["nome"], bytes(a["conteudo"]), a["tipo"])
+            if campo not in arquivos:
+                self._foto_da_url(dados, arquivos, campo)
+            midia = {"type": "photo", "media": f"attach://{campo}" if campo in arquivos else dados["photo"]}
+            if dados.get("caption"):
+                midia["caption"] = dados["caption"]
+            midias.append(midia)
+        campos["media"] = json.dumps(midias)
+        return "sendMediaGroup", campos, arquivos
+
+    def _enviar(self, lote: list):
+        ids = [linha["id"] for linha in lote]
+        chat = lote[0]["chat_id"]
+        resposta, descricao, retry_after, token = None, None, None, None
+        try:
+            metodo, campos, arquivos = self._montar(lote)
+            # Uma tentativa só: as repetições são da fila, que persiste entre reinícios
+            token = self._tokens[lote[0]["token"]]
+            resposta = cliente_http.post(f"{self.api}/bot{token}/{metodo}", data=campos,
+                                         files=arquivos or None, tentativas=1)
+            try:
+                corpo = resposta.json()
+            except ValueError:
+                corpo = {}
+            ok = resposta.status_code == 200 and corpo.get("ok", False)
+            descricao = corpo.get("description") or resposta.text[:200]
+            retry_after = (corpo.get("parameters") or {}).get("retry_after")
+        except Exception as e:
+            ok, descricao = False, str(e)
+        if token and descricao:
+            # Exceções de rede trazem a URL, que leva o token; a descrição vai para o SQLite e para a UI
+            descricao = descricao.replace(token, "<token>")
+
+        agora = time.time()
+        with self._cond:
+            self._global_em = agora + INTERVALO_GLOBAL * len(lote)
+            self._liberado_em[chat] = agora + _intervalo_chat(chat) * len(lote)
+            marcadores = ",".join("?" * len(ids))
+            with self._conexao:
+                if ok:
+                    self._conexao.execute(f"DELETE FROM arquivos WHERE mensagem_id IN ({marcadores})", ids)
+                    self._conexao.execute(f"DELETE FROM mensagens WHERE id IN ({marcadores})", ids)
+                elif resposta is not None and resposta.status_code == 429:
+                    # Limite estourado: não conta como tentativa, espera o que o Telegram pediu
+                    espera = float(retry_after or BACKOFF_BASE)
+                    self._liberado_em[chat] = agora + espera
+                    self._conexao.execute(
+                        f"UPDATE mensagens SET proxima_em = ? WHERE id IN ({marcadores})", [agora + espera] + ids
+                    )
+                elif resposta is not None and resposta.status_code < 500 and len(lote) > 1:
+                    # Álbum recusado (ex.: uma das fotos é inválida): tenta as fotos uma a uma
+                    self._conexao.execute(f"UPDATE mensagens SET agrupar = 0 WHERE id IN ({marcadores})", ids)
+                elif resposta is not None and resposta.status_code < 500:
+                    self._desistir(lote, descricao)
+                else:
+                    # 5xx ou falha de rede: tenta de novo mais tarde
+                    for linha in lote:
+                        tentativas = linha["tentativas"] + 1
+                        if tentativas >= MAX_TENTATIVAS:
+                            self._desistir([linha], descricao)
+                            continue
+                        espera = min(BACKOFF_BASE * (2 ** (tentativas - 1)), BACKOFF_MAXIMO)
+                        self._conexao.execute(
+                            "UPDATE mensagens SET tentativas = ?, proxima_em = ?, erro = ? WHERE id = ?",
+                            (tentativas, agora + espera, descricao, linha["id"]),
+                        )
+            self._cond.notify_all()
+
+    def _desistir(self, lote: list, descricao: Optional[str]):
+        """Marca as mensagens como falhas (ficam na tabela para consulta) e registra o erro para a UI."""
+        for linha in lote:
+            self._conexao.execute("DELETE FROM arquivos WHERE mensagem_id = ?", (linha["id"],))
+            self._conexao.execute(
+                "UPDATE mensagens SET estado = 'falhou', erro = ? WHERE id = ?", (descricao, linha["id"])
+            )
+            self._erros.append(f"❌ Erro ao enviar para o Telegram ({linha['metodo']}): {descricao}")
+
+
+_fila = None
+_fila_lock = threading.Lock()
+
+
+def obter_fila_telegram() -> FilaTelegram:
+    """Instância única da fila, compartilhada por todas as sessões do processo."""
+    global _fila
+    with _fila_lock:
+        if _fila is None:
+            _fila = FilaTelegram()
+        return _fila
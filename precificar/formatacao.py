@@ -0,0 +1,60 @@
+"""
+Formatação de valores para exibição (moeda BRL).
+
+`formatar_brl` formata um valor; `formatar_brl_serie` formata uma coluna inteira
+de uma vez (mesmo resultado, usado nos relatórios com milhares de linhas).
+"""
+import numpy as np
+import pandas as pd
+
+
+def formatar_brl(valor, decimais=2, prefixo=True):
+    """Formata um valor float para a string de moeda BRL (R$ X.XXX,XX/XXXX) de forma simplificada."""
+    try:
+        valor = float(valor)
+    except (ValueError, TypeError):
+        return "R$ 0,00" if prefixo else "0,00"
+
+    # 1. Formata para o número correto de decimais (usando ponto como separador decimal temporário)
+    s = f"{valor:.{decimais}f}"
+    
+    # 2. Divide em parte inteira e decimal
+    if '.' in s:
+        inteira, decimal = s.split('.')
+    else:
+        inteira = s
+        decimal = '0' * decimais
+
+    # 3. Formata a parte inteira para separador de milhar (ponto)
+    inteira_formatada = ''
+    for i, digito in enumerate(reversed(inteira)):
+        # Adiciona ponto a cada 3 dígitos (exceto no primeiro)
+        if i > 0 and i % 3 == 0 and digito.isdigit():
+            inteira_formatada += '.'
+        inteira_formatada += digito
+    
+    # Inverte a string e remove o prefixo de ponto extra (se houver)
+    inteira_formatada = inteira_formatada[::-1].lstrip('.')
+
+    # 4. Junta tudo com a vírgula como separador decimal
+    resultado = f"{inteira_formatada},{decimal}"
+    if prefixo:
+        return f"R$ {resultado}"
+    return resultado
+
+
+def formatar_brl_serie(valores, decimais=2, prefixo=True) -> pd.Series:
+    """Versão em lote de `formatar_brl`: mesmo texto para cada valor da Series/array."""
+    serie = pd.Series(valores)
+    numeros = pd.to_numeric(serie, errors="coerce").astype(float)
+    finitos = np.isfinite(numeros.to_numpy())
+    # "{:,.Nf}" usa vírgula no milhar e ponto no decimal: basta trocar um pelo outro
+    texto = numeros[finitos].map(f"{{:,.{decimais}f}}".format).astype(str).str.translate(str.maketrans(",.", ".,"))
+    if prefixo:
+        texto = "R$ " + texto
+    resultado = pd.Series(index=serie.index, dtype=object)
+    resultado[finitos] = texto
+    # Valores não numéricos/infinitos/NaN são raros: caem na função escalar (mesmo texto)
+    for pos in np.flatnonzero(~finitos):
+        resultado.iloc[pos] = formatar_brl(serie.iloc[pos], decimais, prefixo)
+    return resultado
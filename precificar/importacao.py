@@ -0,0 +1,206 @@
+"""
+Importação em lote de produtos da precificação a partir de planilhas (CSV ou XLSX).
+
+O arquivo é lido em blocos (`pd.read_csv(chunksize=...)` ou as linhas do
+openpyxl em modo somente leitura), os cabeçalhos são reconhecidos sem acento
+nem caixa (ex.: "Custo", "Quantidade", "Data Cadastro") e cada bloco é
+validado e convertido de forma vetorizada para as colunas de entrada de
+`processar_dataframe`. As linhas inválidas são devolvidas com o motivo; as
+válidas saem num único DataFrame, para serem acrescentadas ao catálogo de uma
+vez (um `pd.concat` por importação, não por linha).
+"""
+import csv
+import io
+from dataclasses import dataclass, field
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from precificar.indice_busca import normalizar
+
+TAMANHO_BLOCO = 20_000
+# Cabeçalho normalizado (sem acento, minúsculo) -> coluna de entrada da precificação
+APELIDOS_COLUNAS = {
+    "produto": "Produto", "nome": "Produto", "descricao": "Produto", "nome do produto": "Produto",
+    "qtd": "Qtd", "quantidade": "Qtd", "qtde": "Qtd", "estoque": "Qtd",
+    "custo unitario": "Custo Unitário", "custo": "Custo Unitário", "valor pago": "Custo Unitário",
+    "preco de custo": "Custo Unitário",
+    "margem": "Margem (%)", "margem de lucro": "Margem (%)",
+    "custos extras produto": "Custos Extras Produto", "custos extras": "Custos Extras Produto",
+    "custo extra": "Custos Extras Produto",
+    "imagem url": "Imagem_URL", "url imagem": "Imagem_URL", "url da imagem": "Imagem_URL", "imagem": "Imagem_URL",
+    "cor": "Cor", "marca": "Marca",
+    "data cadastro": "Data_Cadastro", "data de cadastro": "Data_Cadastro", "data": "Data_Cadastro",
+}
+COLUNAS_IMPORTADAS = [
+    "Produto", "Qtd", "Custo Unitário", "Margem (%)", "Custos Extras Produto", "Imagem", "Imagem_URL",
+    "Cor", "Marca", "Data_Cadastro",
+]
+
+
+@dataclass
+class ResultadoImportacao:
+    produtos: pd.DataFrame  # Linhas válidas, nas colunas de entrada da precificação
+    erros: pd.DataFrame  # Linha (no arquivo), Produto, Motivo
+    colunas_reconhecidas: dict = field(default_factory=dict)  # cabeçalho do arquivo -> coluna
+    colunas_ignoradas: list = field(default_factory=list)
+    total_linhas: int = 0
+
+
+def _coluna_destino(cabecalho):
+    return APELIDOS_COLUNAS.get(normalizar(cabecalho))
+
+
+def _separador_csv(amostra: str) -> str:
+    try:
+        return csv.Sniffer().sniff(amostra, delimiters=",;\t|").delimiter
+    except csv.Error:
+        return ","
+
+
+def ler_em_blocos(arquivo, nome_arquivo: str, tamanho_bloco: int = TAMANHO_BLOCO) -> Iterator[pd.DataFrame]:
+    """
+    DataFrames de até `tamanho_bloco` linhas do arquivo (bytes ou objeto de arquivo), todas as
+    células como texto. XLSX usa a primeira planilha; precisa do openpyxl.
+    """
+    dados = arquivo if isinstance(arquivo, (bytes, bytearray)) else arquivo.read()
+    if nome_arquivo.lower().endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+
+        planilha = load_workbook(io.BytesIO(dados), read_only=True, data_only=True).worksheets[0]
+        linhas = planilha.iter_rows(values_only=True)
+        cabecalho = [str(c) if c is not None else "" for c in next(linhas, ())]
+        bloco = []
+        for linha in linhas:
+            bloco.append(linha[:len(cabecalho)])
+            if len(bloco) >= tamanho_bloco:
+                yield pd.DataFrame(bloco, columns=cabecalho, dtype=object)
+                bloco = []
+        if bloco or not cabecalho:
+            yield pd.DataFrame(bloco, columns=cabecalho, dtype=object)
+        return
+
+    texto = dados.decode("utf-8-sig", errors="replace") if isinstance(dados, (bytes, bytearray)) else dados
+    leitor = pd.read_csv(
+        io.StringIO(texto), sep=_separador_csv(texto[:8192]), dtype=str, keep_default_na=False,
+        chunksize=tamanho_bloco, skip_blank_lines=True,
+    )
+    yield from leitor
+
+
+def _numeros(serie: pd.Series) -> pd.Series:
+    """Converte texto em número aceitando "R$", "%", milhar com ponto e decimal com vírgula."""
+    if pd.api.types.is_numeric_dtype(serie.dtype):
+        return serie.astype(float)
+    texto = serie.astype(str).str.replace(r"[R$%\s]", "", regex=True)
+    com_virgula = texto.str.contains(",", regex=False)
+    # "1.234,56" -> "1234.56"; "1234.56" fica como está
+    texto = texto.where(~com_virgula, texto.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    return pd.to_numeric(texto.replace("", np.nan), errors="coerce")
+
+
+def _texto(serie: pd.Series) -> pd.Series:
+    return serie.astype(object).where(serie.notna(), "").astype(str).str.strip()
+
+
+def _datas(texto: pd.Series) -> pd.Series:
+    """
+    Datas ISO (AAAA-MM-DD, inclusive as células de data do Excel) ou DD/MM/AAAA; os demais
+    formatos são interpretados um a um, com o dia primeiro. Inválidas viram NaT.
+    """
+    iso = texto.str.match(r"\d{4}-\d{2}-\d{2}")
+    datas = pd.to_datetime(texto.where(iso), errors="coerce", format="ISO8601")
+    restantes = ~iso & (texto != "")
+    if restantes.any():
+        datas[restantes] = pd.to_datetime(texto[restantes], errors="coerce", format="%d/%m/%Y")
+        outras = restantes & datas.isna()
+        if outras.any():
+            datas[outras] = pd.to_datetime(texto[outras], errors="coerce", dayfirst=True, format="mixed")
+    return datas
+
+
+def converter_bloco(bloco: pd.DataFrame, primeira_linha: int, margem_padrao: float, data_padrao: str) -> tuple:
+    """
+    (produtos válidos, erros) de um bloco já com os cabeçalhos renomeados para as colunas de
+    entrada. `primeira_linha` é o número, no arquivo, da primeira linha do bloco.
+    """
+    n = len(bloco)
+    linhas = np.arange(primeira_linha, primeira_linha + n)
+    vazio = pd.Series([""] * n, index=bloco.index, dtype=object)
+
+    def coluna(nome):
+        return bloco[nome] if nome in bloco.columns else vazio
+
+    produtos = pd.DataFrame(index=bloco.index)
+    produtos["Produto"] = _texto(coluna("Produto"))
+    qtd_bruta, custo_bruto = _texto(coluna("Qtd")), _texto(coluna("Custo Unitário"))
+    qtd, custo = _numeros(qtd_bruta), _numeros(custo_bruto)
+    margem, extras = _numeros(_texto(coluna("Margem (%)"))), _numeros(_texto(coluna("Custos Extras Produto")))
+
+    motivos = pd.Series("", index=bloco.index, dtype=object)
+
+    def invalidar(mascara, motivo):
+        nonlocal motivos
+        motivos = motivos.where(~(mascara & (motivos == "")), motivo)
+
+    invalidar(produtos["Produto"] == "", "Produto sem nome")
+    invalidar(custo.isna() & (custo_bruto != ""), "Custo Unitário inválido")
+    invalidar(custo_bruto == "", "Custo Unitário vazio")
+    invalidar(custo < 0, "Custo Unitário negativo")
+    invalidar(qtd.isna() & (qtd_bruta != ""), "Qtd inválida")
+    invalidar(qtd.notna() & ((qtd < 0) | (qtd != np.floor(qtd))), "Qtd deve ser um inteiro não negativo")
+
+    produtos["Qtd"] = qtd.where(qtd.notna() & (qtd >= 0) & (qtd == np.floor(qtd)), 1).astype("int64")
+    produtos["Custo Unitário"] = custo.astype(float)
+    produtos["Margem (%)"] = margem.fillna(margem_padrao).astype(float)
+    produtos["Custos Extras Produto"] = extras.fillna(0.0).clip(lower=0.0).astype(float)
+    produtos["Imagem"] = None
+    produtos["Imagem_URL"] = _texto(coluna("Imagem_URL"))
+    produtos["Cor"] = _texto(coluna("Cor"))
+    produtos["Marca"] = _texto(coluna("Marca"))
+
+    # Datas vazias = hoje
+    datas_brutas = _texto(coluna("Data_Cadastro"))
+    datas = _datas(datas_brutas)
+    invalidar(datas.isna() & (datas_brutas != ""), "Data_Cadastro inválida")
+    produtos["Data_Cadastro"] = datas.dt.strftime("%Y-%m-%d").fillna(data_padrao)
+
+    ruins = (motivos != "").to_numpy()
+    erros = pd.DataFrame({
+        "Linha": linhas[ruins],
+        "Produto": produtos["Produto"].to_numpy()[ruins],
+        "Motivo": motivos.to_numpy()[ruins],
+    })
+    return produtos[~ruins], erros
+
+
+def importar_produtos(arquivo, nome_arquivo: str, margem_padrao: float = 30.0,
+                      tamanho_bloco: int = TAMANHO_BLOCO) -> ResultadoImportacao:
+    """Lê o arquivo em blocos e devolve os produtos válidos (num único DF) e as linhas rejeitadas."""
+    data_padrao = pd.to_datetime("today").normalize().strftime("%Y-%m-%d")
+    validos, erros = [], []
+    reconhecidas, ignoradas = {}, []
+    total = 0
+    for bloco in ler_em_blocos(arquivo, nome_arquivo, tamanho_bloco):
+        if not reconhecidas and not ignoradas:
+            for cabecalho in bloco.columns:
+                destino = _coluna_destino(cabecalho)
+                if destino and destino not in reconhecidas.values():
+                    reconhecidas[cabecalho] = destino
+                else:
+                    ignoradas.append(str(cabecalho))
+            if "Produto" not in reconhecidas.values():
+                raise ValueError("A planilha precisa de uma coluna de nome do produto (ex.: 'Produto').")
+            if "Custo Unitário" not in reconhecidas.values():
+                raise ValueError("A planilha precisa de uma coluna de custo (ex.: 'Custo Unitário').")
+        bloco = bloco[list(reconhecidas)].rename(columns=reconhecidas)
+        # Linha 1 é o cabeçalho: a primeira linha de dados é a 2 (como no Excel)
+        produtos, erros_bloco = converter_bloco(bloco, total + 2, margem_padrao, data_padrao)
+        validos.append(produtos)
+        erros.append(erros_bloco)
+        total += len(bloco)
+
+    produtos = pd.concat(validos, ignore_index=True) if validos else pd.DataFrame(columns=COLUNAS_IMPORTADAS)
+    erros = pd.concat(erros, ignore_index=True) if erros else pd.DataFrame(columns=["Linha", "Produto", "Motivo"])
+    return ResultadoImportacao(produtos[COLUNAS_IMPORTADAS], erros, reconhecidas, ignoradas, total)
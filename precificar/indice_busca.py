@@ -0,0 +1,229 @@
+"""
+Busca conforme se digita nos DataFrames da sessão (produtos, insumos).
+
+O texto das colunas pesquisáveis é normalizado (minúsculas, sem acentos) e
+quebrado em termos; o índice guarda termo -> linhas, o vocabulário ordenado
+(para completar o termo que está sendo digitado) e trigrama -> termos (para
+achar termos com erro de digitação). Uma consulta só toca as listas dos termos
+candidatos e pontua as linhas com operações vetorizadas, então o custo não
+cresce com varreduras do DF inteiro.
+
+Registrado como ouvinte de um RastreadorAlteracoes, o índice só re-tokeniza as
+linhas marcadas como editadas ou incluídas.
+"""
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# Pontos de uma linha por termo da consulta, conforme o termo da linha que casou
+PESO_EXATO = 1.0
+PESO_PREFIXO = 0.8
+PESO_APROXIMADO = 0.6
+# Semelhança (Dice dos trigramas) mínima para aceitar um termo com erro de digitação
+SIMILARIDADE_MINIMA = 0.5
+# Termos do vocabulário considerados ao completar um prefixo curto (ex.: "a")
+MAX_EXPANSOES_PREFIXO = 500
+
+_NAO_ALFANUMERICO = re.compile(r"[^0-9a-z]+")
+
+
+def normalizar(texto) -> str:
+    """Minúsculas, sem acentos, só letras e números separados por espaço."""
+    texto = str(texto)
+    if not texto.isascii():
+        # Separa os acentos (NFKD) e descarta o que não é ASCII
+        texto = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return _NAO_ALFANUMERICO.sub(" ", texto.lower()).strip()
+
+
+def trigramas(termo: str) -> set:
+    marcado = f"${termo}$"
+    return {marcado[i:i + 3] for i in range(len(marcado) - 2)}
+
+
+class IndiceBusca:
+    """Índice invertido (termos e trigramas) das `colunas` de um DataFrame, por posição da linha."""
+
+    def __init__(self, colunas):
+        self.colunas = tuple(colunas)
+        self._termos_linha = []  # frozenset de termos de cada linha
+        self._linhas = {}  # termo -> set de posições
+        self._vocabulario = []  # termos em ordem alfabética
+        self._trigramas = {}  # trigrama -> set de termos
+        self._posicoes_cache = {}  # termo -> np.ndarray das posições
+        self._pendentes = set()
+        self._completo = True
+        self._colunas_df = None
+
+    def definir_colunas(self, colunas):
+        """Troca as colunas pesquisadas (ex.: um campo personalizado novo); reconstrói na próxima busca."""
+        colunas = tuple(colunas)
+        if colunas != self.colunas:
+            self.colunas = colunas
+            self._completo = True
+
+    # --- Interface de ouvinte do RastreadorAlteracoes ---
+    def reiniciar(self, *args, **kwargs):
+        self._completo = True
+        self._pendentes.clear()
+
+    def marcar_linhas(self, posicoes):
+        self._pendentes.update(int(p) for p in posicoes)
+
+    def marcar_inclusao(self, quantidade: int = 1):
+        if self._completo:
+            return
+        inicio = len(self._termos_linha)
+        self._termos_linha.extend([frozenset()] * quantidade)
+        self._pendentes.update(range(inicio, inicio + quantidade))
+
+    def marcar_exclusao(self, posicoes):
+        if self._completo:
+            return
+        posicoes = sorted({int(p) for p in posicoes if 0 <= int(p) < len(self._termos_linha)})
+        if not posicoes:
+            return
+        removidas, conjunto = np.asarray(posicoes), set(posicoes)
+        self._termos_linha = [t for p, t in enumerate(self._termos_linha) if p not in conjunto]
+        self._pendentes = {
+            p - int(np.searchsorted(removidas, p)) for p in self._pendentes if p not in conjunto
+        }
+        # As posições seguintes mudam: refaz as listas a partir dos termos já calculados (sem re-tokenizar)
+        self._reconstruir()
+
+    # --- Manutenção ---
+    def _tokenizar(self, df: pd.DataFrame) -> list:
+        colunas = [c for c in self.colunas if c in df.columns]
+        termos = [set() for _ in range(len(df))]
+        for col in colunas:
+            cache = {}  # Valores repetidos (cor, marca, categoria) são normalizados uma vez
+            for i, valor in enumerate(df[col].tolist()):
+                if valor is None or (isinstance(valor, float) and np.isnan(valor)):
+                    continue
+                partes = cache.get(valor)
+                if partes is None:
+                    partes = cache[valor] = normalizar(valor).split()
+                termos[i].update(partes)
+        return [frozenset(t) for t in termos]
+
+    def _reconstruir(self):
+        linhas = {}
+        for pos, termos in enumerate(self._termos_linha):
+            for termo in termos:
+                linhas.setdefault(termo, set()).add(pos)
+        self._linhas = linhas
+        self._vocabulario = sorted(linhas)
+        self._trigramas = {}
+        for termo in self._vocabulario:
+            if termo.isdigit():
+                continue  # Números (códigos, medidas) só casam por prefixo
+            for tri in trigramas(termo):
+                self._trigramas.setdefault(tri, set()).add(termo)
+        self._posicoes_cache.clear()
+
+    def _adicionar(self, termo: str, pos: int):
+        linhas = self._linhas.get(termo)
+        if linhas is None:
+            linhas = self._linhas[termo] = set()
+            insort(self._vocabulario, termo)
+            for tri in (() if termo.isdigit() else trigramas(termo)):
+                self._trigramas.setdefault(tri, set()).add(termo)
+        linhas.add(pos)
+        self._posicoes_cache.pop(termo, None)
+
+    def _remover(self, termo: str, pos: int):
+        linhas = self._linhas.get(termo)
+        if linhas is None:
+            return
+        linhas.discard(pos)
+        self._posicoes_cache.pop(termo, None)
+        if not linhas:
+            del self._linhas[termo]
+            del self._vocabulario[bisect_left(self._vocabulario, termo)]
+            for tri in (() if termo.isdigit() else trigramas(termo)):
+                termos = self._trigramas.get(tri)
+                if termos is not None:
+                    termos.discard(termo)
+                    if not termos:
+                        del self._trigramas[tri]
+
+    def _atualizar(self, df: pd.DataFrame):
+        colunas_df = tuple(c for c in self.colunas if c in df.columns)
+        if self._completo or len(self._termos_linha) != len(df) or colunas_df != self._colunas_df:
+            # Carga, recarga ou alteração não marcada: tokeniza o DF inteiro
+            self._termos_linha = self._tokenizar(df)
+            self._colunas_df = colunas_df
+            self._reconstruir()
+            self._pendentes.clear()
+            self._completo = False
+        elif self._pendentes:
+            posicoes = sorted(p for p in self._pendentes if p < len(df))
+            for pos, novos in zip(posicoes, self._tokenizar(df.iloc[posicoes])):
+                antigos = self._termos_linha[pos]
+                for termo in antigos - novos:
+                    self._remover(termo, pos)
+                for termo in novos - antigos:
+                    self._adicionar(termo, pos)
+                self._termos_linha[pos] = novos
+            self._pendentes.clear()
+
+    # --- Consultas ---
+    def _posicoes(self, termo: str) -> np.ndarray:
+        posicoes = self._posicoes_cache.get(termo)
+        if posicoes is None:
+            linhas = self._linhas[termo]
+            posicoes = self._posicoes_cache[termo] = np.fromiter(linhas, dtype=np.int64, count=len(linhas))
+        return posicoes
+
+    def _candidatos(self, termo: str) -> dict:
+        """Termos do vocabulário que casam com `termo` da consulta -> peso (exato, prefixo ou aproximado)."""
+        candidatos = {}
+        if termo in self._linhas:
+            candidatos[termo] = PESO_EXATO
+        i = bisect_left(self._vocabulario, termo)
+        fim = min(i + MAX_EXPANSOES_PREFIXO, len(self._vocabulario))
+        while i < fim and self._vocabulario[i].startswith(termo):
+            candidatos.setdefault(self._vocabulario[i], PESO_PREFIXO)
+            i += 1
+        if len(termo) >= 3 and not termo.isdigit():
+            tris = trigramas(termo)
+            comuns = Counter()
+            for tri in tris:
+                comuns.update(self._trigramas.get(tri, ()))
+            for candidato, n in comuns.items():
+                similaridade = 2 * n / (len(tris) + len(trigramas(candidato)))
+                if similaridade >= SIMILARIDADE_MINIMA:
+                    candidatos.setdefault(candidato, PESO_APROXIMADO * similaridade)
+        return candidatos
+
+    def buscar(self, df: pd.DataFrame, consulta: str, limite: Optional[int] = 50) -> np.ndarray:
+        """
+        Posições (iloc) das linhas que casam com todos os termos da `consulta`, da mais relevante
+        para a menos (empate: ordem do DF). `limite=None` devolve todas.
+        """
+        self._atualizar(df)
+        termos = normalizar(consulta).split()
+        n = len(self._termos_linha)
+        if not termos:
+            return np.arange(n if limite is None else min(n, limite))
+
+        total = np.zeros(n, dtype=np.float32)
+        todas = np.ones(n, dtype=bool)
+        for termo in termos:
+            pontos = np.zeros(n, dtype=np.float32)
+            for candidato, peso in self._candidatos(termo).items():
+                posicoes = self._posicoes(candidato)
+                pontos[posicoes] = np.maximum(pontos[posicoes], peso)
+            total += pontos
+            todas &= pontos > 0
+        encontradas = np.flatnonzero(todas)
+        if limite is not None and len(encontradas) > limite:
+            # Só as `limite` melhores são ordenadas
+            melhores = np.argpartition(-total[encontradas], limite - 1)[:limite]
+            encontradas = np.sort(encontradas[melhores])
+        return encontradas[np.argsort(-total[encontradas], kind="stable")]
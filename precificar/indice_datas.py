@@ -0,0 +1,99 @@
+"""
+Índice ordenado das datas de cadastro para o filtro por período dos relatórios.
+
+Em vez de converter `Data_Cadastro` com `pd.to_datetime` e montar duas máscaras
+a cada rerun, as datas ficam convertidas (datetime64) numa array por posição,
+junto com as posições ordenadas por data. Um período vira duas buscas binárias.
+Registrado como ouvinte do RastreadorAlteracoes da precificação, o índice só
+reconverte as linhas marcadas como editadas ou incluídas.
+"""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+def converter_datas(valores: pd.Series) -> np.ndarray:
+    """
+    Datas normalizadas (meia-noite) como datetime64[ns]; valores inválidos viram NaT.
+    Datas ISO (o formato gravado pelo app) são convertidas de uma vez; os demais valores
+    (ex.: DD/MM/AAAA vindos da coluna antiga `Data Cadastro`) um a um, com o dia primeiro.
+    """
+    datas = pd.to_datetime(valores, errors="coerce", format="ISO8601")
+    restantes = datas.isna() & valores.notna()
+    if restantes.any():
+        datas[restantes] = pd.to_datetime(valores[restantes], errors="coerce", dayfirst=True, format="mixed")
+    return datas.dt.normalize().to_numpy(dtype="datetime64[ns]", copy=True)
+
+
+class IndiceDatas:
+    """Datas de `coluna` por posição e as posições em ordem de data (NaT ficam de fora)."""
+
+    def __init__(self, coluna: str = "Data_Cadastro"):
+        self.coluna = coluna
+        self._datas = None  # datetime64[ns] por posição
+        self._ordem = None  # Posições com data válida, ordenadas por data
+        self._pendentes = set()
+        self._completo = True
+
+    # --- Interface de ouvinte do RastreadorAlteracoes ---
+    def reiniciar(self, *args, **kwargs):
+        self._completo = True
+        self._pendentes.clear()
+
+    def marcar_linhas(self, posicoes):
+        self._pendentes.update(int(p) for p in posicoes)
+
+    def marcar_inclusao(self, quantidade: int = 1):
+        if self._completo or self._datas is None:
+            return
+        inicio = len(self._datas)
+        self._datas = np.concatenate([self._datas, np.full(quantidade, np.datetime64("NaT"), dtype="datetime64[ns]")])
+        self._pendentes.update(range(inicio, inicio + quantidade))
+
+    def marcar_exclusao(self, posicoes):
+        if self._completo or self._datas is None:
+            return
+        posicoes = sorted({int(p) for p in posicoes if 0 <= int(p) < len(self._datas)})
+        if not posicoes:
+            return
+        self._datas = np.delete(self._datas, posicoes)
+        removidas, conjunto = np.asarray(posicoes), set(posicoes)
+        self._pendentes = {
+            p - int(np.searchsorted(removidas, p)) for p in self._pendentes if p not in conjunto
+        }
+        self._ordem = None
+
+    # --- Consultas ---
+    def _atualizar(self, df: pd.DataFrame):
+        if self.coluna not in df.columns:
+            self._datas = np.full(len(df), np.datetime64("NaT"), dtype="datetime64[ns]")
+            self._ordem, self._pendentes, self._completo = None, set(), True
+        elif self._completo or self._datas is None or len(self._datas) != len(df):
+            # Carga, recarga ou alteração não marcada: converte a coluna inteira
+            self._datas = converter_datas(df[self.coluna])
+            self._ordem, self._completo = None, False
+            self._pendentes.clear()
+        elif self._pendentes:
+            posicoes = sorted(p for p in self._pendentes if p < len(df))
+            self._datas[posicoes] = converter_datas(df[self.coluna].iloc[posicoes])
+            self._ordem = None
+            self._pendentes.clear()
+        if self._ordem is None:
+            validas = np.flatnonzero(~np.isnat(self._datas))
+            self._ordem = validas[np.argsort(self._datas[validas], kind="stable")]
+
+    def limites(self, df: pd.DataFrame) -> Optional[tuple]:
+        """(menor, maior) data válida como Timestamp, ou None se nenhuma linha tem data."""
+        self._atualizar(df)
+        if not len(self._ordem):
+            return None
+        return pd.Timestamp(self._datas[self._ordem[0]]), pd.Timestamp(self._datas[self._ordem[-1]])
+
+    def posicoes_entre(self, df: pd.DataFrame, inicio, fim) -> np.ndarray:
+        """Posições (em ordem do DF) das linhas com `inicio` <= data <= `fim` (datas inclusivas)."""
+        self._atualizar(df)
+        ordenadas = self._datas[self._ordem]
+        a = np.searchsorted(ordenadas, np.datetime64(pd.Timestamp(inicio).normalize(), "ns"), side="left")
+        b = np.searchsorted(ordenadas, np.datetime64(pd.Timestamp(fim).normalize(), "ns"), side="right")
+        return np.sort(self._ordem[a:b])
@@ -0,0 +1,68 @@
+"""
+Índice nome -> linha para os DataFrames da sessão (insumos, produtos).
+
+Evita as varreduras `df.loc[df["Nome"] == nome]` dentro de laços: o índice é
+montado uma vez (O(n)) e cada consulta custa O(1) até a próxima alteração do DF.
+Registrado como ouvinte de um RastreadorAlteracoes, ele é invalidado pelas mesmas
+marcações que os caminhos de alteração já fazem.
+"""
+import pandas as pd
+
+
+class IndiceNomes:
+    """Mapeia o valor de `coluna` para as posições das linhas que o contêm (em ordem)."""
+
+    def __init__(self, coluna: str):
+        self.coluna = coluna
+        self._df = None
+        self._posicoes = {}
+
+    # --- Interface de ouvinte do RastreadorAlteracoes ---
+    def reiniciar(self):
+        self._df = None
+
+    def marcar_linhas(self, posicoes):
+        self._df = None
+
+    def marcar_inclusao(self, quantidade: int = 1):
+        self._df = None
+
+    def marcar_exclusao(self, posicoes):
+        self._df = None
+
+    # --- Consultas ---
+    def _atualizar(self, df: pd.DataFrame):
+        # O DF trocado por outro objeto (ex.: recarga do CSV) também invalida o índice
+        if self._df is df:
+            return
+        posicoes = {}
+        if self.coluna in df.columns:
+            for pos, nome in enumerate(df[self.coluna].tolist()):
+                if isinstance(nome, str) or pd.notna(nome):
+                    posicoes.setdefault(str(nome), []).append(pos)
+        self._posicoes = posicoes
+        self._df = df
+
+    def posicoes(self, df: pd.DataFrame, nome) -> list:
+        """Posições (iloc) das linhas com `nome`; lista vazia se não houver."""
+        self._atualizar(df)
+        return self._posicoes.get(str(nome), [])
+
+    def posicao(self, df: pd.DataFrame, nome):
+        """Posição da primeira linha com `nome`, ou None."""
+        posicoes = self.posicoes(df, nome)
+        return posicoes[0] if posicoes else None
+
+    def linha(self, df: pd.DataFrame, nome):
+        """Primeira linha com `nome` (Series), ou None."""
+        pos = self.posicao(df, nome)
+        return None if pos is None else df.iloc[pos]
+
+    def nomes(self, df: pd.DataFrame) -> list:
+        """Nomes distintos, na ordem da primeira ocorrência (como `df[coluna].dropna().unique()`)."""
+        self._atualizar(df)
+        return list(self._posicoes)
+
+    def contem(self, df: pd.DataFrame, nome) -> bool:
+        self._atualizar(df)
+        return str(nome) in self._posicoes
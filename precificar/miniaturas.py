@@ -0,0 +1,281 @@
+"""
+Miniaturas das imagens dos produtos, geradas no servidor.
+
+Cada `Imagem_URL` é baixada uma única vez, reduzida com o Pillow para as larguras
+usadas no app (cartões, catálogo, Telegram) e gravada num cache em disco com limite de
+tamanho: ao passar do limite, as miniaturas usadas há mais tempo são apagadas
+(LRU). O navegador e o Telegram recebem só os bytes já reduzidos.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+from precificar import cliente_http
+
+DIRETORIO_MINIATURAS = os.environ.get(
+    "PRECIFICAR_MINIATURAS_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "miniaturas"),
+)
+LIMITE_BYTES_PADRAO = int(float(os.environ.get("PRECIFICAR_MINIATURAS_MAX_MB", "200")) * 1024 * 1024)
+
+# Larguras (px) usadas no app. O cartão é exibido com 100px: 200px fica nítido em telas de alta densidade.
+LARGURA_CARTAO = 200
+LARGURA_CATALOGO = 400  # foto do catálogo em PDF (~6cm a 170dpi)
+LARGURA_TELEGRAM = 1280  # o Telegram reduz fotos maiores que isso de qualquer forma
+LARGURAS_PADRAO = (LARGURA_CARTAO, LARGURA_CATALOGO, LARGURA_TELEGRAM)
+
+# Depois de uma falha no download, a URL só é tentada de novo após este intervalo (segundos)
+ESPERA_APOS_FALHA = 300
+TAMANHO_MAXIMO_ORIGINAL = 30 * 1024 * 1024
+
+
+def _baixar(url: str) -> bytes:
+    """
+    Baixa `url` em partes e desiste assim que o tamanho passa de TAMANHO_MAXIMO_ORIGINAL
+    (pelo Content-Length, antes de ler o corpo, ou no meio da leitura): uma URL enorme ou
+    maliciosa não é baixada inteira para a memória.
+    """
+    with cliente_http.get(url, stream=True) as resposta:
+        resposta.raise_for_status()
+        tamanho = resposta.headers.get("Content-Length", "")
+        if tamanho.isdigit() and int(tamanho) > TAMANHO_MAXIMO_ORIGINAL:
+            raise ValueError("imagem grande demais")
+        partes, total = [], 0
+        for parte in resposta.iter_content(64 * 1024):
+            total += len(parte)
+            if total > TAMANHO_MAXIMO_ORIGINAL:
+                raise ValueError("imagem grande demais")
+            partes.append(parte)
+        return b"".join(partes)
+
+
+def _salvar(img: Image.Image) -> tuple:
+    saida = BytesIO()
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img.save(saida, format="PNG", optimize=True)
+        return saida.getvalue(), "png"
+    img.convert("RGB").save(saida, format="JPEG", quality=85, optimize=True)
+    return saida.getvalue(), "jpg"
+
+
+def reduzir_imagem_varias(conteudo: bytes, larguras) -> dict:
+    """
+    Reduz a imagem para cada largura (caixa `largura` x `largura`, mantendo a proporção e
+    nunca ampliando). A imagem é decodificada uma única vez; JPEGs são decodificados já em
+    escala reduzida (draft) quando a maior largura pedida permite.
+    Retorna largura -> (bytes, extensão): JPEG para imagens opacas, PNG quando há transparência.
+    """
+    larguras = sorted(set(larguras), reverse=True)
+    with Image.open(BytesIO(conteudo)) as img:
+        if img.format == "JPEG":
+            img.draft("RGB", (larguras[0], larguras[0]))
+        img = ImageOps.exif_transpose(img)
+        img.load()
+        resultado = {}
+        for largura in larguras:
+            # Da maior para a menor: cada redução parte da anterior, que já é menor que a original
+            img.thumbnail((largura, largura), Image.LANCZOS)
+            resultado[largura] = _salvar(img)
+        return resultado
+
+
+def reduzir_imagem(conteudo: bytes, largura: int) -> tuple:
+    """Reduz a imagem para caber em `largura` x `largura`. Retorna (bytes, extensão)."""
+    return reduzir_imagem_varias(conteudo, [largura])[largura]
+
+
+class CacheMiniaturas:
+    """Miniaturas por (URL ou conteúdo, largura) num diretório com limite de tamanho e remoção LRU."""
+
+    def __init__(self, diretorio: str = DIRETORIO_MINIATURAS, limite_bytes: int = LIMITE_BYTES_PADRAO,
+                 larguras=LARGURAS_PADRAO):
+        self.diretorio = diretorio
+        self.limite_bytes = limite_bytes
+        self.larguras = tuple(larguras)
+        self._lock = threading.Lock()
+        self._locks_chave = {}  # chave -> [lock, threads usando]; sai quando ninguém usa
+        self._falhas = OrderedDict()  # url -> instante da última falha, da mais antiga à mais recente
+        self._arquivos = None  # nome do arquivo -> tamanho, do usado há mais tempo ao mais recente
+        self._total = 0
+
+    # --- Índice LRU do diretório ---
+    def _carregar_indice(self):
+        """Lê o diretório uma vez (ordem pela data de modificação, que é atualizada a cada uso)."""
+        if self._arquivos is not None:
+            return
+        entradas = []
+        try:
+            for nome in os.listdir(self.diretorio):
+                if nome.endswith(".tmp"):
+                    continue
+                try:
+                    info = os.stat(os.path.join(self.diretorio, nome))
+                except OSError:
+                    continue
+                entradas.append((info.st_mtime, nome, info.st_size))
+        except OSError:
+            pass
+        entradas.sort()
+        self._arquivos = OrderedDict((nome, tamanho) for _, nome, tamanho in entradas)
+        self._total = sum(self._arquivos.values())
+
+    def _ler(self, nome: str) -> Optional[bytes]:
+        caminho = os.path.join(self.diretorio, nome)
+        with self._lock:
+            self._carregar_indice()
+            if nome not in self._arquivos:
+                return None
+            self._arquivos.move_to_end(nome)
+        try:
+            with open(caminho, "rb") as f:
+                conteudo = f.read()
+            os.utime(caminho)  # Mantém a ordem LRU entre reinícios do processo
+            return conteudo
+        except OSError:
+            with self._lock:
+                self._total -= self._arquivos.pop(nome, 0)
+            return None
+
+    def _gravar(self, nome: str, conteudo: bytes):
+        caminho = os.path.join(self.diretorio, nome)
+        try:
+            os.makedirs(self.diretorio, exist_ok=True)
+            tmp = caminho + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(conteudo)
+            os.replace(tmp, caminho)
+        except OSError:
+            return  # O cache é só otimização; falha de disco não pode quebrar a exibição
+        with self._lock:
+            self._carregar_indice()
+            self._total += len(conteudo) - self._arquivos.pop(nome, 0)
+            self._arquivos[nome] = len(conteudo)
+            while self._total > self.limite_bytes and len(self._arquivos) > 1:
+                antigo, tamanho = self._arquivos.popitem(last=False)
+                self._total -= tamanho
+                try:
+                    os.remove(os.path.join(self.diretorio, antigo))
+                except OSError:
+                    pass
+
+    @contextmanager
+    def _lock_chave(self, chave: str):
+        """Lock da chave, descartado quando a última thread que o usa termina."""
+        with self._lock:
+            entrada = self._locks_chave.setdefault(chave, [threading.Lock(), 0])
+            entrada[1] += 1
+        try:
+            with entrada[0]:
+                yield
+        finally:
+            with self._lock:
+                entrada[1] -= 1
+                if not entrada[1]:
+                    del self._locks_chave[chave]
+
+    def _falhou_ha_pouco(self, url: str) -> bool:
+        """Se `url` falhou há menos de ESPERA_APOS_FALHA; as falhas já vencidas são descartadas."""
+        agora = time.time()
+        with self._lock:
+            while self._falhas and agora - next(iter(self._falhas.values())) >= ESPERA_APOS_FALHA:
+                self._falhas.popitem(last=False)
+            return url in self._falhas
+
+    def _registrar_falha(self, url: str):
+        with self._lock:
+            self._falhas.pop(url, None)
+            self._falhas[url] = time.time()
+
+    def _procurar(self, chave: str, largura: int) -> Optional[bytes]:
+        for extensao in ("jpg", "png"):
+            conteudo = self._ler(f"{chave}_{largura}.{extensao}")
+            if conteudo is not None:
+                return conteudo
+        return None
+
+    def _gerar(self, chave: str, original: bytes, largura: int) -> Optional[bytes]:
+        """
+        Gera e grava a miniatura pedida e as das larguras padrão menores que ela (saem quase de
+        graça da mesma decodificação); retorna a pedida. As maiores só são geradas quando pedidas:
+        reduzir para 1280px custa bem mais do que para 200/400px.
+        """
+        try:
+            reduzidas = reduzir_imagem_varias(original, [w for w in self.larguras if w < largura] + [largura])
+        except Exception:
+            return None  # Não é uma imagem que o Pillow consiga abrir
+        for w, (conteudo, extensao) in reduzidas.items():
+            self._gravar(f"{chave}_{w}.{extensao}", conteudo)
+        return reduzidas[largura][0]
+
+    # --- API pública ---
+    def obter(self, url: str, largura: int = LARGURA_CARTAO) -> Optional[bytes]:
+        """
+        Miniatura da imagem em `url`, ou None se não foi possível baixá-la/abri-la
+        (o chamador pode cair na URL original).
+        """
+        if not isinstance(url, str) or not url.startswith("http"):
+            return None
+        chave = hashlib.sha256(url.encode()).hexdigest()[:32]
+        conteudo = self._procurar(chave, largura)
+        if conteudo is not None:
+            return conteudo
+
+        with self._lock_chave(chave):
+            # Outra thread pode ter gerado enquanto esperávamos
+            conteudo = self._procurar(chave, largura)
+            if conteudo is not None:
+                return conteudo
+            if self._falhou_ha_pouco(url):
+                return None
+            try:
+                original = _baixar(url)
+            except Exception:
+                self._registrar_falha(url)
+                return None
+            conteudo = self._gerar(chave, original, largura)
+            if conteudo is None:
+                self._registrar_falha(url)
+            return conteudo
+
+    def obter_de_bytes(self, original: bytes, largura: int = LARGURA_CARTAO) -> Optional[bytes]:
+        """Miniatura de uma imagem já em memória (ex.: upload), endereçada pelo hash do conteúdo."""
+        if not original:
+            return None
+        chave = "b" + hashlib.sha256(original).hexdigest()[:31]
+        conteudo = self._procurar(chave, largura)
+        if conteudo is not None:
+            return conteudo
+        with self._lock_chave(chave):
+            return self._procurar(chave, largura) or self._gerar(chave, original, largura)
+
+    def preparar(self, urls, largura: int = LARGURA_CARTAO, max_workers: int = 8) -> dict:
+        """
+        Obtém as miniaturas de várias URLs em paralelo (ex.: a página de cartões visível).
+        Retorna url -> bytes (ou None). Os downloads respeitam o limite por host do cliente_http.
+        """
+        urls = [u for u in dict.fromkeys(urls) if isinstance(u, str) and u.startswith("http")]
+        if not urls:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+            return dict(zip(urls, executor.map(lambda u: self.obter(u, largura), urls)))
+
+
+_miniaturas = None
+_miniaturas_lock = threading.Lock()
+
+
+def obter_miniaturas() -> CacheMiniaturas:
+    """Instância única do cache de miniaturas, compartilhada por todas as sessões do processo."""
+    global _miniaturas
+    with _miniaturas_lock:
+        if _miniaturas is None:
+            _miniaturas = CacheMiniaturas()
+        return _miniaturas
@@ -0,0 +1,75 @@
+"""
+Motor de precificação vetorizado (sem dependência do Streamlit).
+
+Todas as funções aceitam escalares, arrays NumPy ou Series do pandas e usam só
+operações elemento a elemento, então servem tanto para a prévia de um produto
+no formulário quanto para reprecificar o catálogo inteiro (ou um lote de milhões
+de itens) de uma vez. As fórmulas são as mesmas de processar_dataframe.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+# Taxa de cartão de 11.28%: o preço no cartão é o preço à vista dividido por 0.8872
+FATOR_CARTAO = 0.8872
+
+
+class ResultadoPrecificacao(NamedTuple):
+    custo_total: np.ndarray
+    preco_vista: np.ndarray
+    preco_cartao: np.ndarray
+
+
+def rateio_unitario(frete_total, custos_extras, qtd_total):
+    """Rateio global por unidade: (frete + custos extras) / quantidade total (0 se não há quantidade)."""
+    if qtd_total > 0:
+        return (frete_total + custos_extras) / qtd_total
+    return 0.0
+
+
+def custo_total(custo, extras, rateio):
+    """Custo total unitário = custo base + custos extras específicos + rateio global."""
+    return custo + extras + rateio
+
+
+def preco_a_vista(custo_total_unitario, margem):
+    """Preço à vista aplicando a margem (%) sobre o custo total."""
+    return custo_total_unitario * (1 + margem / 100)
+
+
+def preco_cartao(preco_vista):
+    """Preço no cartão, repassando a taxa da maquininha."""
+    return preco_vista / FATOR_CARTAO
+
+
+def margem_necessaria(preco_alvo, custo_total_unitario):
+    """
+    Margem (%) que leva `custo_total_unitario` até `preco_alvo`.
+    Onde o custo é zero (ou negativo) a margem é 0.0.
+    """
+    preco = np.asarray(preco_alvo, dtype=float)
+    custo = np.asarray(custo_total_unitario, dtype=float)
+    positivo = custo > 0
+    razao = np.divide(preco, custo, out=np.ones(np.broadcast(preco, custo).shape), where=positivo)
+    margem = np.where(positivo, (razao - 1) * 100, 0.0)
+    return margem if margem.ndim else float(margem)
+
+
+def precificar(custo, extras=0.0, rateio=0.0, margem=0.0) -> ResultadoPrecificacao:
+    """
+    Precifica um item ou um lote: (custo, extras, rateio, margem) -> custo total, à vista e cartão.
+    Os argumentos podem ser escalares ou arrays do mesmo tamanho (com broadcast).
+    """
+    total = custo_total(custo, extras, rateio)
+    vista = preco_a_vista(total, margem)
+    return ResultadoPrecificacao(total, vista, preco_cartao(vista))
+
+
+def precificar_lote(custo, extras, rateio, margem) -> ResultadoPrecificacao:
+    """Versão em lote de `precificar`: converte as entradas para arrays float64 antes do cálculo."""
+    return precificar(
+        np.asarray(custo, dtype=float),
+        np.asarray(extras, dtype=float),
+        np.asarray(rateio, dtype=float),
+        np.asarray(margem, dtype=float),
+    )
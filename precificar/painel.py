@@ -0,0 +1,244 @@
+"""
+Painel de resumo do catálogo: quantidade de produtos, margem média, custo do estoque
+(Qtd × Custo Total Unitário) e valor do estoque à vista (Qtd × Preço à Vista),
+agrupados por Marca, Cor, Categoria e mês de cadastro.
+
+`AgregadosCatalogo` guarda a contribuição de cada linha e as somas de cada grupo.
+Registrado como ouvinte do RastreadorAlteracoes, ele só desconta e soma de novo as
+linhas marcadas; uma mudança que afeta todas as linhas (frete, custos extras, modo
+de margem ou o rateio) refaz os agrupamentos de uma vez. Os gráficos (matplotlib)
+são desenhados uma vez por versão dos dados.
+"""
+from io import BytesIO
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+from precificar.indice_datas import converter_datas
+
+# Nome do agrupamento -> coluna do DF (os que não existem no DF são ignorados)
+DIMENSOES = {
+    "Marca": "Marca",
+    "Cor": "Cor",
+    "Categoria": "Categoria",
+    "Mês de cadastro": "Data_Cadastro",
+}
+DIMENSAO_MES = "Mês de cadastro"
+SEM_VALOR = "(sem valor)"
+# Grupos exibidos no gráfico (os de maior custo de estoque; por mês, os mais recentes)
+MAX_GRUPOS_GRAFICO = 15
+
+# Colunas de _valores: produtos, soma das margens, custo do estoque, valor à vista
+_PRODUTOS, _MARGEM, _CUSTO, _VISTA = range(4)
+
+
+def _numero(df: pd.DataFrame, coluna: str) -> np.ndarray:
+    if coluna not in df.columns:
+        return np.zeros(len(df))
+    return pd.to_numeric(df[coluna], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+
+
+def _valores_linhas(df: pd.DataFrame) -> np.ndarray:
+    """Contribuição de cada linha para as somas (uma linha por produto, uma coluna por métrica)."""
+    qtd = _numero(df, "Qtd")
+    valores = np.empty((len(df), 4))
+    valores[:, _PRODUTOS] = 1.0
+    valores[:, _MARGEM] = _numero(df, "Margem (%)")
+    valores[:, _CUSTO] = qtd * _numero(df, "Custo Total Unitário")
+    valores[:, _VISTA] = qtd * _numero(df, "Preço à Vista")
+    return valores
+
+
+def _grupos_linhas(df: pd.DataFrame, dimensao: str, coluna: str) -> list:
+    """Grupo de cada linha na `dimensao` (texto; mês como AAAA-MM)."""
+    if dimensao == DIMENSAO_MES:
+        datas = pd.Series(converter_datas(df[coluna]))
+        return datas.dt.strftime("%Y-%m").fillna(SEM_VALOR).tolist()
+    valores = df[coluna].astype(object).where(df[coluna].notna(), "")
+    return [str(v).strip() or SEM_VALOR for v in valores.tolist()]
+
+
+class AgregadosCatalogo:
+    """Somas por grupo de cada dimensão, mantidas conforme as linhas do DF mudam."""
+
+    def __init__(self, dimensoes: Optional[dict] = None):
+        self.dimensoes = DIMENSOES if dimensoes is None else dimensoes
+        self.versao = 0  # Muda sempre que alguma soma muda (invalida os gráficos)
+        self._valores = None
+        self._grupos = {}  # dimensão -> grupo de cada linha
+        self._somas = {}  # dimensão -> {grupo: np.ndarray(4)}
+        self._pendentes = set()
+        self._completo = True
+        self._chave = None  # Parâmetros que afetam todas as linhas
+        self._graficos = {}  # dimensão -> PNG (da versão atual)
+
+    # --- Interface de ouvinte do RastreadorAlteracoes ---
+    def reiniciar(self, *args, **kwargs):
+        self._completo = True
+        self._pendentes.clear()
+
+    def marcar_linhas(self, posicoes):
+        self._pendentes.update(int(p) for p in posicoes)
+
+    def marcar_inclusao(self, quantidade: int = 1):
+        if self._completo or self._valores is None:
+            return
+        inicio = len(self._valores)
+        # Linhas novas ainda sem contribuição (somadas no próximo atualizar)
+        self._valores = np.vstack([self._valores, np.zeros((quantidade, 4))])
+        for grupos in self._grupos.values():
+            grupos.extend([None] * quantidade)
+        self._pendentes.update(range(inicio, inicio + quantidade))
+
+    def marcar_exclusao(self, posicoes):
+        if self._completo or self._valores is None:
+            return
+        posicoes = sorted({int(p) for p in posicoes if 0 <= int(p) < len(self._valores)})
+        if not posicoes:
+            return
+        for pos in posicoes:
+            self._mover(pos, None)
+        conjunto, removidas = set(posicoes), np.asarray(posicoes)
+        self._valores = np.delete(self._valores, posicoes, axis=0)
+        for dimensao, grupos in self._grupos.items():
+            self._grupos[dimensao] = [g for p, g in enumerate(grupos) if p not in conjunto]
+        self._pendentes = {
+            p - int(np.searchsorted(removidas, p)) for p in self._pendentes if p not in conjunto
+        }
+        self._mudou()
+
+    # --- Manutenção ---
+    def _mudou(self):
+        self.versao += 1
+        self._graficos.clear()
+
+    def _mover(self, pos: int, novos_grupos: Optional[dict], novos_valores: Optional[np.ndarray] = None):
+        """Desconta a linha `pos` dos grupos atuais e, se `novos_grupos`, soma os novos valores neles."""
+        antigos = self._valores[pos]
+        for dimensao, grupos in self._grupos.items():
+            grupo = grupos[pos]
+            if grupo is not None:
+                somas = self._somas[dimensao]
+                somas[grupo] = somas[grupo] - antigos
+                if somas[grupo][_PRODUTOS] < 0.5:  # Último produto do grupo
+                    del somas[grupo]
+            if novos_grupos is not None:
+                grupo = grupos[pos] = novos_grupos[dimensao]
+                somas = self._somas[dimensao]
+                somas[grupo] = somas.get(grupo, np.zeros(4)) + novos_valores
+        if novos_valores is not None:
+            self._valores[pos] = novos_valores
+
+    def _recalcular(self, df: pd.DataFrame, dimensoes: dict):
+        self._valores = _valores_linhas(df)
+        self._grupos, self._somas = {}, {}
+        tabela = pd.DataFrame(self._valores)
+        for dimensao, coluna in dimensoes.items():
+            grupos = _grupos_linhas(df, dimensao, coluna)
+            self._grupos[dimensao] = grupos
+            somas = tabela.groupby(np.asarray(grupos, dtype=object), sort=False).sum()
+            self._somas[dimensao] = dict(zip(somas.index, somas.to_numpy()))
+
+    def atualizar(self, df: pd.DataFrame, parametros=None):
+        """
+        Deixa as somas de acordo com `df` (o DF precificado). `parametros` são os valores que
+        mudam o preço de todas as linhas (frete, custos extras, modo e margem fixa).
+        """
+        dimensoes = {d: c for d, c in self.dimensoes.items() if c in df.columns}
+        rateio = df["Rateio Global Unitário"].iloc[0] if "Rateio Global Unitário" in df.columns and len(df) else None
+        chave = (parametros, rateio, tuple(dimensoes))
+        if (self._completo or self._valores is None or len(self._valores) != len(df)
+                or chave != self._chave):
+            # Carga, recarga, mudança que afeta todas as linhas ou alteração não marcada
+            self._recalcular(df, dimensoes)
+            self._chave, self._completo = chave, False
+            self._pendentes.clear()
+            self._mudou()
+        elif self._pendentes:
+            posicoes = sorted(p for p in self._pendentes if p < len(df))
+            self._pendentes.clear()
+            sub = df.iloc[posicoes]
+            valores = _valores_linhas(sub)
+            grupos = {d: _grupos_linhas(sub, d, c) for d, c in dimensoes.items()}
+            mudou = False
+            for i, pos in enumerate(posicoes):
+                novos = {d: g[i] for d, g in grupos.items()}
+                if np.array_equal(valores[i], self._valores[pos]) and all(
+                    self._grupos[d][pos] == g for d, g in novos.items()
+                ):
+                    continue
+                self._mover(pos, novos, valores[i])
+                mudou = True
+            if mudou:
+                self._mudou()
+
+    # --- Consultas ---
+    def dimensoes_disponiveis(self) -> list:
+        return list(self._somas)
+
+    def totais(self) -> dict:
+        """Totais do catálogo (os mesmos para qualquer dimensão)."""
+        total = self._valores.sum(axis=0) if self._valores is not None and len(self._valores) else np.zeros(4)
+        return {
+            "Produtos": int(round(total[_PRODUTOS])),
+            "Margem média (%)": float(total[_MARGEM] / total[_PRODUTOS]) if total[_PRODUTOS] else 0.0,
+            "Custo do Estoque": float(total[_CUSTO]),
+            "Valor à Vista": float(total[_VISTA]),
+        }
+
+    def tabela(self, dimensao: str) -> pd.DataFrame:
+        """Uma linha por grupo; por mês em ordem cronológica, os demais pelo custo do estoque."""
+        somas = self._somas.get(dimensao, {})
+        if not somas:
+            return pd.DataFrame(columns=[dimensao, "Produtos", "Margem média (%)", "Custo do Estoque", "Valor à Vista"])
+        valores = np.array(list(somas.values()))
+        tabela = pd.DataFrame({
+            dimensao: list(somas),
+            "Produtos": np.rint(valores[:, _PRODUTOS]).astype(int),
+            "Margem média (%)": valores[:, _MARGEM] / valores[:, _PRODUTOS],
+            "Custo do Estoque": valores[:, _CUSTO],
+            "Valor à Vista": valores[:, _VISTA],
+        })
+        if dimensao == DIMENSAO_MES:
+            # Produtos sem data ficam depois dos meses
+            return tabela.sort_values(dimensao, key=lambda s: s.replace(SEM_VALOR, "9999"), kind="stable").reset_index(drop=True)
+        return tabela.sort_values("Custo do Estoque", ascending=False, kind="stable").reset_index(drop=True)
+
+    def grafico(self, dimensao: str) -> bytes:
+        """PNG do custo do estoque e do valor à vista por grupo, desenhado uma vez por versão dos dados."""
+        if dimensao not in self._graficos:
+            self._graficos[dimensao] = _desenhar(self.tabela(dimensao), dimensao)
+        return self._graficos[dimensao]
+
+
+def _desenhar(tabela: pd.DataFrame, dimensao: str) -> bytes:
+    if dimensao == DIMENSAO_MES:
+        tabela = tabela.tail(MAX_GRUPOS_GRAFICO)
+    else:
+        tabela = tabela.head(MAX_GRUPOS_GRAFICO).iloc[::-1]  # Maior custo no topo do gráfico horizontal
+
+    # Figure direto (sem pyplot): não usa estado global, pode ser desenhada em qualquer thread
+    figura = Figure(figsize=(8, max(3.0, 0.4 * len(tabela) + 1.5)), dpi=100)
+    eixo = figura.add_subplot()
+    posicoes = np.arange(len(tabela))
+    altura = 0.4
+    rotulos = tabela[dimensao].astype(str).tolist()
+    if dimensao == DIMENSAO_MES:
+        eixo.bar(posicoes - altura / 2, tabela["Custo do Estoque"], altura, label="Custo do estoque")
+        eixo.bar(posicoes + altura / 2, tabela["Valor à Vista"], altura, label="Valor à vista")
+        eixo.set_xticks(posicoes, rotulos, rotation=45, ha="right")
+        eixo.set_ylabel("R$")
+    else:
+        eixo.barh(posicoes - altura / 2, tabela["Custo do Estoque"], altura, label="Custo do estoque")
+        eixo.barh(posicoes + altura / 2, tabela["Valor à Vista"], altura, label="Valor à vista")
+        eixo.set_yticks(posicoes, rotulos)
+        eixo.set_xlabel("R$")
+    eixo.set_title(f"Estoque por {dimensao.lower()}")
+    eixo.legend()
+    figura.tight_layout()
+
+    saida = BytesIO()
+    figura.savefig(saida, format="png")
+    return saida.getvalue()
@@ -0,0 +1,255 @@
+"""
+Cálculo de precificação dos produtos (rateio global, margem e preços finais).
+
+`processar_dataframe` faz o cálculo completo a partir dos dados de entrada.
+`PrecificacaoIncremental` mantém o resultado materializado entre reruns e só
+recalcula as linhas alteradas; uma mudança de frete/custos extras vira uma
+atualização vetorizada com o novo rateio. O resultado é idêntico (bit a bit)
+ao do cálculo completo.
+"""
+import numpy as np
+import pandas as pd
+
+from precificar import motor_precificacao as motor
+
+COLUNAS_NUMERICAS = ["Qtd", "Custo Unitário", "Margem (%)", "Custos Extras Produto"]
+COLUNAS_TEXTO = ["Cor", "Marca", "Data_Cadastro"]
+COLUNAS_SAIDA = [
+    "Produto", "Qtd", "Custo Unitário", "Custos Extras Produto",
+    "Custo Total Unitário", "Margem (%)", "Preço à Vista", "Preço no Cartão",
+    "Imagem", "Imagem_URL", "Rateio Global Unitário",
+    "Cor", "Marca", "Data_Cadastro"
+]
+
+
+def processar_dataframe(df: pd.DataFrame, frete_total: float, custos_extras: float,
+                        modo_margem: str, margem_fixa: float) -> pd.DataFrame:
+    """Processa o DataFrame, aplica rateio, margem e calcula os preços finais."""
+    if df.empty:
+        # Garante que o DataFrame tem as colunas mínimas esperadas para evitar erros de índice/coluna
+        return pd.DataFrame(columns=[
+            "Produto", "Qtd", "Custo Unitário", "Custos Extras Produto", 
+            "Custo Total Unitário", "Margem (%)", "Preço à Vista", "Preço no Cartão", 
+            "Rateio Global Unitário", "Cor", "Marca", "Data_Cadastro" # ADDED NEW COLUMNS
+        ])
+
+    df = df.copy()
+
+    # Garante que as colunas de custo e quantidade são numéricas
+    for col in COLUNAS_NUMERICAS:
+        if col in df.columns:
+            # Tenta converter, falhando para 0.0 se não for possível
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0)
+        elif col not in df.columns:
+            # Adiciona colunas ausentes com valor 0.0 se for necessário para o cálculo
+            df[col] = 0.0
+    
+    # Garante as novas colunas de texto/data
+    for col in COLUNAS_TEXTO:
+         if col not in df.columns:
+            df[col] = "" # Inicializa como string vazia
+
+    # --- Cálculo do Rateio Global ---
+    # NOTA: O cálculo do rateio é sempre baseado nos totais para consistência.
+    qtd_total = df["Qtd"].sum()
+    rateio_unitario = motor.rateio_unitario(frete_total, custos_extras, qtd_total)
+
+    # Salva o rateio global unitário na coluna que será persistida e usada no cálculo total
+    df["Rateio Global Unitário"] = rateio_unitario 
+    
+    # O Custo Total Unitário é a soma do Custo Unitário Base + Custos Específicos + Rateio Global.
+    df["Custo Total Unitário"] = motor.custo_total(df["Custo Unitário"], df["Custos Extras Produto"], df["Rateio Global Unitário"])
+
+    # Processar margens conforme o modo selecionado
+    if "Margem (%)" not in df.columns:
+        df["Margem (%)"] = margem_fixa
+    
+    df["Margem (%)"] = df["Margem (%)"].apply(lambda x: x if pd.notna(x) else margem_fixa)
+
+
+    # Calcular os preços finais
+    df["Preço à Vista"] = motor.preco_a_vista(df["Custo Total Unitário"], df["Margem (%)"])
+    # Taxa de cartão de 11.28% (para chegar a 0.8872 do preço de venda)
+    df["Preço no Cartão"] = motor.preco_cartao(df["Preço à Vista"])
+
+    # Seleciona as colunas relevantes para o DataFrame final de exibição
+    cols_to_keep = COLUNAS_SAIDA
+    
+    # Mantém apenas as colunas que existem no DF
+    df_final = df[[col for col in cols_to_keep if col in df.columns]]
+
+    return df_final
+
+
+def _rateio_unitario(qtd: pd.Series, frete_total: float, custos_extras: float) -> float:
+    # Mesma conta de processar_dataframe (soma feita pelo pandas, para o mesmo arredondamento)
+    return motor.rateio_unitario(frete_total, custos_extras, qtd.sum())
+
+
+def atribuir_linhas(df: pd.DataFrame, col: str, posicoes: np.ndarray, valores):
+    """Grava `valores` nas linhas `posicoes` da coluna, alargando o dtype se necessário (ex.: int -> float)."""
+    valores = np.asarray(valores)
+    serie = df[col]
+    if (pd.api.types.is_numeric_dtype(serie.dtype) and pd.api.types.is_numeric_dtype(valores.dtype)
+            and not pd.api.types.is_bool_dtype(serie.dtype)):
+        dtype = np.result_type(serie.dtype, valores.dtype)
+        if dtype != serie.dtype:
+            df[col] = serie.astype(dtype)
+    j = df.columns.get_loc(col)
+    try:
+        df.iloc[posicoes, j] = valores
+    except (TypeError, ValueError):
+        df[col] = df[col].astype(object)
+        df.iloc[posicoes, j] = valores
+
+
+class PrecificacaoIncremental:
+    """
+    Resultado de `processar_dataframe` materializado, atualizado só nas linhas alteradas.
+
+    Recebe as mesmas marcações do RastreadorAlteracoes (é registrado como ouvinte dele):
+    linhas editadas, inclusões no final e exclusões. Sequências que não dá para aplicar
+    com segurança (inclusão seguida de outra operação, colunas ou tamanho inesperados)
+    caem no cálculo completo.
+    """
+
+    def __init__(self):
+        self._df = None  # Saída materializada (mesmas colunas de processar_dataframe)
+        self._base = None  # Custo Unitário + Custos Extras Produto, por linha
+        self._rateio = None
+        self._colunas_entrada = None
+        self._operacoes = []
+        self._completo = True
+
+    # --- Marcações (mesma interface do RastreadorAlteracoes) ---
+    def reiniciar(self, *args, **kwargs):
+        self._completo = True
+        self._operacoes.clear()
+
+    def marcar_linhas(self, posicoes):
+        self._operacoes.append(("linhas", [int(p) for p in posicoes]))
+
+    def marcar_inclusao(self, quantidade: int = 1):
+        self._operacoes.append(("inclusao", int(quantidade)))
+
+    def marcar_exclusao(self, posicoes):
+        self._operacoes.append(("exclusao", sorted({int(p) for p in posicoes})))
+
+    # --- Cálculo ---
+    def _calcular_completo(self, df, frete_total, custos_extras, modo_margem, margem_fixa):
+        self._df = processar_dataframe(df, frete_total, custos_extras, modo_margem, margem_fixa).copy()
+        self._colunas_entrada = tuple(df.columns)
+        self._operacoes.clear()
+        self._completo = df.empty  # DF vazio não tem estado para manter
+        if not df.empty:
+            self._base = (self._df["Custo Unitário"] + self._df["Custos Extras Produto"]).to_numpy(dtype=float, copy=True)
+            self._rateio = self._df["Rateio Global Unitário"].iloc[0]
+        return self._df
+
+    @staticmethod
+    def _dtypes_saida(df: pd.DataFrame) -> dict:
+        """
+        dtype de cada coluna na saída de processar_dataframe(df). Eles dependem só dos dtypes da
+        entrada (basta processar uma linha), exceto nas colunas numéricas guardadas como texto,
+        em que pd.to_numeric escolhe int64 ou float64 pelo conteúdo da coluna inteira.
+        """
+        dtypes = processar_dataframe(df.iloc[:1], 0.0, 0.0, "", 0.0).dtypes.to_dict()
+        for col in COLUNAS_NUMERICAS:
+            if col in df.columns and not pd.api.types.is_numeric_dtype(df[col].dtype):
+                dtypes[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0).dtype
+        return dtypes
+
+    def _linhas_processadas(self, sub: pd.DataFrame) -> dict:
+        """Valores de entrada já convertidos das linhas `sub`, como em processar_dataframe."""
+        valores = {}
+        for col in COLUNAS_NUMERICAS:
+            if col in sub.columns:
+                valores[col] = pd.to_numeric(sub[col], errors='coerce').fillna(0.0).to_numpy()
+            else:
+                valores[col] = np.full(len(sub), 0.0)
+        for col in COLUNAS_TEXTO:
+            valores[col] = sub[col].to_numpy() if col in sub.columns else np.full(len(sub), "", dtype=object)
+        for col in self._df.columns:
+            if col not in valores and col in sub.columns:
+                valores[col] = sub[col].to_numpy()
+        return valores
+
+    def calcular(self, df: pd.DataFrame, frete_total: float, custos_extras: float,
+                 modo_margem: str, margem_fixa: float) -> pd.DataFrame:
+        """
+        Retorna o DF processado para `df`, recalculando só o necessário.
+        O DF devolvido é o materializado: não deve ser alterado in-place pelo chamador.
+        """
+        if self._completo or self._df is None or df.empty or tuple(df.columns) != self._colunas_entrada:
+            return self._calcular_completo(df, frete_total, custos_extras, modo_margem, margem_fixa)
+
+        sujas = set()
+        novas = 0
+        for tipo, dados in self._operacoes:
+            if novas and tipo != "inclusao":
+                # Inclusão no meio da sequência: posições ambíguas, recalcula tudo
+                return self._calcular_completo(df, frete_total, custos_extras, modo_margem, margem_fixa)
+            if tipo == "linhas":
+                sujas.update(dados)
+            elif tipo == "inclusao":
+                novas += dados
+            elif tipo == "exclusao":
+                validas = [p for p in dados if 0 <= p < len(self._df)]
+                if not validas:
+                    continue
+                self._df = self._df.drop(self._df.index[validas]).reset_index(drop=True)
+                self._base = np.delete(self._base, validas)
+                removidas = np.asarray(validas)
+                sujas = {p - int(np.searchsorted(removidas, p)) for p in sujas if p not in set(validas)}
+        self._operacoes.clear()
+
+        if len(self._df) + novas != len(df):
+            # Alteração não marcada: o estado materializado não é confiável
+            return self._calcular_completo(df, frete_total, custos_extras, modo_margem, margem_fixa)
+
+        # 1. Linhas editadas: reescreve as entradas e o custo base
+        posicoes = np.array(sorted(p for p in sujas if p < len(self._df)), dtype=int)
+        if len(posicoes):
+            valores = self._linhas_processadas(df.iloc[posicoes])
+            for col, vals in valores.items():
+                if col in self._df.columns:
+                    atribuir_linhas(self._df, col, posicoes, vals)
+            self._base[posicoes] = (
+                self._df["Custo Unitário"].iloc[posicoes] + self._df["Custos Extras Produto"].iloc[posicoes]
+            ).to_numpy(dtype=float)
+
+        # 2. Linhas novas no final: processadas em bloco e anexadas
+        if novas:
+            inicio = len(self._df)
+            valores = self._linhas_processadas(df.iloc[inicio:])
+            novos = pd.DataFrame({col: valores.get(col, np.nan) for col in self._df.columns}, index=range(inicio, len(df)))
+            novos["Rateio Global Unitário"] = 0.0
+            self._df = pd.concat([self._df, novos]) if inicio else novos
+            base_novas = (novos["Custo Unitário"] + novos["Custos Extras Produto"]).to_numpy(dtype=float)
+            self._base = np.concatenate([self._base, base_novas])
+            posicoes = np.concatenate([posicoes, np.arange(inicio, len(df))])
+
+        # 3. Rateio: se mudou (frete/extras ou soma das quantidades), atualização vetorizada de todas as linhas
+        rateio = _rateio_unitario(self._df["Qtd"], frete_total, custos_extras)
+        if rateio != self._rateio:
+            self._rateio = rateio
+            self._df["Rateio Global Unitário"] = rateio
+            custo_total = self._base + rateio
+            preco_vista = motor.preco_a_vista(custo_total, self._df["Margem (%)"].to_numpy())
+            self._df["Custo Total Unitário"] = custo_total
+            self._df["Preço à Vista"] = preco_vista
+            self._df["Preço no Cartão"] = motor.preco_cartao(preco_vista)
+        elif len(posicoes):
+            atribuir_linhas(self._df, "Rateio Global Unitário", posicoes, np.full(len(posicoes), rateio))
+            custo_total = self._base[posicoes] + rateio
+            preco_vista = motor.preco_a_vista(custo_total, self._df["Margem (%)"].iloc[posicoes].to_numpy())
+            atribuir_linhas(self._df, "Custo Total Unitário", posicoes, custo_total)
+            atribuir_linhas(self._df, "Preço à Vista", posicoes, preco_vista)
+            atribuir_linhas(self._df, "Preço no Cartão", posicoes, motor.preco_cartao(preco_vista))
+
+        # 4. dtypes: atribuir_linhas e o concat só alargam (int -> float, texto -> object); o cálculo
+        # completo converte a coluna inteira e pode voltar a int64 (ex.: a única Qtd fracionária foi excluída)
+        for col, dtype in self._dtypes_saida(df).items():
+            if self._df[col].dtype != dtype:
+                self._df[col] = self._df[col].astype(dtype)
+        return self._df
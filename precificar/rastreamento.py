@@ -0,0 +1,182 @@
+"""
+Rastreamento incremental de alterações em DataFrames da sessão.
+
+Substitui o hash do DataFrame inteiro a cada rerun: os caminhos que alteram o DF
+(formulário de inclusão, exclusão, sincronização do data_editor, recarga do CSV)
+avisam quais linhas mudaram, e só essas linhas são re-hasheadas. Um contador de
+versão indica se há algo ainda não salvo.
+"""
+import itertools
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+def hash_linhas(df: pd.DataFrame) -> np.ndarray:
+    """Hash (uint64) de cada linha; colunas object problemáticas são convertidas para string."""
+    try:
+        return pd.util.hash_pandas_object(df, index=False).to_numpy(dtype=np.uint64, copy=True)
+    except Exception:
+        df = df.copy()
+        for col in df.select_dtypes(include=["object"]).columns:
+            df[col] = df[col].astype(str)
+        return pd.util.hash_pandas_object(df, index=False).to_numpy(dtype=np.uint64, copy=True)
+
+
+@dataclass
+class Alteracoes:
+    """
+    O que mudou num DF desde o último salvamento (ver RastreadorAlteracoes.alteracoes()).
+
+    `origem[i]` é a posição da linha i no DF salvo, ou -1 se ela foi incluída depois;
+    `editadas` são as posições atuais marcadas como editadas. `origem` é None quando o
+    rastreador não sabe as posições (mudança de forma não avisada, mescla, mudança dos
+    parâmetros). `base` identifica o salvamento anterior e `versao` o que está sendo feito.
+    """
+    base: tuple
+    versao: tuple
+    origem: Optional[np.ndarray]
+    editadas: list
+
+
+class RastreadorAlteracoes:
+    """
+    Mantém o hash de cada linha (por posição) e o conjunto de linhas sujas de um DataFrame.
+
+    `sincronizar` custa O(linhas marcadas). Mudanças que não foram avisadas mas alteram
+    a forma do DF (colunas ou número de linhas) caem num re-hash completo, então a detecção
+    continua correta mesmo se algum caminho esquecer de marcar.
+
+    Além das linhas sujas (esvaziadas a cada `sincronizar`), guarda as linhas editadas,
+    incluídas e excluídas desde o último salvamento, para que o backend grave só elas.
+    """
+
+    _ids = itertools.count()
+
+    def __init__(self, colunas_ignoradas=("Imagem",)):
+        self.colunas_ignoradas = tuple(colunas_ignoradas)
+        self.versao = 0
+        self._versao_salva = 0
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._sujas = set()
+        self._colunas = None
+        self._parametros = None
+        self._id = next(self._ids)
+        # Posição de cada linha no DF salvo (-1: incluída) e linhas editadas desde o salvamento
+        self._origem = np.empty(0, dtype=np.int64)
+        self._editadas = set()
+        # Objetos que recebem as mesmas marcações (ex.: PrecificacaoIncremental)
+        self.ouvintes = []
+
+    @property
+    def iniciado(self) -> bool:
+        return self._colunas is not None
+
+    def _colunas_hash(self, df: pd.DataFrame) -> list:
+        return [c for c in df.columns if c not in self.colunas_ignoradas]
+
+    def reiniciar(self, df: pd.DataFrame, parametros=None, salvo: bool = True):
+        """
+        Recalcula todos os hashes (carga inicial ou recarga do CSV).
+        `salvo=True` indica que o conteúdo já está persistido (ex.: acabou de ser lido do GitHub).
+        """
+        self._colunas = tuple(df.columns)
+        self._hashes = hash_linhas(df[self._colunas_hash(df)])
+        self._sujas.clear()
+        self._parametros = parametros
+        self.versao += 1
+        self._editadas.clear()
+        if salvo:
+            self._versao_salva = self.versao
+            self._origem = np.arange(len(df), dtype=np.int64)
+        else:
+            self._origem = None
+        for ouvinte in self.ouvintes:
+            ouvinte.reiniciar()
+
+    def marcar_linhas(self, posicoes):
+        """Linhas (posições) cujo conteúdo pode ter sido editado."""
+        posicoes = [int(p) for p in posicoes]
+        self._sujas.update(posicoes)
+        self._editadas.update(posicoes)
+        for ouvinte in self.ouvintes:
+            ouvinte.marcar_linhas(posicoes)
+
+    def marcar_inclusao(self, quantidade: int = 1):
+        """`quantidade` linhas foram adicionadas ao final do DF."""
+        inicio = len(self._hashes)
+        self._hashes = np.concatenate([self._hashes, np.zeros(quantidade, dtype=np.uint64)])
+        self._sujas.update(range(inicio, inicio + quantidade))
+        if self._origem is not None:
+            self._origem = np.concatenate([self._origem, np.full(quantidade, -1, dtype=np.int64)])
+        self.versao += 1
+        for ouvinte in self.ouvintes:
+            ouvinte.marcar_inclusao(quantidade)
+
+    def marcar_exclusao(self, posicoes):
+        """As linhas nas `posicoes` foram removidas (e o DF reindexado de 0 a n-1)."""
+        posicoes = sorted({int(p) for p in posicoes if 0 <= int(p) < len(self._hashes)})
+        if not posicoes:
+            return
+        for ouvinte in self.ouvintes:
+            ouvinte.marcar_exclusao(posicoes)
+        self._hashes = np.delete(self._hashes, posicoes)
+        if self._origem is not None:
+            self._origem = np.delete(self._origem, posicoes)
+        # Reposiciona as linhas sujas/editadas que estavam depois das removidas
+        removidas, conjunto = np.asarray(posicoes), set(posicoes)
+        self._sujas = {
+            p - int(np.searchsorted(removidas, p)) for p in self._sujas if p not in conjunto
+        }
+        self._editadas = {
+            p - int(np.searchsorted(removidas, p)) for p in self._editadas if p not in conjunto
+        }
+        self.versao += 1
+
+    def sincronizar(self, df: pd.DataFrame, parametros=None) -> bool:
+        """
+        Re-hasheia as linhas sujas e atualiza a versão se algo mudou de fato.
+        `parametros` são valores externos que também afetam o que é salvo (ex.: frete e custos
+        extras do rateio). Retorna True se há alterações ainda não salvas.
+        """
+        colunas = tuple(df.columns)
+        if colunas != self._colunas or len(df) != len(self._hashes):
+            # Mudança de forma não avisada: re-hash completo
+            novos = hash_linhas(df[self._colunas_hash(df)])
+            if colunas != self._colunas or not np.array_equal(novos, self._hashes):
+                self.versao += 1
+            self._colunas = colunas
+            self._hashes = novos
+            self._origem = None  # Não se sabe quais linhas entraram ou saíram
+        elif self._sujas:
+            posicoes = sorted(p for p in self._sujas if p < len(df))
+            novos = hash_linhas(df.iloc[posicoes][self._colunas_hash(df)])
+            if not np.array_equal(novos, self._hashes[posicoes]):
+                self._hashes[posicoes] = novos
+                self.versao += 1
+        self._sujas.clear()
+
+        if parametros != self._parametros:
+            self._parametros = parametros
+            self._origem = None  # Os parâmetros mudam o que é salvo de todas as linhas
+            self.versao += 1
+        return self.ha_alteracoes()
+
+    def ha_alteracoes(self) -> bool:
+        return self.versao != self._versao_salva
+
+    def alteracoes(self) -> Alteracoes:
+        """Linhas incluídas/editadas/excluídas desde o último salvamento (chamar depois de `sincronizar`)."""
+        return Alteracoes(
+            (self._id, self._versao_salva),
+            (self._id, self.versao),
+            None if self._origem is None else self._origem.copy(),
+            sorted(self._editadas),
+        )
+
+    def marcar_salvo(self):
+        self._versao_salva = self.versao
+        self._origem = np.arange(len(self._hashes), dtype=np.int64)
+        self._editadas.clear()
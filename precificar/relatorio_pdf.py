@@ -0,0 +1,234 @@
+"""
+Relatório de precificação em PDF (tabela), gerado fora do rerun do Streamlit.
+
+O texto de todas as células é montado de uma vez por coluna (formatar_brl_serie)
+antes de desenhar. O cabeçalho da tabela é repetido em cada página, o rodapé
+numera as páginas e o relatório termina com uma linha de totais. Os PDFs ficam
+num cache do processo indexado por (hash do DataFrame filtrado, modelo): o mesmo
+filtro é reenviado sem gerar de novo, e pedidos simultâneos do mesmo relatório
+esperam pela mesma geração. Um catálogo em que alguma foto não pôde ser baixada
+é entregue, mas não fica no cache: o próximo pedido tenta as fotos de novo.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pandas as pd
+from fpdf import FPDF
+
+from precificar.catalogo_pdf import COLUNAS_CATALOGO, gerar_catalogo_pdf
+from precificar.formatacao import formatar_brl_serie
+
+# (título da coluna, largura em mm, alinhamento). A soma cabe nos 190mm úteis do A4.
+COLUNAS_PRECIFICACAO = [
+    ("Produto", 40, "L"),
+    ("Qtd", 15, "C"),
+    ("Custo Unitário", 25, "R"),
+    ("Margem (%)", 20, "R"),
+    ("Preço à Vista", 25, "R"),
+    ("Preço no Cartão", 25, "R"),
+    ("URL da Imagem", 40, "L"),
+]
+MODELOS = {"precificacao": COLUNAS_PRECIFICACAO}
+# Colunas do DF que entram no relatório (e portanto na chave do cache)
+COLUNAS_ENTRADA = [
+    "Produto", "Qtd", "Custo Unitário", "Custo Total Unitário", "Margem (%)",
+    "Preço à Vista", "Preço no Cartão", "Imagem_URL",
+]
+ALTURA_LINHA = 8
+MAX_RELATORIOS_EM_CACHE = 16
+
+
+def _latin1(serie: pd.Series) -> pd.Series:
+    """As fontes padrão do FPDF só têm latin-1: caracteres fora dele (ex.: emojis) viram '?'."""
+    return serie.astype(str).map(lambda t: t.encode("latin-1", "replace").decode("latin-1"))
+
+
+def _truncar(serie: pd.Series, limite: int) -> pd.Series:
+    return serie.where(serie.str.len() <= limite, serie.str.slice(0, limite - 3) + "...")
+
+
+def _textos_colunas(df: pd.DataFrame, colunas: list) -> dict:
+    """Texto final de cada célula, por coluna, calculado em lote."""
+    n = len(df)
+    vazio = pd.Series([""] * n, index=df.index)
+
+    def coluna(nome, padrao=0.0):
+        return df[nome] if nome in df.columns else pd.Series([padrao] * n, index=df.index)
+
+    # Usa o Custo Total Unitário para o relatório, se disponível
+    custo = df["Custo Total Unitário"] if "Custo Total Unitário" in df.columns else coluna("Custo Unitário")
+    margem = pd.to_numeric(coluna("Margem (%)"), errors="coerce").fillna(0.0)
+    textos = {
+        "Produto": _truncar(_latin1(coluna("Produto", "")), 24),
+        "Qtd": coluna("Qtd", 0).astype(str),
+        "Custo Unitário": formatar_brl_serie(custo),
+        "Margem (%)": margem.map("{:.2f}%".format),
+        "Preço à Vista": formatar_brl_serie(coluna("Preço à Vista")),
+        "Preço no Cartão": formatar_brl_serie(coluna("Preço no Cartão")),
+        "URL da Imagem": _truncar(_latin1(coluna("Imagem_URL", "").fillna("")), 35) if "Imagem_URL" in df.columns else vazio,
+    }
+    return {nome: textos[nome].tolist() for nome, _, _ in colunas}
+
+
+def _totais(df: pd.DataFrame) -> list:
+    """Linhas de resumo do fim do relatório (valores ponderados pela quantidade)."""
+    qtd = pd.to_numeric(df.get("Qtd", pd.Series(dtype=float)), errors="coerce").fillna(0.0)
+
+    def total(col):
+        if col not in df.columns:
+            return 0.0
+        return float((pd.to_numeric(df[col], errors="coerce").fillna(0.0) * qtd).sum())
+
+    custo = "Custo Total Unitário" if "Custo Total Unitário" in df.columns else "Custo Unitário"
+    valores = formatar_brl_serie([total(custo), total("Preço à Vista"), total("Preço no Cartão")]).tolist()
+    qtd_total = qtd.sum()
+    return [
+        f"Produtos: {len(df)}   |   Quantidade total: {int(qtd_total) if float(qtd_total).is_integer() else qtd_total}",
+        f"Custo total (Qtd x custo): {valores[0]}",
+        f"Valor total à vista: {valores[1]}   |   Valor total no cartão: {valores[2]}",
+    ]
+
+
+class _PDFRelatorio(FPDF):
+    def __init__(self, colunas: list):
+        super().__init__()
+        self.colunas = colunas
+        self.mostrar_cabecalho_tabela = False
+        self.alias_nb_pages()
+        self.set_auto_page_break(True, margin=15)
+
+    def cabecalho_tabela(self):
+        self.set_font("Arial", "B", 9)
+        for titulo, largura, _ in self.colunas:
+            self.cell(largura, ALTURA_LINHA, titulo, border=1, align="C")
+        self.ln()
+        self.set_font("Arial", "", 8)
+
+    def header(self):
+        if self.page_no() == 1:
+            self.set_font("Arial", "B", 16)
+            self.cell(0, 10, "Relatório de Precificação", 0, 1, "C")
+            self.ln(3)
+        # Nas páginas seguintes a tabela continua com o mesmo cabeçalho
+        if self.mostrar_cabecalho_tabela:
+            self.cabecalho_tabela()
+
+    def footer(self):
+        self.set_y(-12)
+        self.set_font("Arial", "I", 8)
+        self.cell(0, 8, f"Página {self.page_no()}/{{nb}}", 0, 0, "C")
+
+
+def gerar_relatorio_pdf(df: pd.DataFrame, modelo: str = "precificacao") -> bytes:
+    """Gera o PDF do relatório (várias páginas) e retorna os bytes."""
+    colunas = MODELOS[modelo]
+    pdf = _PDFRelatorio(colunas)
+    pdf.add_page()
+    pdf.cabecalho_tabela()
+    pdf.mostrar_cabecalho_tabela = True
+
+    if df.empty:
+        pdf.cell(sum(c[1] for c in colunas), ALTURA_LINHA, "Nenhum produto cadastrado.", border=1, align="C")
+        pdf.ln()
+    else:
+        textos = _textos_colunas(df, colunas)
+        urls = _latin1(df["Imagem_URL"].fillna("")).tolist() if "Imagem_URL" in df.columns else [""] * len(df)
+        celulas = [(textos[titulo], largura, alinhamento, titulo) for titulo, largura, alinhamento in colunas]
+        for i in range(len(df)):
+            for valores, largura, alinhamento, titulo in celulas:
+                link = urls[i] if titulo == "URL da Imagem" else ""
+                pdf.cell(largura, ALTURA_LINHA, valores[i], border=1, align=alinhamento, link=link)
+            pdf.ln()
+
+        # Totais: não repete o cabeçalho da tabela se cair numa página nova
+        pdf.mostrar_cabecalho_tabela = False
+        pdf.ln(4)
+        pdf.set_font("Arial", "B", 9)
+        for linha in _totais(df):
+            pdf.cell(0, 6, linha, 0, 1, "L")
+
+    return pdf.output(dest="S").encode("latin1")
+
+
+def _montar_relatorio_pdf(df: pd.DataFrame) -> tuple:
+    return gerar_relatorio_pdf(df), 0
+
+
+# Modelo -> (função que gera (PDF, fotos que faltaram) a partir do DF, colunas do DF que ela usa)
+GERADORES = {
+    "precificacao": (_montar_relatorio_pdf, COLUNAS_ENTRADA),
+    "catalogo": (gerar_catalogo_pdf, COLUNAS_CATALOGO),
+}
+
+
+def chave_relatorio(df: pd.DataFrame, modelo: str = "precificacao", **opcoes) -> str:
+    """Hash do conteúdo que vai para o relatório (só as colunas usadas) + modelo e opções."""
+    usadas = [c for c in GERADORES[modelo][1] if c in df.columns]
+    h = hashlib.sha256(repr((modelo, sorted(opcoes.items()), usadas, len(df))).encode())
+    if usadas and len(df):
+        sub = df[usadas]
+        try:
+            hashes = pd.util.hash_pandas_object(sub, index=False)
+        except TypeError:
+            hashes = pd.util.hash_pandas_object(sub.astype(str), index=False)
+        h.update(hashes.to_numpy().tobytes())
+    return h.hexdigest()
+
+
+class GeradorRelatorios:
+    """Gera relatórios numa thread de trabalho, com cache LRU dos PDFs prontos."""
+
+    def __init__(self, max_em_cache: int = MAX_RELATORIOS_EM_CACHE):
+        self.max_em_cache = max_em_cache
+        # Duas threads: um catálogo grande não segura o relatório em tabela
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="relatorio-pdf")
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # chave -> Future (pronto ou em andamento)
+        self._incompletos = set()  # Chaves cujo PDF saiu com fotos faltando (não são reaproveitados)
+
+    def solicitar(self, df: pd.DataFrame, modelo: str = "precificacao", **opcoes) -> Future:
+        """
+        Future com os bytes do PDF do `modelo` ("precificacao" ou "catalogo"); `opcoes` vão para
+        a função geradora. Se o mesmo relatório já foi gerado (ou está sendo gerado), devolve o
+        mesmo Future, sem trabalho novo.
+        """
+        gerar, colunas = GERADORES[modelo]
+        chave = chave_relatorio(df, modelo, **opcoes)
+        with self._lock:
+            futuro = self._cache.get(chave)
+            if futuro is not None and not (
+                futuro.done() and (futuro.exception() is not None or chave in self._incompletos)
+            ):
+                self._cache.move_to_end(chave)
+                return futuro
+            self._incompletos.discard(chave)
+            # Cópia: a sessão pode alterar o DF enquanto a thread gera o PDF
+            futuro = self._executor.submit(
+                self._gerar, chave, gerar, df[[c for c in colunas if c in df.columns]].copy(), opcoes
+            )
+            self._cache[chave] = futuro
+            while len(self._cache) > self.max_em_cache:
+                self._incompletos.discard(self._cache.popitem(last=False)[0])
+            return futuro
+
+    def _gerar(self, chave: str, gerar, df: pd.DataFrame, opcoes: dict) -> bytes:
+        pdf, fotos_faltando = gerar(df, **opcoes)
+        if fotos_faltando:
+            with self._lock:
+                self._incompletos.add(chave)
+        return pdf
+
+
+_gerador = None
+_gerador_lock = threading.Lock()
+
+
+def obter_gerador_relatorios() -> GeradorRelatorios:
+    """Instância única do gerador, compartilhada por todas as sessões do processo."""
+    global _gerador
+    with _gerador_lock:
+        if _gerador is None:
+            _gerador = GeradorRelatorios()
+        return _gerador
@@ -1,12 +1,34 @@
 import streamlit as st
 import pandas as pd
-import requests
-from fpdf import FPDF
-from io import BytesIO, StringIO
-import base64
-import hashlib
-import ast
+import numpy as np
+from io import BytesIO
 from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+
+from precificar import motor_precificacao as motor
+from precificar.armazenamento import (
+    Armazenamento, ArmazenamentoGitHub, ArmazenamentoReplicado, obter_armazenamento_local,
+)
+from precificar.autosave import obter_gravador
+from precificar.catalogo_compartilhado import CatalogoCompartilhado
+from precificar.blobs import eh_referencia, obter_armazem
+from precificar.fila_telegram import obter_fila_telegram
+from precificar.formatacao import formatar_brl, formatar_brl_serie
+from precificar.relatorio_pdf import obter_gerador_relatorios
+from precificar.composicao import (
+    IndiceReverso, definir_composicao, explodir_insumos_usados, itens_do_produto, normalizar_composicao,
+    remover_produto, renomear_insumo, repreciar_por_insumos,
+)
+from precificar.precificacao import PrecificacaoIncremental, atribuir_linhas
+from precificar.rastreamento import RastreadorAlteracoes
+from precificar.importacao import importar_produtos
+from precificar.indice_busca import IndiceBusca
+from precificar.indice_datas import IndiceDatas
+from precificar.indice_nomes import IndiceNomes
+from precificar.miniaturas import LARGURA_CARTAO, obter_miniaturas
+from precificar.painel import AgregadosCatalogo
+from precificar.cache_csv import TTL_PADRAO as TTL_CSV_PADRAO
 
 # ===============================
 # FUNÇÕES AUXILIARES GLOBAIS
@@ -18,357 +40,419 @@ HARDCODED_TELEGRAM_TOKEN = "8412132908:AAG8N_vFzkpVNX-WN3bwT0Vl3H41Q-9Rfw4"
 TELEGRAM_CHAT_ID = "-1003030758192"
 TOPICO_ID = 28 # ID do tópico (thread) no grupo Telegram
 
+# Repositório onde os CSVs são guardados (ou replicados, com um backend local)
+GITHUB_REPO_DADOS = "ribeiromendes5014-design/Precificar"
+GITHUB_BRANCH_DADOS = "main"
 
-# --- NOVA FUNÇÃO: FORMATACAO BRL ---
-def formatar_brl(valor, decimais=2, prefixo=True):
-    """Formata um valor float para a string de moeda BRL (R$ X.XXX,XX/XXXX) de forma simplificada."""
-    try:
-        valor = float(valor)
-    except (ValueError, TypeError):
-        return "R$ 0,00" if prefixo else "0,00"
+# Intervalo (segundos) em que a sessão verifica se outra sessão publicou alterações no catálogo
+INTERVALO_VERIFICACAO_CATALOGO = 15
 
-    # 1. Formata para o número correto de decimais (usando ponto como separador decimal temporário)
-    s = f"{valor:.{decimais}f}"
-    
-    # 2. Divide em parte inteira e decimal
-    if '.' in s:
-        inteira, decimal = s.split('.')
-    else:
-        inteira = s
-        decimal = '0' * decimais
-
-    # 3. Formata a parte inteira para separador de milhar (ponto)
-    inteira_formatada = ''
-    for i, digito in enumerate(reversed(inteira)):
-        # Adiciona ponto a cada 3 dígitos (exceto no primeiro)
-        if i > 0 and i % 3 == 0 and digito.isdigit():
-            inteira_formatada += '.'
-        inteira_formatada += digito
-    
-    # Inverte a string e remove o prefixo de ponto extra (se houver)
-    inteira_formatada = inteira_formatada[::-1].lstrip('.')
 
-    # 4. Junta tudo com a vírgula como separador decimal
-    resultado = f"{inteira_formatada},{decimal}"
-    if prefixo:
-        return f"R$ {resultado}"
-    return resultado
-# --- FIM NOVA FUNÇÃO ---
 
 
 def gerar_pdf(df: pd.DataFrame) -> BytesIO:
-    """Gera um PDF formatado a partir do DataFrame de precificação, incluindo a URL da imagem."""
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", "B", 16)
-    pdf.cell(0, 10, "Relatório de Precificação", 0, 1, "C")
-    pdf.ln(5)
-
-    # Configurações de fonte para tabela
-    pdf.set_font("Arial", "B", 10) # Fonte menor para caber mais dados
-
-    # Definindo largura das colunas (em mm)
-    col_widths = {
-        "Produto": 40,
-        "Qtd": 15,
-        "Custo Unitário": 25,
-        "Margem (%)": 20,
-        "Preço à Vista": 25,
-        "Preço no Cartão": 25,
-        "URL da Imagem": 40 # Nova coluna para a URL
-    }
-    
-    # Define as colunas a serem exibidas no PDF
-    pdf_cols = [col for col in col_widths.keys() if col in df.columns or col == "Custo Unitário"]
-    current_widths = [col_widths[col] for col in pdf_cols]
+    """
+    Gera o PDF do relatório de precificação (várias páginas, cabeçalho repetido e totais).
+    A geração roda na thread do gerador de relatórios e o resultado fica em cache: o mesmo
+    DataFrame filtrado é devolvido na hora, sem gerar de novo.
+    """
+    futuro = obter_gerador_relatorios().solicitar(df)
+    if not futuro.done():
+        with st.spinner("Gerando PDF..."):
+            futuro.result()
+    return BytesIO(futuro.result())
 
-    # Cabeçalho da tabela
-    for col_name, width in zip(pdf_cols, current_widths):
-        pdf.cell(width, 10, col_name, border=1, align='C')
-    pdf.ln()
 
-    # Fonte para corpo da tabela
-    pdf.set_font("Arial", "", 8) # Fonte ainda menor para caber a URL
-
-    if df.empty:
-        pdf.cell(sum(current_widths), 10, "Nenhum produto cadastrado.", border=1, align="C")
-        pdf.ln()
-    else:
-        # Itera pelas linhas e escreve na tabela
-        for idx, row in df.iterrows():
-            if "Produto" in pdf_cols:
-                pdf.cell(col_widths["Produto"], 10, str(row.get("Produto", "")), border=1)
-            if "Qtd" in pdf_cols:
-                pdf.cell(col_widths["Qtd"], 10, str(row.get("Qtd", 0)), border=1, align="C")
-            if "Custo Unitário" in pdf_cols:
-                # Usa o Custo Total Unitário para o relatório, se disponível
-                custo_unit_val = row.get("Custo Total Unitário", row.get("Custo Unitário", 0.0))
-                pdf.cell(col_widths["Custo Unitário"], 10, formatar_brl(custo_unit_val), border=1, align="R")
-            if "Margem (%)" in pdf_cols:
-                pdf.cell(col_widths["Margem (%)"], 10, f"{row.get('Margem (%)', 0.0):.2f}%", border=1, align="R")
-            if "Preço à Vista" in pdf_cols:
-                pdf.cell(col_widths["Preço à Vista"], 10, formatar_brl(row.get('Preço à Vista', 0.0)), border=1, align="R")
-            if "Preço no Cartão" in pdf_cols:
-                pdf.cell(col_widths["Preço no Cartão"], 10, formatar_brl(row.get('Preço no Cartão', 0.0)), border=1, align="R")
-            
-            # --- NOVO: URL da Imagem no PDF ---
-            if "URL da Imagem" in pdf_cols:
-                url_display = str(row.get("Imagem_URL", ""))
-                # Limita o tamanho da URL para não quebrar o layout
-                if len(url_display) > 35:
-                    url_display = url_display[:32] + "..."
-                pdf.cell(col_widths["URL da Imagem"], 10, url_display, border=1, align="L", link=str(row.get("Imagem_URL", "")))
-            # --- FIM NOVO ---
-                
-            pdf.ln()
-
-    pdf_bytes = pdf.output(dest='S').encode('latin1')
-    return BytesIO(pdf_bytes)
+MAX_FOTOS_RELATORIO = 10  # fotos de produtos enviadas (em álbum) junto com o relatório
 
 
 def enviar_pdf_telegram(pdf_bytesio, df_produtos: pd.DataFrame, thread_id=None):
-    """Envia o arquivo PDF e a primeira imagem (se existir) em mensagens separadas para o Telegram."""
-    
+    """
+    Coloca na fila do Telegram o PDF e, num álbum, as fotos dos primeiros produtos do relatório.
+    O envio acontece em segundo plano; erros aparecem no próximo rerun via exibir_erros_salvamento().
+    """
     token = st.secrets.get("telegram_token", HARDCODED_TELEGRAM_TOKEN)
-    
-    image_url = None
-    image_caption = "Relatório de Precificação"
-    
-    if not df_produtos.empty and "Imagem_URL" in df_produtos.columns:
-        # Tenta encontrar a primeira linha com um produto para usar a imagem e dados
-        first_valid_row = df_produtos.iloc[0]
-        url = first_valid_row.get("Imagem_URL")
-        produto = first_valid_row.get("Produto", "Produto")
-        
-        if isinstance(url, str) and url.startswith("http"):
-            image_url = url
-            # Adiciona informações de filtro ao caption, se aplicável
-            date_info = ""
-            if "Data_Cadastro" in df_produtos.columns and not df_produtos['Data_Cadastro'].empty:
-                try:
-                    # Converte para datetime e remove NaN/NaT
-                    valid_dates = pd.to_datetime(df_produtos['Data_Cadastro'], errors='coerce').dropna()
-                    if not valid_dates.empty:
-                        min_date = valid_dates.min().strftime('%d/%m/%Y')
-                        max_date = valid_dates.max().strftime('%d/%m/%Y')
-                        if min_date == max_date:
-                            date_info = f"\n🗓️ Cadastro em: {min_date}"
-                        else:
-                            date_info = f"\n🗓️ Período: {min_date} a {max_date}"
-                except Exception:
-                    pass # Ignora erros de formatação
-            
-            # Use df_produtos.shape[0] para obter a contagem de produtos no relatório
-            count_info = f"\n📦 Total de Produtos: {df_produtos.shape[0]}"
+    fila = obter_fila_telegram()
+
+    legenda = "Relatório de Precificação"
+    if not df_produtos.empty:
+        # Adiciona informações de filtro ao caption, se aplicável
+        date_info = ""
+        if "Data_Cadastro" in df_produtos.columns and not df_produtos['Data_Cadastro'].empty:
+            try:
+                # Converte para datetime e remove NaN/NaT
+                valid_dates = pd.to_datetime(df_produtos['Data_Cadastro'], errors='coerce').dropna()
+                if not valid_dates.empty:
+                    min_date = valid_dates.min().strftime('%d/%m/%Y')
+                    max_date = valid_dates.max().strftime('%d/%m/%Y')
+                    if min_date == max_date:
+                        date_info = f"\n🗓️ Cadastro em: {min_date}"
+                    else:
+                        date_info = f"\n🗓️ Período: {min_date} a {max_date}"
+            except Exception:
+                pass # Ignora erros de formatação
+        legenda = f"📦 Total de Produtos: {df_produtos.shape[0]}{date_info}\n\n[Relatório de Precificação em anexo]"
+
+    # 1. O PDF (mensagem principal)
+    fila.enviar_documento(token, TELEGRAM_CHAT_ID, pdf_bytesio.getvalue(), "precificacao.pdf", legenda,
+                          thread_id=thread_id)
+
+    # 2. As fotos dos produtos, logo depois do PDF; a fila junta as fotos seguidas num álbum
+    com_foto = df_produtos.iloc[0:0]
+    if "Imagem_URL" in df_produtos.columns:
+        urls = df_produtos["Imagem_URL"]
+        com_foto = df_produtos[urls.map(lambda u: isinstance(u, str) and u.startswith("http"))].head(MAX_FOTOS_RELATORIO)
+    for _, linha in com_foto.iterrows():
+        legenda_foto = f"🖼️ {linha.get('Produto', 'Produto')}"
+        if pd.notna(linha.get("Preço à Vista")):
+            legenda_foto += f" — {formatar_brl(linha.get('Preço à Vista'))}"
+        # A miniatura é obtida pela thread da fila, na hora do envio
+        fila.enviar_foto(token, TELEGRAM_CHAT_ID, linha["Imagem_URL"], legenda_foto, thread_id=thread_id)
+
+    fotos = f" e {len(com_foto)} foto(s)" if len(com_foto) else ""
+    st.success(f"📨 PDF{fotos} na fila de envio do Telegram.")
+
+
+@st.cache_resource
+def retomar_fila_telegram():
+    """
+    Registra o token do bot na fila uma vez por processo. A fila não grava o token em disco:
+    mensagens que ficaram pendentes de uma execução anterior só voltam a sair depois disto.
+    """
+    obter_fila_telegram().registrar_token(st.secrets.get("telegram_token", HARDCODED_TELEGRAM_TOKEN))
 
-            image_caption = f"📦 Produto Principal: {produto}{count_info}{date_info}\n\n[Relatório de Precificação em anexo]"
 
-    # Se não houver URL de imagem, usa um caption simples
-    caption_doc = image_caption if not image_url else "[Relatório de Precificação em anexo]"
+TAMANHOS_PAGINA = [10, 25, 50, 100]
 
-    # 1. Envia o PDF (mensagem principal)
-    
-    url_doc = f"https://api.telegram.org/bot{token}/sendDocument"
-    files_doc = {'document': ('precificacao.pdf', pdf_bytesio, 'application/pdf')}
-    data_doc = {"chat_id": TELEGRAM_CHAT_ID, "caption": caption_doc}
-    if thread_id is not None:
-        data_doc["message_thread_id"] = thread_id
-    
-    resp_doc = requests.post(url_doc, data=data_doc, files=files_doc)
-    resp_doc_json = resp_doc.json()
-    
-    if not resp_doc_json.get("ok"):
-         st.error(f"❌ Erro ao enviar PDF: {resp_doc_json.get('description')}")
-         return
 
-    st.success("✅ PDF enviado para o Telegram.")
-    
-    # 2. Envia a foto (se existir) em uma mensagem separada
-    if image_url:
+def paginar(df: pd.DataFrame, chave: str, colunas_ordenacao=(), tamanho_padrao: int = 25) -> pd.DataFrame:
+    """
+    Desenha os controles de ordenação/paginação e retorna só as linhas da página atual
+    (com o índice original). Assim só os widgets da página visível são criados.
+    """
+    total = len(df)
+    opcoes_ordem = [c for c in colunas_ordenacao if c in df.columns]
+    c1, c2, c3, c4 = st.columns([2, 1, 1, 1])
+    with c1:
+        ordenar_por = st.selectbox("Ordenar por", ["Ordem de cadastro"] + opcoes_ordem, key=f"{chave}_ordem")
+    with c2:
+        decrescente = st.checkbox("Decrescente", key=f"{chave}_decrescente")
+    with c3:
+        tamanho = st.selectbox(
+            "Por página", TAMANHOS_PAGINA,
+            index=TAMANHOS_PAGINA.index(tamanho_padrao) if tamanho_padrao in TAMANHOS_PAGINA else 0,
+            key=f"{chave}_tamanho"
+        )
+    paginas = max(1, -(-total // tamanho))
+    chave_pagina = f"{chave}_pagina"
+    # O total de páginas muda com filtros/exclusões: a página guardada não pode passar do limite
+    if st.session_state.get(chave_pagina, 1) > paginas:
+        st.session_state[chave_pagina] = paginas
+    with c4:
+        pagina = st.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas, step=1, key=chave_pagina)
+
+    if ordenar_por in opcoes_ordem:
+        df = df.sort_values(ordenar_por, ascending=not decrescente, kind="stable", na_position="last")
+    elif decrescente:
+        df = df.iloc[::-1]
+
+    inicio = (int(pagina) - 1) * tamanho
+    fim = min(inicio + tamanho, total)
+    st.caption(f"Mostrando {inicio + 1 if total else 0}–{fim} de {total}")
+    return df.iloc[inicio:fim]
+
+
+@lru_cache(maxsize=4096)
+def _markup_cartao(produto, qtd, cor, marca, data_cadastro, custo_base, custos_extras_prod, rateio_global,
+                   custo_total_unitario, margem, preco_vista, preco_cartao) -> str:
+    """
+    Texto (markdown) do cartão de um produto. Depende só dos valores exibidos, então é montado
+    uma vez por versão da linha e reaproveitado entre reruns e sessões.
+    """
+    if data_cadastro != 'N/A':
+        # Formata a data para dd/mm/yyyy para exibição
+        date_dt = pd.to_datetime(data_cadastro, errors='coerce')
+        data_cadastro = date_dt.strftime('%d/%m/%Y') if pd.notna(date_dt) else 'Data Inválida'
+
+    linhas = [
+        f"**{produto}**",
+        f"📦 Quantidade: {qtd}",
+        f"🎨 Cor: {cor} | 🏭 Marca: {marca} | 📅 Cadastro: {data_cadastro}",
+        f"💰 Custo Base: {formatar_brl(custo_base)}",
+    ]
+    # Rateio/Extras = custos extras específicos do produto + rateio global por unidade
+    try:
+        rateio_e_extras = float(custos_extras_prod) + float(rateio_global)
+    except (TypeError, ValueError):
+        rateio_e_extras = 0.0
+    linhas.append(f"🛠 Rateio/Extras (Total/Un.): {formatar_brl(rateio_e_extras, decimais=4)}")
+    if custo_total_unitario is not None:
+        linhas.append(f"💸 Custo Total/Un: **{formatar_brl(custo_total_unitario)}**")
+    if margem is not None:
         try:
-            url_photo = f"https://api.telegram.org/bot{token}/sendPhoto"
-            
-            # Faz o Telegram buscar a foto diretamente da URL
-            data_photo = {
-                "chat_id": TELEGRAM_CHAT_ID, 
-                "photo": image_url,
-                "caption": f"🖼️ Foto do Produto Principal: {produto}"
-            }
-            if thread_id is not None:
-                data_photo["message_thread_id"] = thread_id
-
-            resp_photo = requests.post(url_photo, data=data_photo)
-            resp_photo_json = resp_photo.json()
-
-            if resp_photo_json.get("ok"):
-                st.success("✅ Foto do produto principal enviada com sucesso!")
-            else:
-                 st.warning(f"❌ Erro ao enviar a foto do produto: {resp_photo_json.get('description')}")
-                 
-        except Exception as e:
-            st.warning(f"⚠️ Erro ao tentar enviar a imagem. Erro: {e}")
-            
-
-def exibir_resultados(df: pd.DataFrame, imagens_dict: dict):
-    """Exibe os resultados de precificação com tabela e imagens dos produtos."""
+            margem_float = float(margem)
+        except (TypeError, ValueError):
+            margem_float = 0
+        linhas.append(f"📈 Margem: **{margem_float:.2f}%**")
+    if preco_vista is not None:
+        linhas.append(f"💰 Preço à Vista: **{formatar_brl(preco_vista)}**")
+    if preco_cartao is not None:
+        linhas.append(f"💳 Preço no Cartão: **{formatar_brl(preco_cartao)}**")
+    # Escapa "$" para o markdown não interpretar "R$ ... R$" como LaTeX
+    return "  \n".join(linhas).replace("$", "\\$")
+
+
+def _valor_cartao(row, coluna, padrao=None):
+    """Valor de `row` para o cartão, hasheável (NaN vira None)."""
+    valor = row.get(coluna, padrao)
+    if isinstance(valor, float) and np.isnan(valor):
+        return padrao
+    return valor
+
+
+def exibir_resultados(df: pd.DataFrame, imagens_dict: dict, url_base_imagens: str = None):
+    """
+    Exibe os resultados de precificação em cartões paginados, com imagem dos produtos.
+    `url_base_imagens` é de onde baixar as fotos do armazém que não estão no disco deste servidor.
+    """
     if df is None or df.empty:
         st.info("⚠️ Nenhum produto disponível para exibir.")
         return
 
     st.subheader("📊 Resultados Detalhados da Precificação")
 
-    for idx, row in df.iterrows():
+    pagina = paginar(
+        df, "resultados",
+        colunas_ordenacao=["Produto", "Preço à Vista", "Margem (%)", "Custo Total Unitário", "Qtd", "Data_Cadastro"],
+    )
+
+    # Miniaturas da página visível, baixadas em paralelo (e só na primeira vez: ficam em cache no disco)
+    cache_miniaturas = obter_miniaturas()
+    miniaturas_url = {}
+    if "Imagem_URL" in pagina.columns:
+        miniaturas_url = cache_miniaturas.preparar(pagina["Imagem_URL"].tolist(), LARGURA_CARTAO)
+
+    for _, row in pagina.iterrows():
         with st.container():
             cols = st.columns([1, 3])
             with cols[0]:
-                img_to_display = None
-                
-                # 1. Tenta carregar imagem do dicionário (upload manual)
+                # 1. Imagem do upload manual; 2. foto do armazém (ou bytes legados); 3. URL persistida
                 img_to_display = imagens_dict.get(row.get("Produto"))
+                imagem = row.get("Imagem")
+                if img_to_display is None and eh_referencia(imagem):
+                    img_to_display = obter_armazem().ler(imagem, url_base_imagens)
+                elif img_to_display is None and isinstance(imagem, bytes):
+                    img_to_display = imagem
 
-                # 2. Tenta carregar imagem dos bytes (se persistido)
-                if img_to_display is None and row.get("Imagem") is not None and isinstance(row.get("Imagem"), bytes):
-                    try:
-                        img_to_display = row.get("Imagem")
-                    except Exception:
-                        pass # Continua tentando a URL
-
-                # 3. Tenta carregar imagem da URL (se persistido)
                 img_url = row.get("Imagem_URL")
                 if img_to_display is None and img_url and isinstance(img_url, str) and img_url.startswith("http"):
-                    st.image(img_url, width=100, caption="URL")
+                    # Sem miniatura (falha no download/decodificação), o navegador busca a original
+                    st.image(miniaturas_url.get(img_url) or img_url, width=100, caption="URL")
                 elif img_to_display:
-                    st.image(img_to_display, width=100, caption="Arquivo")
+                    st.image(cache_miniaturas.obter_de_bytes(img_to_display) or img_to_display, width=100, caption="Arquivo")
                 else:
                     st.write("🖼️ N/A")
-                    
+
             with cols[1]:
-                st.markdown(f"**{row.get('Produto', '—')}**")
-                st.write(f"📦 Quantidade: {row.get('Qtd', '—')}")
-                
-                # Exibição dos novos campos, se existirem
-                cor = row.get('Cor', 'N/A')
-                marca = row.get('Marca', 'N/A')
-                data_cadastro = row.get('Data_Cadastro', 'N/A')
-                if data_cadastro != 'N/A':
-                    try:
-                        # Formata a data para dd/mm/yyyy para exibição
-                        date_dt = pd.to_datetime(data_cadastro, errors='coerce')
-                        if pd.notna(date_dt):
-                            data_cadastro = date_dt.strftime('%d/%m/%Y')
-                        else:
-                            data_cadastro = 'Data Inválida'
-                    except Exception:
-                        pass # Mantém o valor original se a formatação falhar
+                custo_base = _valor_cartao(row, 'Custo Unitário', 0.0)
+                st.markdown(_markup_cartao(
+                    str(row.get('Produto', '—')),
+                    _valor_cartao(row, 'Qtd', '—'),
+                    _valor_cartao(row, 'Cor', 'N/A'),
+                    _valor_cartao(row, 'Marca', 'N/A'),
+                    _valor_cartao(row, 'Data_Cadastro', 'N/A'),
+                    custo_base,
+                    _valor_cartao(row, 'Custos Extras Produto', 0.0),
+                    _valor_cartao(row, 'Rateio Global Unitário', 0.0),
+                    _valor_cartao(row, 'Custo Total Unitário', custo_base) if 'Custo Total Unitário' in df.columns else None,
+                    _valor_cartao(row, 'Margem (%)', 0) if 'Margem (%)' in df.columns else None,
+                    _valor_cartao(row, 'Preço à Vista', 0) if 'Preço à Vista' in df.columns else None,
+                    _valor_cartao(row, 'Preço no Cartão', 0) if 'Preço no Cartão' in df.columns else None,
+                ))
+
+
+def atualizar_composicao(produto_antigo: str, produto_novo: str, itens: dict):
+    """
+    Substitui a composição (ficha técnica) de um produto da papelaria em st.session_state.composicao.
+    `itens` mapeia insumo -> quantidade; com `itens` vazio a composição do produto é removida.
+    """
+    composicao_atual = st.session_state.composicao
+    removidas = np.flatnonzero((composicao_atual["Produto"] == str(produto_antigo)).to_numpy())
+    composicao_atual = remover_produto(composicao_atual, produto_antigo)
+    if itens:
+        composicao_atual = definir_composicao(composicao_atual, produto_novo, itens)
+    st.session_state.composicao = composicao_atual
 
-                st.write(f"🎨 Cor: {cor} | 🏭 Marca: {marca} | 📅 Cadastro: {data_cadastro}")
+    rastreio = rastreador("composicao", colunas_ignoradas=())
+    rastreio.marcar_exclusao(removidas)
+    if itens:
+        rastreio.marcar_inclusao(len(itens))
 
-                custo_base = row.get('Custo Unitário', 0.0)
-                custo_total_unitario = row.get('Custo Total Unitário', custo_base)
 
-                st.write(f"💰 Custo Base: {formatar_brl(custo_base)}")
+def propagar_custos_insumos(insumos_alterados) -> pd.DataFrame:
+    """
+    Reprecifica os produtos da papelaria que usam algum dos `insumos_alterados`, usando o
+    índice reverso insumo -> produtos da composição (reconstruído só quando a composição muda).
+    Retorna o resumo (custo e preço antes/depois) dos produtos alterados.
+    """
+    indice = st.session_state.get("indice_reverso_composicao")
+    if indice is None or not indice.valido_para(st.session_state.composicao):
+        indice = IndiceReverso(st.session_state.composicao)
+        st.session_state.indice_reverso_composicao = indice
+
+    produtos, posicoes, resumo = repreciar_por_insumos(
+        st.session_state.produtos, st.session_state.composicao, st.session_state.insumos,
+        insumos_alterados, indice=indice,
+    )
+    if len(posicoes):
+        st.session_state.produtos = produtos
+        rastreador("produtos", colunas_ignoradas=()).marcar_linhas(posicoes)
+    return resumo
+
+
+# Colunas de ENTRADA da precificação (apenas dados brutos; o resto é recalculado)
+COLUNAS_ENTRADA_PRECIFICACAO = [
+    "Produto", "Qtd", "Custo Unitário", "Margem (%)", "Custos Extras Produto", "Imagem", "Imagem_URL", "Cor", "Marca", "Data_Cadastro"
+]
+
+
+def preparar_produtos_manuais(df_loaded: pd.DataFrame) -> pd.DataFrame:
+    """Filtra as colunas de entrada do CSV de precificação e garante as ausentes."""
+    if df_loaded.empty:
+        return df_loaded
+    df_base_loaded = df_loaded[[col for col in COLUNAS_ENTRADA_PRECIFICACAO if col in df_loaded.columns]].copy()
+
+    # Garante que as colunas de ENTRADA existam, mesmo que vazias
+    if "Custos Extras Produto" not in df_base_loaded.columns: df_base_loaded["Custos Extras Produto"] = 0.0
+    if "Imagem" not in df_base_loaded.columns: df_base_loaded["Imagem"] = None
+    if "Imagem_URL" not in df_base_loaded.columns: df_base_loaded["Imagem_URL"] = ""
+    if "Cor" not in df_base_loaded.columns: df_base_loaded["Cor"] = ""
+    if "Marca" not in df_base_loaded.columns: df_base_loaded["Marca"] = ""
+    # CSVs antigos têm a data também numa coluna "Data Cadastro" (com espaço): junta as duas em
+    # Data_Cadastro, que é a única salva (a duplicada some do CSV no próximo salvamento)
+    if "Data Cadastro" in df_loaded.columns:
+        legada = df_loaded["Data Cadastro"]
+        if "Data_Cadastro" in df_base_loaded.columns:
+            atual = df_base_loaded["Data_Cadastro"]
+            legada = atual.where(atual.notna() & (atual.astype(str).str.strip() != ""), legada)
+        df_base_loaded["Data_Cadastro"] = legada
+    # Garante que Data_Cadastro é string para evitar problemas de tipo no Streamlit
+    if "Data_Cadastro" not in df_base_loaded.columns: df_base_loaded["Data_Cadastro"] = pd.to_datetime('today').normalize().strftime('%Y-%m-%d')
+    return df_base_loaded
+
+
+def precificar_produtos_manuais(frete_total: float, custos_extras: float,
+                                modo_margem: str, margem_fixa: float) -> pd.DataFrame:
+    """
+    Precifica st.session_state.produtos_manuais de forma incremental: o resultado fica materializado
+    na sessão e só as linhas marcadas no rastreador "precificacao" são recalculadas
+    (mudança de frete/custos extras vira uma atualização vetorizada do rateio).
+    """
+    if "precificacao_incremental" not in st.session_state:
+        incremental = PrecificacaoIncremental()
+        rastreador("precificacao").ouvintes.append(incremental)
+        st.session_state.precificacao_incremental = incremental
+    return st.session_state.precificacao_incremental.calcular(
+        st.session_state.produtos_manuais, frete_total, custos_extras, modo_margem, margem_fixa
+    )
 
-                custos_extras_prod = row.get('Custos Extras Produto', 0.0)
-                # Puxa o rateio global unitário calculado na função processar_dataframe
-                rateio_global_unitario = row.get('Rateio Global Unitário', 0.0) 
-                
-                # Exibe a soma dos custos extras específicos (se houver) e o rateio global por unidade
-                # NOTA: O Custos Extras Produto é o valor ESPECÍFICO do produto (digitado pelo usuário ou 0.0)
-                rateio_e_extras_display = custos_extras_prod + rateio_global_unitario
-                st.write(f"🛠 Rateio/Extras (Total/Un.): {formatar_brl(rateio_e_extras_display, decimais=4)}") # Exibição com mais decimais para rateio
-                
-                if 'Custo Total Unitário' in df.columns:
-                    st.write(f"💸 Custo Total/Un: **{formatar_brl(custo_total_unitario)}**")
 
-                if "Margem (%)" in df.columns:
-                    margem_val = row.get("Margem (%)", 0)
-                    try:
-                        margem_float = float(margem_val)
-                    except Exception:
-                        margem_float = 0
-                    st.write(f"📈 Margem: **{margem_float:.2f}%**")
-                
-                if "Preço à Vista" in df.columns:
-                    st.write(f"💰 Preço à Vista: **{formatar_brl(row.get('Preço à Vista', 0))}**")
-                if "Preço no Cartão" in df.columns:
-                    st.write(f"💳 Preço no Cartão: **{formatar_brl(row.get('Preço no Cartão', 0))}**")
-
-
-def processar_dataframe(df: pd.DataFrame, frete_total: float, custos_extras: float,
-                        modo_margem: str, margem_fixa: float) -> pd.DataFrame:
-    """Processa o DataFrame, aplica rateio, margem e calcula os preços finais."""
-    if df.empty:
-        # Garante que o DataFrame tem as colunas mínimas esperadas para evitar erros de índice/coluna
-        return pd.DataFrame(columns=[
-            "Produto", "Qtd", "Custo Unitário", "Custos Extras Produto", 
-            "Custo Total Unitário", "Margem (%)", "Preço à Vista", "Preço no Cartão", 
-            "Rateio Global Unitário", "Cor", "Marca", "Data_Cadastro" # ADDED NEW COLUMNS
-        ])
+# Colunas de produtos_manuais consultadas pela busca (relatórios e Tabela Principal)
+COLUNAS_BUSCA_PRECIFICACAO = ["Produto", "Cor", "Marca"]
 
-    df = df.copy()
+# Colunas de entrada de produtos_manuais que podem ser editadas na Tabela Principal
+# (as demais colunas exibidas são recalculadas pela precificação)
+COLUNAS_EDITAVEIS_TABELA = [
+    "Produto", "Qtd", "Custo Unitário", "Margem (%)", "Custos Extras Produto", "Cor", "Marca", "Data_Cadastro"
+]
 
-    # Garante que as colunas de custo e quantidade são numéricas
-    for col in ["Qtd", "Custo Unitário", "Margem (%)", "Custos Extras Produto"]:
-        if col in df.columns:
-            # Tenta converter, falhando para 0.0 se não for possível
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0)
-        elif col not in df.columns:
-            # Adiciona colunas ausentes com valor 0.0 se for necessário para o cálculo
-            df[col] = 0.0
-    
-    # Garante as novas colunas de texto/data
-    for col in ["Cor", "Marca", "Data_Cadastro"]:
-         if col not in df.columns:
-            df[col] = "" # Inicializa como string vazia
-
-    # --- Cálculo do Rateio Global ---
-    # NOTA: O cálculo do rateio é sempre baseado nos totais para consistência.
-    qtd_total = df["Qtd"].sum()
-    rateio_unitario = 0.0
-    if qtd_total > 0:
-        rateio_unitario = (frete_total + custos_extras) / qtd_total
-
-    # Salva o rateio global unitário na coluna que será persistida e usada no cálculo total
-    df["Rateio Global Unitário"] = rateio_unitario 
-    
-    # O Custo Total Unitário é a soma do Custo Unitário Base + Custos Específicos + Rateio Global.
-    df["Custo Total Unitário"] = df["Custo Unitário"] + df["Custos Extras Produto"] + df["Rateio Global Unitário"]
 
-    # Processar margens conforme o modo selecionado
-    if "Margem (%)" not in df.columns:
-        df["Margem (%)"] = margem_fixa
-    
-    df["Margem (%)"] = df["Margem (%)"].apply(lambda x: x if pd.notna(x) else margem_fixa)
+def aplicar_delta_tabela_principal(estado_editor: dict, posicoes_exibidas=None) -> tuple:
+    """
+    Aplica em st.session_state.produtos_manuais o delta do st.data_editor da Tabela Principal
+    (`edited_rows` e `deleted_rows`, por posição da linha exibida). As linhas exibidas estão
+    alinhadas com produtos_manuais (ou, com uma busca ativa, mapeadas por `posicoes_exibidas`),
+    então o custo é O(células alteradas), não O(tabela).
+    Retorna (posições editadas, posições excluídas) — só o que mudou de fato.
+    """
+    df = st.session_state.produtos_manuais
+    n = len(df)
+
+    def posicao_real(pos) -> int:
+        pos = int(pos)
+        if posicoes_exibidas is None:
+            return pos
+        return int(posicoes_exibidas[pos]) if 0 <= pos < len(posicoes_exibidas) else -1
+
+    # Agrupa por coluna para fazer uma escrita em lote por coluna
+    por_coluna = {}
+    for pos, alteracoes in (estado_editor.get("edited_rows") or {}).items():
+        pos = posicao_real(pos)
+        if not 0 <= pos < n:
+            continue
+        for col, valor in alteracoes.items():
+            if col in COLUNAS_EDITAVEIS_TABELA:
+                por_coluna.setdefault(col, {})[pos] = valor
+
+    editadas = set()
+    for col, valores in por_coluna.items():
+        posicoes = np.fromiter(valores, dtype=int, count=len(valores))
+        novos = pd.Series(list(valores.values()), dtype=object)
+        if col in df.columns:
+            atuais = df[col].iloc[posicoes].reset_index(drop=True).astype(object)
+            iguais = (atuais == novos) | (atuais.isna() & novos.isna())
+            posicoes, novos = posicoes[~iguais.to_numpy()], novos[~iguais]
+            if not len(posicoes):
+                continue
+        else:
+            df[col] = None
+        atribuir_linhas(df, col, posicoes, novos.infer_objects().to_numpy())
+        editadas.update(posicoes.tolist())
+    if editadas:
+        rastreador("precificacao").marcar_linhas(sorted(editadas))
 
+    excluidas = sorted({
+        posicao_real(p) for p in (estado_editor.get("deleted_rows") or []) if 0 <= posicao_real(p) < n
+    })
+    if excluidas:
+        mantidos = np.ones(n, dtype=bool)
+        mantidos[excluidas] = False
+        st.session_state.produtos_manuais = df[mantidos].reset_index(drop=True)
+        rastreador("precificacao").marcar_exclusao(excluidas)
 
-    # Calcular os preços finais
-    df["Preço à Vista"] = df["Custo Total Unitário"] * (1 + df["Margem (%)"] / 100)
-    # Taxa de cartão de 11.28% (para chegar a 0.8872 do preço de venda)
-    df["Preço no Cartão"] = df["Preço à Vista"] / 0.8872
+    return sorted(editadas), excluidas
 
-    # Seleciona as colunas relevantes para o DataFrame final de exibição
-    cols_to_keep = [
-        "Produto", "Qtd", "Custo Unitário", "Custos Extras Produto", 
-        "Custo Total Unitário", "Margem (%)", "Preço à Vista", "Preço no Cartão", 
-        "Imagem", "Imagem_URL", "Rateio Global Unitário", 
-        "Cor", "Marca", "Data_Cadastro" # ADDED NEW COLUMNS
-    ]
-    
-    # Mantém apenas as colunas que existem no DF
-    df_final = df[[col for col in cols_to_keep if col in df.columns]]
 
-    return df_final
+def armazenamento() -> Armazenamento:
+    """
+    Backend dos dados do app, escolhido pelo secret `armazenamento`: "github" (padrão, CSVs no
+    repositório), "sqlite", "parquet" ou "registro" (arquivos locais; "registro" grava só as
+    operações, com compactação periódica). Com um backend local, as gravações
+    continuam sendo copiadas para o GitHub (secret `replicar_github`, ligado por padrão, menos no
+    "registro": lá cada cópia reescreveria o CSV inteiro, o que ele existe para evitar) e um
+    conjunto que ainda não existe localmente é carregado do GitHub na primeira vez.
+    """
+    github = ArmazenamentoGitHub(
+        st.secrets.get("github_token", "TOKEN_FICTICIO"), GITHUB_REPO_DADOS, GITHUB_BRANCH_DADOS,
+        # Dentro do TTL (secret `csv_cache_ttl`, em segundos) a leitura do GitHub não acessa a rede
+        ttl=float(st.secrets.get("csv_cache_ttl", TTL_CSV_PADRAO)),
+    )
+    tipo = st.secrets.get("armazenamento", "github")
+    if tipo == "github":
+        return github
+    replica = github if st.secrets.get("replicar_github", tipo != "registro") else None
+    return ArmazenamentoReplicado(obter_armazenamento_local(tipo), replica)
 
 
-def load_csv_github(url: str) -> pd.DataFrame:
-    """Carrega um arquivo CSV diretamente do GitHub."""
+def carregar_dados(nome: str, forcar: bool = False) -> pd.DataFrame:
+    """
+    Carrega o conjunto `nome` (ex.: "precificacao.csv") do backend configurado.
+    `forcar=True` ignora o TTL do cache do GitHub (ex.: botão de recarregar).
+    """
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        df = pd.read_csv(StringIO(response.text))
-        return df
+        return armazenamento().carregar(nome, revalidar=forcar)
     except Exception as e:
-        # st.error(f"Erro ao carregar CSV do GitHub: {e}") # Silencioso na inicialização
+        st.error(f"❌ Erro ao carregar `{nome}`: {e}")
         return pd.DataFrame()
 
 
@@ -396,50 +480,189 @@ def _opcoes_para_lista(opcoes_str):
         return []
     return [o.strip() for o in str(opcoes_str).split(",") if o.strip()]
 
-def hash_df(df):
+def rastreador(nome: str, colunas_ignoradas=()) -> RastreadorAlteracoes:
     """
-    Gera um hash para o DataFrame para detecção de mudanças.
-    Usa um método mais robusto que evita problemas com dtypes específicos do pandas.
+    Rastreador de alterações do DataFrame `nome` da sessão (criado na primeira chamada).
+    Os caminhos que alteram o DF devem marcar as linhas afetadas (marcar_linhas/inclusao/exclusao),
+    assim a detecção de mudanças para o salvamento automático custa O(linhas alteradas).
     """
-    # Cria uma cópia para evitar SettingWithCopyWarning e garante que não há colunas de bytes,
-    # que devem ser removidas ANTES de chamar esta função (o que já está sendo feito no precificacao_completa).
-    df_temp = df.copy() 
-    
-    # Converte colunas 'object' para string explícita para garantir hash consistente, se necessário,
-    # mas o pd.util.hash_pandas_object deve lidar bem com 'object' por padrão.
-    # O foco aqui é garantir que todos os dados estejam em formatos que o hash consiga processar.
-    
+    chave = f"rastreio_{nome}"
+    if chave not in st.session_state:
+        st.session_state[chave] = RastreadorAlteracoes(colunas_ignoradas)
+    return st.session_state[chave]
+
+
+def indice_nomes(nome: str, coluna: str) -> IndiceNomes:
+    """
+    Índice `coluna` -> linhas do DataFrame `nome` da sessão, invalidado pelas marcações do
+    rastreador do mesmo DF (ver rastreador()).
+    """
+    chave = f"indice_nomes_{nome}"
+    if chave not in st.session_state:
+        indice = IndiceNomes(coluna)
+        rastreador(nome, colunas_ignoradas=()).ouvintes.append(indice)
+        st.session_state[chave] = indice
+    return st.session_state[chave]
+
+
+def indice_busca(nome: str, colunas) -> IndiceBusca:
+    """
+    Índice de busca (sem acentos, com tolerância a erros de digitação) sobre `colunas` do
+    DataFrame `nome` da sessão, atualizado pelas marcações do rastreador do mesmo DF.
+    """
+    chave = f"indice_busca_{nome}"
+    if chave not in st.session_state:
+        indice = IndiceBusca(colunas)
+        rastreador(nome, colunas_ignoradas=()).ouvintes.append(indice)
+        st.session_state[chave] = indice
+    indice = st.session_state[chave]
+    indice.definir_colunas(colunas)
+    return indice
+
+
+def opcoes_com_busca(rotulo: str, df: pd.DataFrame, nome: str, coluna: str, colunas_busca, key: str) -> list:
+    """
+    Campo de busca acima de um seletor: devolve [""] + os valores de `coluna` das linhas que
+    casam com o texto digitado (as mais relevantes primeiro), ou de todas as linhas sem busca.
+    """
+    consulta = st.text_input(rotulo, key=key, placeholder="Nome, categoria ou outro campo...")
+    if consulta.strip():
+        posicoes = indice_busca(nome, colunas_busca).buscar(df, consulta)
+        valores = df[coluna].iloc[posicoes]
+    else:
+        valores = df[coluna]
+    return [""] + list(dict.fromkeys(valores.astype(str).fillna("").tolist()))
+
+
+def agregados_catalogo() -> AgregadosCatalogo:
+    """
+    Somas por Marca/Cor/mês dos produtos da precificação (aba Painel), atualizadas pelas
+    marcações do rastreador "precificacao" em vez de um groupby do DF inteiro a cada rerun.
+    """
+    if "agregados_catalogo" not in st.session_state:
+        agregados = AgregadosCatalogo()
+        rastreador("precificacao").ouvintes.append(agregados)
+        st.session_state.agregados_catalogo = agregados
+    return st.session_state.agregados_catalogo
+
+
+def indice_datas() -> IndiceDatas:
+    """
+    Índice ordenado de Data_Cadastro dos produtos da precificação (filtro por período dos
+    relatórios), atualizado pelas marcações do rastreador "precificacao".
+    """
+    if "indice_datas" not in st.session_state:
+        indice = IndiceDatas("Data_Cadastro")
+        rastreador("precificacao").ouvintes.append(indice)
+        st.session_state.indice_datas = indice
+    return st.session_state.indice_datas
+
+
+def salvar_dados(dataframes: dict, mensagem: str = "Atualização via app", alteracoes: Optional[dict] = None):
+    """
+    Grava os conjuntos (nome -> DataFrame) no backend configurado. No SQLite só as linhas
+    alteradas são gravadas; no registro, `alteracoes` (nome -> rastreador(...).alteracoes())
+    evita comparar o DF inteiro com o que está gravado; o envio ao GitHub é feito em segundo plano pelo gravador do processo
+    (debounce, um commit para os arquivos pendentes juntos), então o rerun não espera pela API.
+    Erros do GitHub aparecem no próximo rerun via exibir_erros_salvamento().
+    """
+    # Os DFs de entrada já devem estar sem colunas de bytes (ex: 'Imagem')
     try:
-        return hashlib.md5(pd.util.hash_pandas_object(df_temp, index=False).values).hexdigest()
+        armazenamento().salvar_varios(dataframes, mensagem, alteracoes)
     except Exception as e:
-        # Se houver erro, tenta converter colunas object para string
-        for col in df_temp.select_dtypes(include=['object']).columns:
-             df_temp[col] = df_temp[col].astype(str)
-        try:
-             return hashlib.md5(pd.util.hash_pandas_object(df_temp, index=False).values).hexdigest()
-        except Exception as inner_e:
-             st.error(f"Erro interno no hash do DataFrame: {inner_e}")
-             return "error" # Retorna um valor fixo em caso de falha grave
-             
-
-def salvar_csv_no_github(token, repo, path, dataframe, branch="main", mensagem="Atualização via app"):
-    """Salva o DataFrame como CSV no GitHub via API."""
-    from requests import get, put
-    url = f"https://api.github.com/repos/{repo}/contents/{path}"
-    # O DF de entrada já deve estar sem colunas de bytes (ex: 'Imagem')
-    conteudo = dataframe.to_csv(index=False)
-    conteudo_b64 = base64.b64encode(conteudo.encode()).decode()
-    headers = {"Authorization": f"token {token}"}
-    r = get(url, headers=headers)
-    sha = r.json().get("sha") if r.status_code == 200 else None
-    payload = {"message": mensagem, "content": conteudo_b64, "branch": branch}
-    if sha: payload["sha"] = sha
-    r2 = put(url, headers=headers, json=payload)
-    if r2.status_code in (200, 201):
-        # st.success(f"✅ Arquivo `{path}` atualizado no GitHub!")
-        pass # Mensagem de sucesso silenciosa para evitar ruído
-    else:
-        st.error(f"❌ Erro ao salvar `{path}`: {r2.text}")
+        st.error(f"❌ Erro ao salvar {', '.join(f'`{nome}`' for nome in dataframes)}: {e}")
+        return False
+    return True
+
+
+@st.cache_resource
+def catalogo_compartilhado() -> CatalogoCompartilhado:
+    """
+    Catálogo único do processo (st.cache_resource): os DataFrames são carregados uma vez e
+    todas as sessões leem dele, cada uma com uma cópia rasa (copy-on-write) para as suas edições.
+    """
+    return CatalogoCompartilhado()
+
+
+def _versoes_catalogo() -> dict:
+    """Versão do catálogo compartilhado em que cada DF da sessão se baseia."""
+    if "versoes_catalogo" not in st.session_state:
+        st.session_state.versoes_catalogo = {}
+    return st.session_state.versoes_catalogo
+
+
+def carregar_compartilhado(nome: str, carregar) -> pd.DataFrame:
+    """DF `nome` do catálogo compartilhado; `carregar()` só roda se nenhuma sessão o carregou ainda."""
+    versao, df = catalogo_compartilhado().obter(nome, carregar)
+    _versoes_catalogo()[nome] = versao
+    return df
+
+
+def publicar_compartilhado(nome: str, df: pd.DataFrame, rastreio: RastreadorAlteracoes) -> tuple:
+    """
+    Publica o DF alterado pela sessão no catálogo compartilhado. Retorna (df, mesclado):
+    com `mesclado=True` outra sessão publicou antes e o DF retornado já inclui as duas alterações.
+    As alterações marcadas em `rastreio` poupam o catálogo de comparar o DF inteiro.
+    """
+    versoes = _versoes_catalogo()
+    versao, df, mesclado = catalogo_compartilhado().publicar(nome, df, versoes.get(nome), rastreio.alteracoes())
+    versoes[nome] = versao
+    return df, mesclado
+
+
+def atualizar_do_compartilhado(nome: str) -> Optional[pd.DataFrame]:
+    """DF `nome` publicado por outra sessão depois da versão desta, ou None se a sessão está em dia."""
+    catalogo, versoes = catalogo_compartilhado(), _versoes_catalogo()
+    versao = catalogo.versao(nome)
+    if versao is None or versao == versoes.get(nome):
+        return None
+    versao, df = catalogo.obter(nome)
+    versoes[nome] = versao
+    return df
+
+
+@st.cache_resource
+def pre_carregar_catalogo() -> dict:
+    """
+    Aquecimento do processo (roda uma vez, na primeira execução do script): baixa todos os
+    conjuntos em paralelo para o catálogo compartilhado, sem bloquear. Cada página espera só
+    pelos conjuntos que usa, então a primeira abertura custa o download mais lento, não a soma.
+    """
+    backend = armazenamento()
+
+    def carregador(nome: str, preparar=lambda df: df):
+        def carregar():
+            try:
+                return preparar(backend.carregar(nome))
+            except Exception:
+                return pd.DataFrame()  # A sessão tenta de novo (e mostra o erro) ao abrir a página
+        return carregar
+
+    return catalogo_compartilhado().pre_carregar({
+        "produtos_manuais": carregador("precificacao.csv", preparar_produtos_manuais),
+        "insumos": carregador("insumos_papelaria.csv"),
+        "produtos": carregador("produtos_papelaria.csv"),
+        "campos": carregador("categorias_papelaria.csv"),
+        "composicao": carregador("composicao_papelaria.csv", normalizar_composicao),
+    })
+
+
+@st.fragment(run_every=INTERVALO_VERIFICACAO_CATALOGO)
+def verificar_catalogo_compartilhado(nomes):
+    """
+    Verifica periodicamente se outra sessão publicou alguma versão nova dos DFs `nomes`
+    e, se sim, roda o app de novo para que esta sessão adote (ou mescle) as alterações.
+    """
+    catalogo, versoes = catalogo_compartilhado(), _versoes_catalogo()
+    if any(catalogo.versao(nome) not in (None, versoes.get(nome)) for nome in nomes if nome in versoes):
+        st.rerun(scope="app")
+
+
+def exibir_erros_salvamento():
+    """Mostra os erros dos salvamentos (e envios ao Telegram) feitos em segundo plano desde o último rerun."""
+    erros = obter_gravador().consumir_erros() + obter_armazem().consumir_erros()
+    for erro in erros + obter_fila_telegram().consumir_erros():
+        st.error(erro)
 
 
 # Definições de colunas base
@@ -494,13 +717,14 @@ def render_input_por_tipo(label, tipo, opcoes, valor_padrao=None, key=None):
 
 def precificacao_completa():
     st.title("📊 Gestão de Precificação e Produtos")
+    exibir_erros_salvamento()
     
     # --- Configurações do GitHub para SALVAR ---
     GITHUB_TOKEN = st.secrets.get("github_token", "TOKEN_FICTICIO")
-    GITHUB_REPO = "ribeiromendes5014-design/Precificar"
-    GITHUB_BRANCH = "main"
+    GITHUB_REPO = GITHUB_REPO_DADOS
+    GITHUB_BRANCH = GITHUB_BRANCH_DADOS
     PATH_PRECFICACAO = "precificacao.csv"
-    ARQ_CAIXAS = "https://raw.githubusercontent.com/ribeiromendes5014-design/Precificar/main/" + PATH_PRECFICACAO
+    URL_BASE_GITHUB = f"https://raw.githubusercontent.com/{GITHUB_REPO}/{GITHUB_BRANCH}"
     imagens_dict = {}
     
     # ----------------------------------------------------
@@ -521,26 +745,15 @@ def precificacao_completa():
     # === Lógica de Carregamento AUTOMÁTICO do CSV do GitHub (Correção de Persistência) ===
     # O carregamento automático ocorre APENAS na primeira vez que a sessão é iniciada
     if "produtos_manuais_loaded" not in st.session_state:
-        df_loaded = load_csv_github(ARQ_CAIXAS)
-        
-        # Define as colunas de ENTRADA (apenas dados brutos)
-        cols_entrada = ["Produto", "Qtd", "Custo Unitário", "Margem (%)", "Custos Extras Produto", "Imagem", "Imagem_URL", "Cor", "Marca", "Data_Cadastro"]
-        df_base_loaded = df_loaded[[col for col in cols_entrada if col in df_loaded.columns]].copy()
-        
-        # Garante que as colunas de ENTRADA existam, mesmo que vazias
-        if "Custos Extras Produto" not in df_base_loaded.columns: df_base_loaded["Custos Extras Produto"] = 0.0
-        if "Imagem" not in df_base_loaded.columns: df_base_loaded["Imagem"] = None
-        if "Imagem_URL" not in df_base_loaded.columns: df_base_loaded["Imagem_URL"] = ""
-        # NOVAS COLUNAS
-        if "Cor" not in df_base_loaded.columns: df_base_loaded["Cor"] = ""
-        if "Marca" not in df_base_loaded.columns: df_base_loaded["Marca"] = ""
-        # Garante que Data_Cadastro é string para evitar problemas de tipo no Streamlit
-        if "Data_Cadastro" not in df_base_loaded.columns: df_base_loaded["Data_Cadastro"] = pd.to_datetime('today').normalize().strftime('%Y-%m-%d')
-        
+        # O CSV é lido uma vez por processo; as demais sessões recebem o DF do catálogo compartilhado
+        df_base_loaded = carregar_compartilhado(
+            "produtos_manuais", lambda: preparar_produtos_manuais(carregar_dados(PATH_PRECFICACAO))
+        )
 
         if not df_base_loaded.empty:
-            st.session_state.produtos_manuais = df_base_loaded.copy()
-            st.success(f"✅ {len(df_base_loaded)} produtos carregados do GitHub.")
+            # Cópia rasa do catálogo: as colunas só são duplicadas quando esta sessão as altera
+            st.session_state.produtos_manuais = df_base_loaded
+            st.success(f"✅ {len(df_base_loaded)} produtos carregados.")
         else:
             # Caso não consiga carregar do GitHub, usa dados de exemplo
             st.info("⚠️ Não foi possível carregar dados persistidos. Usando dados de exemplo.")
@@ -554,8 +767,7 @@ def precificacao_completa():
             df_base["Imagem_URL"] = ""
             st.session_state.produtos_manuais = df_base.copy()
             
-        st.session_state.df_produtos_geral = processar_dataframe(
-            st.session_state.produtos_manuais, 
+        st.session_state.df_produtos_geral = precificar_produtos_manuais(
             st.session_state.get("frete_manual", 0.0), 
             st.session_state.get("extras_manual", 0.0), 
             st.session_state.get("modo_margem", "Margem fixa"), 
@@ -580,8 +792,8 @@ def precificacao_completa():
     margem_fixa = st.session_state.get("margem_fixa", 30.0)
     
     # Recalcula o DF geral para garantir que ele reflita o rateio mais recente (caso frete/extras tenham mudado)
-    st.session_state.df_produtos_geral = processar_dataframe(
-        st.session_state.produtos_manuais, frete_total, custos_extras, modo_margem, margem_fixa
+    st.session_state.df_produtos_geral = precificar_produtos_manuais(
+        frete_total, custos_extras, modo_margem, margem_fixa
     )
 
 
@@ -589,36 +801,64 @@ def precificacao_completa():
     # Lógica de Salvamento Automático
     # ----------------------------------------------------
     
-    # 1. Cria uma cópia do DF geral e remove colunas não-CSV-serializáveis (Imagem)
-    df_to_save = st.session_state.df_produtos_geral.drop(columns=["Imagem"], errors='ignore')
-    
-    # 2. Inicializa o hash para o estado da precificação
-    if "hash_precificacao" not in st.session_state:
-        st.session_state.hash_precificacao = hash_df(df_to_save)
-
-    # 3. Verifica se houve alteração nos produtos (agora baseado no DF completo)
-    novo_hash = hash_df(df_to_save)
-    if novo_hash != st.session_state.hash_precificacao:
-        if novo_hash != "error": # Evita salvar se a função hash falhou
-            salvar_csv_no_github(
-                GITHUB_TOKEN,
-                GITHUB_REPO,
-                PATH_PRECFICACAO,
-                df_to_save, # Salva o df completo com custos e preços
-                GITHUB_BRANCH,
-                mensagem="♻️ Alteração automática na precificação"
+    # 1. Rastreia as alterações nos dados de ENTRADA (só as linhas marcadas são re-hasheadas).
+    #    Frete/custos extras/modo e valor da margem também mudam o CSV salvo, então entram como parâmetros.
+    parametros_precificacao = (frete_total, custos_extras, modo_margem, margem_fixa)
+    rastreio_precificacao = rastreador("precificacao")
+    if not rastreio_precificacao.iniciado:
+        rastreio_precificacao.reiniciar(st.session_state.produtos_manuais, parametros_precificacao)
+
+    # 2. Verifica se houve alteração nos produtos ou nos parâmetros do rateio
+    try:
+        houve_alteracao = rastreio_precificacao.sincronizar(st.session_state.produtos_manuais, parametros_precificacao)
+    except Exception as e:
+        st.error(f"Erro interno no rastreamento de alterações: {e}")
+        houve_alteracao = False # Evita salvar se o hash falhou
+
+    if houve_alteracao:
+        # 3. Publica no catálogo compartilhado; se outra sessão publicou antes, as alterações
+        #    são mescladas por produto e a sessão passa a usar o resultado da mescla
+        manuais, mesclado = publicar_compartilhado(
+            "produtos_manuais", st.session_state.produtos_manuais, rastreio_precificacao
+        )
+        if mesclado:
+            st.session_state.produtos_manuais = manuais
+            rastreio_precificacao.reiniciar(manuais, parametros_precificacao, salvo=False)
+            st.session_state.df_produtos_geral = precificar_produtos_manuais(
+                frete_total, custos_extras, modo_margem, margem_fixa
+            )
+            st.info("🔀 Outra sessão alterou os produtos ao mesmo tempo; as alterações foram mescladas.")
+
+        # 4. "Imagem" guarda só referências do armazém; bytes legados não vão para o CSV
+        df_to_save = st.session_state.df_produtos_geral.copy()
+        if "Imagem" in df_to_save.columns:
+            df_to_save["Imagem"] = df_to_save["Imagem"].where(df_to_save["Imagem"].map(eh_referencia), None)
+        # Salva o df completo com custos e preços
+        if salvar_dados(
+            {PATH_PRECFICACAO: df_to_save}, mensagem="♻️ Alteração automática na precificação",
+            alteracoes={PATH_PRECFICACAO: rastreio_precificacao.alteracoes()},
+        ):
+            rastreio_precificacao.marcar_salvo()
+    else:
+        # Sem alterações pendentes: adota a versão publicada por outra sessão, se houver
+        manuais = atualizar_do_compartilhado("produtos_manuais")
+        if manuais is not None:
+            st.session_state.produtos_manuais = manuais
+            rastreio_precificacao.reiniciar(manuais, parametros_precificacao)
+            st.session_state.df_produtos_geral = precificar_produtos_manuais(
+                frete_total, custos_extras, modo_margem, margem_fixa
             )
-            st.session_state.hash_precificacao = novo_hash
 
 
     # ----------------------------------------------------
     # Definição das Abas Principais de Gestão
     # ----------------------------------------------------
 
-    tab_cadastro, tab_relatorio, tab_tabela_principal = st.tabs([
+    tab_cadastro, tab_relatorio, tab_tabela_principal, tab_painel = st.tabs([
         "✍️ Cadastro de Produtos",
         "🔍 Relatórios & Filtro",
-        "📊 Tabela Principal"
+        "📊 Tabela Principal",
+        "📈 Painel"
     ])
 
 
@@ -629,7 +869,56 @@ def precificacao_completa():
         st.header("✍️ Cadastro Manual e Rateio Global")
         
         # --- Sub-abas para Cadastro e Rateio ---
-        aba_prec_manual, aba_rateio = st.tabs(["➕ Novo Produto", "🔢 Rateio Manual"])
+        aba_prec_manual, aba_importar, aba_rateio = st.tabs(["➕ Novo Produto", "📥 Importar em Lote", "🔢 Rateio Manual"])
+
+        with aba_importar:
+            st.subheader("📥 Importar Produtos em Lote (CSV/XLSX)")
+            st.caption(
+                "Colunas reconhecidas: Produto, Qtd, Custo Unitário, Margem (%), Custos Extras Produto, Imagem_URL, "
+                "Cor, Marca e Data_Cadastro (também aceita nomes como 'Custo', 'Quantidade' ou 'Data Cadastro'). "
+                "Planilhas muito grandes são lidas mais rápido em CSV."
+            )
+
+            # Resumo da última importação (mostrado depois do rerun que a aplicou)
+            resultado_anterior = st.session_state.get("resultado_importacao")
+            if resultado_anterior:
+                st.success(f"✅ {resultado_anterior['importados']} de {resultado_anterior['total']} linhas de `{resultado_anterior['arquivo']}` importadas.")
+                if resultado_anterior["ignoradas"]:
+                    st.info(f"Colunas ignoradas: {', '.join(resultado_anterior['ignoradas'])}")
+                erros_importacao = resultado_anterior["erros"]
+                if not erros_importacao.empty:
+                    st.warning(f"⚠️ {len(erros_importacao)} linha(s) rejeitada(s):")
+                    st.dataframe(erros_importacao.head(200), use_container_width=True, hide_index=True)
+                    baixar_csv_aba(erros_importacao, "linhas_rejeitadas.csv", key_suffix="importacao")
+
+            arquivo_lote = st.file_uploader("Planilha de produtos", type=["csv", "xlsx"], key="arquivo_importacao_lote")
+            margem_lote = st.number_input(
+                "Margem (%) para linhas sem margem", min_value=0.0, step=1.0, value=float(margem_fixa), key="margem_importacao_lote"
+            )
+            if arquivo_lote is not None and st.button("📥 Importar produtos", key="importar_lote_btn"):
+                try:
+                    with st.spinner("Lendo e validando a planilha..."):
+                        resultado = importar_produtos(arquivo_lote.getvalue(), arquivo_lote.name, margem_lote)
+                except Exception as e:
+                    st.error(f"❌ Não foi possível importar `{arquivo_lote.name}`: {e}")
+                else:
+                    if not resultado.produtos.empty:
+                        # Um único concat para o lote inteiro; o rastreador marca só as linhas novas
+                        st.session_state.produtos_manuais = pd.concat(
+                            [st.session_state.produtos_manuais, resultado.produtos], ignore_index=True
+                        )
+                        rastreador("precificacao").marcar_inclusao(len(resultado.produtos))
+                        st.session_state.df_produtos_geral = precificar_produtos_manuais(
+                            frete_total, custos_extras, modo_margem, margem_fixa
+                        )
+                    st.session_state["resultado_importacao"] = {
+                        "arquivo": arquivo_lote.name,
+                        "importados": len(resultado.produtos),
+                        "total": resultado.total_linhas,
+                        "ignoradas": resultado.colunas_ignoradas,
+                        "erros": resultado.erros,
+                    }
+                    st.rerun()
 
         with aba_rateio:
             st.subheader("🔢 Cálculo de Rateio Unitário (Frete + Custos Extras)")
@@ -659,8 +948,7 @@ def precificacao_completa():
             
             if st.button("🔄 Aplicar Novo Rateio aos Produtos Existentes", key="aplicar_rateio_btn"):
                 # O processar_dataframe usará o frete_total e custos_extras atualizados.
-                st.session_state.df_produtos_geral = processar_dataframe(
-                    st.session_state.produtos_manuais,
+                st.session_state.df_produtos_geral = precificar_produtos_manuais(
                     frete_total,
                     custos_extras,
                     modo_margem,
@@ -718,7 +1006,7 @@ def precificacao_completa():
 
 
             # Custo total unitário AQUI PARA FINS DE PRÉ-CÁLCULO E PREVIEW
-            custo_total_unitario_com_rateio = valor_pago + custo_extra_produto + rateio_global_unitario
+            custo_total_unitario_com_rateio = motor.custo_total(valor_pago, custo_extra_produto, rateio_global_unitario)
 
 
             margem_manual = 30.0 # Valor padrão
@@ -726,20 +1014,17 @@ def precificacao_completa():
             if preco_final_sugerido > 0:
                 preco_a_vista_calc = preco_final_sugerido
                 
-                if custo_total_unitario_com_rateio > 0:
-                    # Calcula a margem REQUERIDA para atingir o preço sugerido
-                    margem_calculada = (preco_a_vista_calc / custo_total_unitario_com_rateio - 1) * 100
-                else:
-                    margem_calculada = 0.0
+                # Calcula a margem REQUERIDA para atingir o preço sugerido (0 se não há custo)
+                margem_calculada = motor.margem_necessaria(preco_a_vista_calc, custo_total_unitario_com_rateio)
                     
                 margem_manual = round(margem_calculada, 2)
                 st.info(f"🧮 Margem necessária calculada: **{margem_manual:,.2f}%**")
             else:
                 # Se não há preço sugerido, usa a margem padrão (ou a digitada) para calcular o preço.
                 margem_manual = st.number_input("🧮 Margem de Lucro (%)", min_value=0.0, value=30.0, key="input_margem_manual")
-                preco_a_vista_calc = custo_total_unitario_com_rateio * (1 + margem_manual / 100)
+                preco_a_vista_calc = motor.preco_a_vista(custo_total_unitario_com_rateio, margem_manual)
                 
-            preco_no_cartao_calc = preco_a_vista_calc / 0.8872
+            preco_no_cartao_calc = motor.preco_cartao(preco_a_vista_calc)
 
             st.markdown(f"**Preço à Vista Calculado:** {formatar_brl(preco_a_vista_calc)}")
             st.markdown(f"**Preço no Cartão Calculado:** {formatar_brl(preco_no_cartao_calc)}")
@@ -752,13 +1037,17 @@ def precificacao_completa():
                 adicionar_produto = st.form_submit_button("➕ Adicionar Produto (Manual)")
                 if adicionar_produto:
                     if produto and quantidade > 0 and valor_pago >= 0:
-                        imagem_bytes = None
+                        imagem_ref = None
                         url_salvar = ""
 
-                        # Prioriza o arquivo uploaded, se existir
+                        # Prioriza o arquivo uploaded, se existir: vai para o armazém de imagens
+                        # (uma cópia por conteúdo) e o DF guarda só a referência. A cópia em `imagens/`
+                        # no GitHub só é feita quando os dados também vão para o GitHub
                         if imagem_file is not None:
-                            imagem_bytes = imagem_file.read()
-                            imagens_dict[produto] = imagem_bytes # Guarda para exibição na sessão
+                            armazem = obter_armazem()
+                            imagem_ref = armazem.guardar(imagem_file.read())
+                            if armazenamento().le_do_github:
+                                armazem.publicar(imagem_ref, GITHUB_TOKEN, GITHUB_REPO, GITHUB_BRANCH)
                         
                         # Se não houver upload, usa a URL
                         elif imagem_url.strip():
@@ -776,7 +1065,7 @@ def precificacao_completa():
                             "Custo Unitário": [valor_pago],
                             "Custos Extras Produto": [custo_extra_produto_salvar], # Salva apenas o custo específico (sem o rateio)
                             "Margem (%)": [margem_manual],
-                            "Imagem": [imagem_bytes],
+                            "Imagem": [imagem_ref],
                             "Imagem_URL": [url_salvar], # Salva a URL para persistência
                             "Cor": [cor_produto.strip()],
                             "Marca": [marca_produto.strip()],
@@ -789,11 +1078,11 @@ def precificacao_completa():
                             [st.session_state.produtos_manuais, novo_produto],
                             ignore_index=True
                         ).reset_index(drop=True)
+                        rastreador("precificacao").marcar_inclusao(1)
                         
                         # Processa e atualiza o DataFrame geral
                         # O rateio global será recalculado em processar_dataframe usando frete_total e custos_extras
-                        st.session_state.df_produtos_geral = processar_dataframe(
-                            st.session_state.produtos_manuais,
+                        st.session_state.df_produtos_geral = precificar_produtos_manuais(
                             frete_total,
                             custos_extras,
                             modo_margem,
@@ -816,8 +1105,9 @@ def precificacao_completa():
                 if "produto_para_excluir" not in st.session_state:
                     st.session_state["produto_para_excluir"] = None
                 
-                # Exibir produtos individualmente com a opção de exclusão
-                for i, row in produtos.iterrows():
+                # Exibir produtos individualmente com a opção de exclusão (só a página atual)
+                pagina_manuais = paginar(produtos, "manuais", colunas_ordenacao=["Produto", "Qtd", "Custo Unitário"])
+                for i, row in pagina_manuais.iterrows():
                     cols = st.columns([4, 1])
                     with cols[0]:
                         custo_unit_val = row.get('Custo Unitário', 0.0)
@@ -834,10 +1124,10 @@ def precificacao_completa():
                     
                     # 1. Remove do DataFrame manual
                     st.session_state.produtos_manuais = produtos.drop(i).reset_index(drop=True)
+                    rastreador("precificacao").marcar_exclusao([i])
                     
                     # 2. Recalcula e atualiza o DataFrame geral
-                    st.session_state.df_produtos_geral = processar_dataframe(
-                        st.session_state.produtos_manuais,
+                    st.session_state.df_produtos_geral = precificar_produtos_manuais(
                         frete_total,
                         custos_extras,
                         modo_margem,
@@ -857,19 +1147,19 @@ def precificacao_completa():
         st.header("🔍 Relatórios por Período")
 
         # --- Lógica de Filtro ---
-        df_temp_filter = st.session_state.df_produtos_geral.copy()
-        df_produtos_filtrado = df_temp_filter.copy() # Default: sem filtro
+        # As datas ficam convertidas e ordenadas no índice (atualizado só nas linhas alteradas)
+        df_temp_filter = st.session_state.df_produtos_geral
+        df_produtos_filtrado = df_temp_filter # Default: sem filtro
+        posicoes_periodo = np.arange(len(df_temp_filter))
 
         if "Data_Cadastro" in df_temp_filter.columns and not df_temp_filter.empty:
             st.subheader("Filtro de Produtos por Data de Cadastro")
             
-            # Garante que a coluna 'Data_Cadastro' esteja no formato datetime
-            df_temp_filter['Data_Cadastro_DT'] = pd.to_datetime(df_temp_filter['Data_Cadastro'], errors='coerce').dt.normalize()
-            
-            valid_dates = df_temp_filter['Data_Cadastro_DT'].dropna()
+            indice = indice_datas()
+            limites = indice.limites(df_temp_filter)
             
-            min_date = valid_dates.min().date() if not valid_dates.empty else datetime.today().date()
-            max_date = valid_dates.max().date() if not valid_dates.empty else datetime.today().date()
+            min_date = limites[0].date() if limites else datetime.today().date()
+            max_date = limites[1].date() if limites else datetime.today().date()
             
             if min_date > max_date: min_date = max_date 
 
@@ -900,14 +1190,11 @@ def precificacao_completa():
                     key="input_data_fim_report" # Chave diferente para evitar conflito
                 )
             
-            # Aplica o filtro
-            dt_inicio = pd.to_datetime(data_inicio).normalize()
-            dt_fim = pd.to_datetime(data_fim).normalize()
-            
-            df_produtos_filtrado = df_temp_filter[
-                (df_temp_filter['Data_Cadastro_DT'] >= dt_inicio) &
-                (df_temp_filter['Data_Cadastro_DT'] <= dt_fim)
-            ].copy()
+            # Aplica o filtro (busca binária nas datas ordenadas); se o período cobre todos os
+            # produtos (o padrão), o DF é usado como está, sem cópia
+            posicoes_periodo = indice.posicoes_entre(df_temp_filter, data_inicio, data_fim)
+            if len(posicoes_periodo) < len(df_temp_filter):
+                df_produtos_filtrado = df_temp_filter.iloc[posicoes_periodo]
             
             st.info(f"Mostrando {len(df_produtos_filtrado)} de {len(st.session_state.df_produtos_geral)} produtos de acordo com o filtro de data.")
 
@@ -928,9 +1215,34 @@ def precificacao_completa():
                 # Passa o DataFrame filtrado para a função de envio (para usar data no caption)
                 enviar_pdf_telegram(pdf_io, df_relatorio, thread_id=TOPICO_ID)
 
+        # --- Catálogo para clientes (fotos + preços) ---
+        if st.button("📚 Gerar catálogo em PDF (Aplicando Filtro de Data)", key='precificacao_catalogo_button'):
+            if df_produtos_filtrado.empty:
+                st.warning("⚠️ Nenhum produto encontrado com o filtro de data selecionado para gerar o catálogo.")
+            else:
+                # Sem cópia no GitHub, as fotos do armazém só existem no disco deste servidor
+                url_base_imagens = URL_BASE_GITHUB if armazenamento().le_do_github else None
+                futuro = obter_gerador_relatorios().solicitar(
+                    df_produtos_filtrado, "catalogo", url_base_imagens=url_base_imagens
+                )
+                with st.spinner("Gerando catálogo (baixando e reduzindo as fotos)..."):
+                    st.session_state["catalogo_pdf"] = futuro.result()
+        if st.session_state.get("catalogo_pdf"):
+            st.download_button(
+                "⬇️ Baixar catálogo (PDF)", st.session_state["catalogo_pdf"],
+                file_name="catalogo.pdf", mime="application/pdf", key="baixar_catalogo_pdf"
+            )
+
         # --- Exibição de Resultados Detalhados ---
         st.markdown("---")
-        exibir_resultados(df_produtos_filtrado, imagens_dict)
+        df_resultados = df_produtos_filtrado
+        busca = st.text_input("🔎 Buscar produto", key="busca_relatorio", placeholder="Produto, cor ou marca...")
+        if busca.strip() and not df_produtos_filtrado.empty:
+            # Resultados mais relevantes primeiro, só dentro do período filtrado
+            posicoes = indice_busca("precificacao", COLUNAS_BUSCA_PRECIFICACAO).buscar(df_temp_filter, busca, limite=None)
+            df_resultados = df_temp_filter.iloc[posicoes[np.isin(posicoes, posicoes_periodo)]]
+            st.caption(f"{len(df_resultados)} produto(s) encontrados para \"{busca.strip()}\".")
+        exibir_resultados(df_resultados, imagens_dict, URL_BASE_GITHUB)
 
 
     # =====================================
@@ -948,75 +1260,76 @@ def precificacao_completa():
         ]
         cols_to_show = [col for col in cols_display if col in st.session_state.df_produtos_geral.columns]
 
-        editado_df = st.data_editor(
-            st.session_state.df_produtos_geral[cols_to_show],
+        # Com uma busca, a tabela mostra só as linhas encontradas (na ordem da tabela); o delta do
+        # editor é convertido de volta para as posições de produtos_manuais
+        busca_tabela = st.text_input("🔎 Buscar na tabela", key="busca_tabela_principal", placeholder="Produto, cor ou marca...")
+        posicoes_exibidas = None
+        df_editor = st.session_state.df_produtos_geral[cols_to_show]
+        if busca_tabela.strip():
+            posicoes_exibidas = np.sort(indice_busca("precificacao", COLUNAS_BUSCA_PRECIFICACAO).buscar(
+                st.session_state.df_produtos_geral, busca_tabela, limite=None
+            ))
+            df_editor = df_editor.iloc[posicoes_exibidas]
+            st.caption(f"{len(posicoes_exibidas)} de {len(st.session_state.df_produtos_geral)} produtos.")
+
+        st.data_editor(
+            df_editor,
             num_rows="dynamic", # Permite que o usuário adicione ou remova linhas
             use_container_width=True,
             key="editor_produtos_geral"
         )
 
-        original_len = len(st.session_state.df_produtos_geral)
-        edited_len = len(editado_df)
-        
-        # 1. Lógica de Exclusão
-        if edited_len < original_len:
-            
-            # Filtra os produtos_manuais para manter apenas aqueles que sobreviveram na edição
-            produtos_manuais_filtrado = st.session_state.produtos_manuais[
-                st.session_state.produtos_manuais['Produto'].isin(editado_df['Produto'])
-            ].copy()
-            
-            st.session_state.produtos_manuais = produtos_manuais_filtrado.reset_index(drop=True)
-
-            # Atualiza o DataFrame geral
-            st.session_state.df_produtos_geral = processar_dataframe(
-                st.session_state.produtos_manuais, frete_total, custos_extras, modo_margem, margem_fixa
-            )
-            
-            st.success("✅ Produto excluído da lista e sincronizado.")
-            st.rerun()
-            
-        # 2. Lógica de Edição de Dados
-        elif not editado_df.equals(st.session_state.df_produtos_geral[cols_to_show]):
-            
-            # 2a. Sincroniza as mudanças essenciais de volta ao produtos_manuais
-            for idx, row in editado_df.iterrows():
-                produto_nome = str(row.get('Produto'))
-                
-                # Encontra o índice correspondente no produtos_manuais
-                manual_idx_list = st.session_state.produtos_manuais[st.session_state.produtos_manuais['Produto'] == produto_nome].index.tolist()
-                
-                if manual_idx_list:
-                    manual_idx = manual_idx_list[0]
-                    
-                    # Sincronização dos campos de ENTRADA editáveis na tabela
-                    st.session_state.produtos_manuais.loc[manual_idx, "Produto"] = produto_nome
-                    st.session_state.produtos_manuais.loc[manual_idx, "Qtd"] = row.get("Qtd", 1)
-                    st.session_state.produtos_manuais.loc[manual_idx, "Custo Unitário"] = row.get("Custo Unitário", 0.0)
-                    st.session_state.produtos_manuais.loc[manual_idx, "Margem (%)"] = row.get("Margem (%)", margem_fixa)
-                    st.session_state.produtos_manuais.loc[manual_idx, "Custos Extras Produto"] = row.get("Custos Extras Produto", 0.0)
-                    # NOVOS CAMPOS DE TEXTO/DATA
-                    st.session_state.produtos_manuais.loc[manual_idx, "Cor"] = row.get("Cor", "")
-                    st.session_state.produtos_manuais.loc[manual_idx, "Marca"] = row.get("Marca", "")
-                    # Data_Cadastro pode ser editada na tabela, então salvamos o valor.
-                    st.session_state.produtos_manuais.loc[manual_idx, "Data_Cadastro"] = row.get("Data_Cadastro", pd.to_datetime('today').normalize().strftime('%Y-%m-%d'))
-
-
-            # 2b. Recalcula o DataFrame geral com base no manual atualizado
-            st.session_state.df_produtos_geral = processar_dataframe(
-                st.session_state.produtos_manuais, frete_total, custos_extras, modo_margem, margem_fixa
-            )
-            
-            st.success("✅ Dados editados e precificação recalculada!")
-            st.rerun()
-
-        # 3. Lógica de Adição (apenas alerta)
-        elif edited_len > original_len:
-            st.warning("⚠️ Use o formulário 'Novo Produto Manual' ou o carregamento de CSV para adicionar produtos.")
-            # Reverte a adição no df_produtos_geral
-            st.session_state.df_produtos_geral = st.session_state.df_produtos_geral
-            st.rerun() 
+        # O editor guarda só o delta (células editadas, linhas incluídas/excluídas) em relação aos
+        # dados recebidos; ao trocar os dados o delta é zerado. Aplicamos cada delta uma única vez.
+        estado_editor = st.session_state.get("editor_produtos_geral") or {}
+        assinatura_delta = repr((
+            estado_editor.get("edited_rows"), estado_editor.get("added_rows"), estado_editor.get("deleted_rows")
+        ))
+        if assinatura_delta != st.session_state.get("delta_tabela_aplicado"):
+            st.session_state.delta_tabela_aplicado = assinatura_delta
+            editadas, excluidas = aplicar_delta_tabela_principal(estado_editor, posicoes_exibidas)
+
+            if estado_editor.get("added_rows"):
+                st.warning("⚠️ Use o formulário 'Novo Produto Manual' ou o carregamento de CSV para adicionar produtos.")
+
+            if editadas or excluidas:
+                st.session_state.df_produtos_geral = precificar_produtos_manuais(
+                    frete_total, custos_extras, modo_margem, margem_fixa
+                )
+                if excluidas:
+                    st.success("✅ Produto excluído da lista e sincronizado.")
+                else:
+                    st.success("✅ Dados editados e precificação recalculada!")
+                st.rerun()
 
+    # =====================================
+    # ABA 4: Painel (resumo do catálogo)
+    # =====================================
+    with tab_painel:
+        st.header("📈 Painel do Catálogo")
+        df_painel = st.session_state.df_produtos_geral
+        if df_painel.empty:
+            st.info("Adicione produtos para ver o resumo do catálogo.")
+        else:
+            # Somas mantidas por linha alterada; frete/custos extras/margem mudam todas as linhas
+            agregados = agregados_catalogo()
+            agregados.atualizar(df_painel, (frete_total, custos_extras, modo_margem, margem_fixa))
+            totais = agregados.totais()
+            col_m1, col_m2, col_m3, col_m4 = st.columns(4)
+            col_m1.metric("Produtos", totais["Produtos"])
+            col_m2.metric("Margem média", f"{totais['Margem média (%)']:.1f}%".replace(".", ","))
+            col_m3.metric("Custo do estoque", formatar_brl(totais["Custo do Estoque"]))
+            col_m4.metric("Estoque à vista", formatar_brl(totais["Valor à Vista"]))
+
+            dimensao = st.radio("Agrupar por", agregados.dimensoes_disponiveis(), horizontal=True, key="painel_dimensao")
+            # O gráfico é desenhado uma vez por versão dos dados e reaproveitado nos reruns
+            st.image(agregados.grafico(dimensao), use_container_width=True)
+
+            tabela_painel = agregados.tabela(dimensao)
+            tabela_painel["Margem média (%)"] = tabela_painel["Margem média (%)"].round(1)
+            for col in ["Custo do Estoque", "Valor à Vista"]:
+                tabela_painel[col] = formatar_brl_serie(tabela_painel[col])
+            st.dataframe(tabela_painel, use_container_width=True, hide_index=True)
 
     # ----------------------------------------------------
     # Abas de Utilidade (Carregamento CSV)
@@ -1029,33 +1342,31 @@ def precificacao_completa():
     # === Tab GitHub ===
     with tab_util_github[0]:
         st.markdown("---")
-        st.header("📥 Carregar CSV de Precificação do GitHub")
-        st.info("O CSV é carregado automaticamente ao iniciar, mas use este botão para forçar o recarregamento do seu arquivo persistido no GitHub.")
-
-        # Botão de Carregamento que puxa o CSV do GitHub
-        if st.button("🔄 Carregar CSV do GitHub"):
-            df_exemplo = load_csv_github(ARQ_CAIXAS)
-            if not df_exemplo.empty:
-                # Filtra colunas de ENTRADA
-                cols_entrada = ["Produto", "Qtd", "Custo Unitário", "Margem (%)", "Custos Extras Produto", "Imagem", "Imagem_URL", "Cor", "Marca", "Data_Cadastro"]
-                
-                # Garante que só carrega colunas que existem no CSV e que são de ENTRADA
-                df_base_loaded = df_exemplo[[col for col in cols_entrada if col in df_exemplo.columns]].copy()
-                
-                # Garante colunas ausentes
-                if "Custos Extras Produto" not in df_base_loaded.columns: df_base_loaded["Custos Extras Produto"] = 0.0
-                if "Imagem" not in df_base_loaded.columns: df_base_loaded["Imagem"] = None
-                if "Imagem_URL" not in df_base_loaded.columns: df_base_loaded["Imagem_URL"] = ""
-                if "Cor" not in df_base_loaded.columns: df_base_loaded["Cor"] = ""
-                if "Marca" not in df_base_loaded.columns: df_base_loaded["Marca"] = ""
-                if "Data_Cadastro" not in df_base_loaded.columns: df_base_loaded["Data_Cadastro"] = pd.to_datetime('today').normalize().strftime('%Y-%m-%d')
-
-
-                st.session_state.produtos_manuais = df_base_loaded.copy()
+        if armazenamento().le_do_github:
+            st.header("📥 Carregar CSV de Precificação do GitHub")
+            st.info("O CSV é carregado automaticamente ao iniciar, mas use este botão para forçar o recarregamento do seu arquivo persistido no GitHub.")
+            rotulo_recarga = "🔄 Carregar CSV do GitHub"
+        else:
+            # Backend local sem réplica no GitHub: a recarga relê a cópia local
+            st.header("📥 Recarregar Dados de Precificação")
+            st.info("Os dados ficam só no armazenamento local (sem cópia no GitHub). Use este botão para reler a versão salva, descartando alterações não salvas.")
+            rotulo_recarga = "🔄 Recarregar dados salvos"
+
+        # Botão de Carregamento que puxa o CSV do GitHub (ou do armazenamento local)
+        if st.button(rotulo_recarga, key="recarregar_precificacao"):
+            df_base_loaded = preparar_produtos_manuais(carregar_dados(PATH_PRECFICACAO, forcar=True))
+            if not df_base_loaded.empty:
+                # A recarga vale para todas as sessões: substitui a versão do catálogo compartilhado
+                _versoes_catalogo()["produtos_manuais"] = catalogo_compartilhado().substituir("produtos_manuais", df_base_loaded)
+                st.session_state.produtos_manuais = df_base_loaded.copy(deep=False)
+                # O conteúdo recarregado é o que já está salvo: não precisa ser salvo de novo
+                rastreador("precificacao").reiniciar(
+                    st.session_state.produtos_manuais, (frete_total, custos_extras, modo_margem, margem_fixa)
+                )
                 
                 # Recalcula o DF geral a partir dos dados de entrada carregados
-                st.session_state.df_produtos_geral = processar_dataframe(
-                    st.session_state.produtos_manuais, frete_total, custos_extras, modo_margem, margem_fixa
+                st.session_state.df_produtos_geral = precificar_produtos_manuais(
+                    frete_total, custos_extras, modo_margem, margem_fixa
                 )
                 st.success("✅ CSV carregado e processado com sucesso!")
                 # Força o rerun para re-aplicar os filtros de data no display
@@ -1070,25 +1381,17 @@ def precificacao_completa():
 
 def papelaria_aba():
     st.title("📚 Gerenciador Papelaria Personalizada")
-    
-    # Variáveis de Configuração
-    GITHUB_TOKEN = st.secrets.get("github_token", "TOKEN_FICTICIO")
-    GITHUB_REPO = "ribeiromendes5014-design/Precificar"
-    GITHUB_BRANCH = "main"
-    URL_BASE = "https://raw.githubusercontent.com/ribeiromendes5014-design/Precificar/main/"
-    INSUMOS_CSV_URL = URL_BASE + "insumos_papelaria.csv"
-    PRODUTOS_CSV_URL = URL_BASE + "produtos_papelaria.csv"
-    CAMPOS_CSV_URL = URL_BASE + "categorias_papelaria.csv"
-
-    # Estado da sessão
+    exibir_erros_salvamento()
+
+    # Estado da sessão (os CSVs são lidos uma vez por processo, no catálogo compartilhado)
     if "insumos" not in st.session_state:
-        st.session_state.insumos = load_csv_github(INSUMOS_CSV_URL)
+        st.session_state.insumos = carregar_compartilhado("insumos", lambda: carregar_dados("insumos_papelaria.csv"))
 
     if "produtos" not in st.session_state:
-        st.session_state.produtos = load_csv_github(PRODUTOS_CSV_URL)
+        st.session_state.produtos = carregar_compartilhado("produtos", lambda: carregar_dados("produtos_papelaria.csv"))
 
     if "campos" not in st.session_state:
-        st.session_state.campos = load_csv_github(CAMPOS_CSV_URL)
+        st.session_state.campos = carregar_compartilhado("campos", lambda: carregar_dados("categorias_papelaria.csv"))
         
     # Inicializações de estado para garantir DFs não nulos
     if "campos" not in st.session_state or st.session_state.campos.empty:
@@ -1113,27 +1416,69 @@ def papelaria_aba():
     if "Insumos Usados" not in st.session_state.produtos.columns:
         st.session_state.produtos["Insumos Usados"] = "[]"
 
+    # Composição (Produto, Insumo, Quantidade) em formato longo: é a fonte dos custos dos produtos.
+    # Se o CSV ainda não existe, migra a partir da coluna legada "Insumos Usados".
+    if "composicao" not in st.session_state:
+        def carregar_composicao():
+            composicao_carregada = normalizar_composicao(carregar_dados("composicao_papelaria.csv"))
+            if composicao_carregada.empty:
+                composicao_carregada = explodir_insumos_usados(st.session_state.produtos)
+            return composicao_carregada
+        st.session_state.composicao = carregar_compartilhado("composicao", carregar_composicao)
+
 
     # Garante colunas extras e tipos
     st.session_state.insumos = garantir_colunas_extras(st.session_state.insumos, "Insumos")
     st.session_state.produtos = garantir_colunas_extras(st.session_state.produtos, "Produtos")
 
-    # Verifica se houve alteração nos produtos para salvar automaticamente
-    if "hash_produtos" not in st.session_state:
-        st.session_state.hash_produtos = hash_df(st.session_state.produtos)
-
-    novo_hash = hash_df(st.session_state.produtos)
-    if novo_hash != st.session_state.hash_produtos:
-        if novo_hash != "error": # Evita salvar se a função hash falhou
-            salvar_csv_no_github(
-                GITHUB_TOKEN,
-                GITHUB_REPO,
-                "produtos_papelaria.csv",
-                st.session_state.produtos,
-                GITHUB_BRANCH,
-                mensagem="♻️ Alteração automática nos produtos"
-            )
-            st.session_state.hash_produtos = novo_hash
+    # Verifica se houve alteração nos CSVs da papelaria para salvar automaticamente.
+    # Todos os arquivos alterados vão juntos num único commit (mantém insumos/produtos/campos consistentes).
+    # Cada DF tem seu rastreador; os caminhos de edição abaixo marcam as linhas alteradas.
+    arquivos_papelaria = {
+        "insumos_papelaria.csv": ("insumos", st.session_state.insumos),
+        "produtos_papelaria.csv": ("produtos", st.session_state.produtos),
+        "categorias_papelaria.csv": ("campos", st.session_state.campos),
+        "composicao_papelaria.csv": ("composicao", st.session_state.composicao),
+    }
+
+    # Os DFs alterados são publicados no catálogo compartilhado (mesclando com o que outra sessão
+    # tenha publicado antes); os sem alterações adotam a versão mais nova de outra sessão.
+    alterados = {}
+    for path, (nome_df, df) in arquivos_papelaria.items():
+        rastreio = rastreador(nome_df, colunas_ignoradas=())
+        if not rastreio.iniciado:
+            rastreio.reiniciar(df)
+            continue
+        try:
+            if rastreio.sincronizar(df):
+                alterados[path] = (nome_df, df, rastreio)
+                continue
+        except Exception as e:
+            st.error(f"Erro interno no rastreamento de alterações: {e}") # Evita salvar se o hash falhou
+            continue
+        df_novo = atualizar_do_compartilhado(nome_df)
+        if df_novo is not None:
+            st.session_state[nome_df] = df_novo
+            rastreio.reiniciar(df_novo)
+
+    if alterados:
+        mesclados = []
+        for path, (nome_df, df, rastreio) in alterados.items():
+            df, mesclado = publicar_compartilhado(nome_df, df, rastreio)
+            if mesclado:
+                st.session_state[nome_df] = df
+                rastreio.reiniciar(df, salvo=False)
+                alterados[path] = (nome_df, df, rastreio)
+                mesclados.append(nome_df)
+        if mesclados:
+            st.info(f"🔀 Outra sessão alterou {', '.join(mesclados)} ao mesmo tempo; as alterações foram mescladas.")
+        if salvar_dados(
+            {path: df for path, (_, df, _) in alterados.items()},
+            mensagem="♻️ Alteração automática na papelaria",
+            alteracoes={path: rastreio.alteracoes() for path, (_, _, rastreio) in alterados.items()},
+        ):
+            for _, _, rastreio in alterados.values():
+                rastreio.marcar_salvo()
 
     # Criação das abas
     aba_campos, aba_insumos, aba_produtos = st.tabs(["Campos (Colunas)", "Insumos", "Produtos"])
@@ -1173,6 +1518,7 @@ def papelaria_aba():
                             [st.session_state.campos, pd.DataFrame([nova_linha])],
                             ignore_index=True
                         ).reset_index(drop=True)
+                        rastreador("campos", colunas_ignoradas=()).marcar_inclusao(1)
                         st.success(f"Campo '{nome_campo}' adicionado para {aplicacao}!")
                         
                         st.session_state.insumos = garantir_colunas_extras(st.session_state.insumos, "Insumos")
@@ -1215,6 +1561,7 @@ def papelaria_aba():
                             aplic = campo_atual["Aplicação"]
                             
                             st.session_state.campos = st.session_state.campos.drop(index=idx).reset_index(drop=True)
+                            rastreador("campos", colunas_ignoradas=()).marcar_exclusao([idx])
                             
                             if aplic in ("Insumos", "Ambos") and nome in st.session_state.insumos.columns:
                                 st.session_state.insumos = st.session_state.insumos.drop(columns=[nome], errors='ignore')
@@ -1247,6 +1594,7 @@ def papelaria_aba():
                                 st.session_state.campos.loc[idx, ["Campo","Aplicação","Tipo","Opções"]] = [
                                     novo_nome, nova_aplic, novo_tipo, novas_opcoes
                                 ]
+                                rastreador("campos", colunas_ignoradas=()).marcar_linhas([idx])
                                 
                                 renomeou = (str(novo_nome).strip() != str(nome_antigo).strip())
                                 
@@ -1273,6 +1621,14 @@ def papelaria_aba():
     with aba_insumos:
         st.header("Insumos")
 
+        if "resumo_propagacao" in st.session_state:
+            insumo_alterado, resumo = st.session_state.pop("resumo_propagacao")
+            if resumo.empty:
+                st.info(f"Nenhum produto usa o insumo '{insumo_alterado}'; preços dos produtos mantidos.")
+            else:
+                st.success(f"Custos e preços de {len(resumo)} produto(s) recalculados após a alteração de '{insumo_alterado}'.")
+                st.dataframe(resumo, use_container_width=True, hide_index=True)
+
         st.session_state.insumos = garantir_colunas_extras(st.session_state.insumos, "Insumos")
 
         with st.form("form_add_insumo"):
@@ -1313,6 +1669,7 @@ def papelaria_aba():
                     st.session_state.insumos = garantir_colunas_extras(st.session_state.insumos, "Insumos")
                     
                     st.session_state.insumos = pd.concat([st.session_state.insumos, pd.DataFrame([novo])], ignore_index=True).reset_index(drop=True)
+                    rastreador("insumos", colunas_ignoradas=()).marcar_inclusao(1)
                     st.success(f"Insumo '{nome_insumo}' adicionado!")
                     st.rerun()
 
@@ -1321,9 +1678,13 @@ def papelaria_aba():
         st.dataframe(st.session_state.insumos.reindex(columns=ordem_cols), use_container_width=True)
 
         if not st.session_state.insumos.empty:
+            opcoes_insumos = opcoes_com_busca(
+                "🔎 Buscar insumo", st.session_state.insumos, "insumos", "Nome",
+                ["Nome", "Categoria"] + col_defs_para("Insumos")["Campo"].tolist(), key="busca_insumo"
+            )
             insumo_selecionado = st.selectbox(
                 "Selecione um insumo",
-                [""] + st.session_state.insumos["Nome"].astype(str).fillna("").tolist(),
+                opcoes_insumos,
                 key="insumo_escolhido_edit_del"
             )
         else:
@@ -1337,12 +1698,13 @@ def papelaria_aba():
                 key=f"acao_insumo_{insumo_selecionado}"
             )
 
-            idxs = st.session_state.insumos.index[st.session_state.insumos["Nome"] == insumo_selecionado].tolist()
-            idx = idxs[0] if idxs else None
+            pos_insumo = indice_nomes("insumos", "Nome").posicao(st.session_state.insumos, insumo_selecionado)
+            idx = st.session_state.insumos.index[pos_insumo] if pos_insumo is not None else None
 
             if acao_insumo == "Excluir" and idx is not None:
                 if st.button("Confirmar Exclusão", key=f"excluir_insumo_{idx}"):
                     st.session_state.insumos = st.session_state.insumos.drop(index=idx).reset_index(drop=True)
+                    rastreador("insumos", colunas_ignoradas=()).marcar_exclusao([idx])
                     st.success(f"Insumo '{insumo_selecionado}' removido!")
                     st.rerun()
 
@@ -1375,12 +1737,22 @@ def papelaria_aba():
 
                     salvou = st.form_submit_button("Salvar Alterações", key=f"salvar_insumo_{idx}")
                     if salvou:
+                        nome_antigo = str(atual.get("Nome", ""))
+                        if str(novo_nome) != nome_antigo:
+                            # Mantém a composição dos produtos apontando para o insumo renomeado
+                            linhas_insumo = np.flatnonzero((st.session_state.composicao["Insumo"] == nome_antigo).to_numpy())
+                            st.session_state.composicao = renomear_insumo(st.session_state.composicao, nome_antigo, novo_nome)
+                            rastreador("composicao", colunas_ignoradas=()).marcar_linhas(linhas_insumo)
                         st.session_state.insumos.loc[idx, "Nome"] = novo_nome
                         st.session_state.insumos.loc[idx, "Categoria"] = nova_categoria
                         st.session_state.insumos.loc[idx, "Unidade"] = nova_unidade
                         st.session_state.insumos.loc[idx, "Preço Unitário (R$)"] = float(novo_preco)
                         for k, v in valores_extras_edit.items():
                             st.session_state.insumos.loc[idx, k] = v
+                        rastreador("insumos", colunas_ignoradas=()).marcar_linhas([idx])
+                        preco_antigo = pd.to_numeric(pd.Series([atual.get("Preço Unitário (R$)", 0.0)]), errors="coerce").fillna(0.0).iloc[0]
+                        if float(novo_preco) != float(preco_antigo):
+                            st.session_state.resumo_propagacao = (novo_nome, propagar_custos_insumos([novo_nome]))
                         st.success("Insumo atualizado!")
                         st.rerun()
 
@@ -1395,10 +1767,8 @@ def papelaria_aba():
             st.subheader("Adicionar novo produto")
             nome_produto = st.text_input("Nome do Produto", key="novo_produto_nome")
 
-            if 'Nome' in st.session_state.insumos.columns:
-                insumos_disponiveis = st.session_state.insumos["Nome"].dropna().unique().tolist()
-            else:
-                insumos_disponiveis = []
+            indice_insumos = indice_nomes("insumos", "Nome")
+            insumos_disponiveis = indice_insumos.nomes(st.session_state.insumos)
 
             insumos_selecionados = st.multiselect("Selecione os insumos usados", insumos_disponiveis, key="novo_produto_insumos_selecionados")
 
@@ -1406,7 +1776,7 @@ def papelaria_aba():
             custo_total = 0.0
 
             for insumo in insumos_selecionados:
-                dados_insumo = st.session_state.insumos.loc[st.session_state.insumos["Nome"] == insumo].iloc[0]
+                dados_insumo = indice_insumos.linha(st.session_state.insumos, insumo)
                 preco_unit = float(dados_insumo.get("Preço Unitário (R$)", 0.0))
                 unidade = str(dados_insumo.get("Unidade", ""))
 
@@ -1432,8 +1802,8 @@ def papelaria_aba():
 
             margem = st.number_input("Margem de Lucro (%)", min_value=0.0, format="%.2f", value=30.0, key="novo_produto_margem")
 
-            preco_vista = custo_total * (1 + margem / 100) if custo_total > 0 else 0.0
-            preco_cartao = preco_vista / 0.8872 if preco_vista > 0 else 0.0
+            preco_vista = motor.preco_a_vista(custo_total, margem) if custo_total > 0 else 0.0
+            preco_cartao = motor.preco_cartao(preco_vista) if preco_vista > 0 else 0.0
 
             st.markdown(f"💸 **Preço à Vista Calculado:** {formatar_brl(preco_vista)}")
             st.markdown(f"💳 **Preço no Cartão Calculado:** {formatar_brl(preco_cartao)}")
@@ -1471,43 +1841,33 @@ def papelaria_aba():
                     for k, v in valores_extras_prod.items():
                         novo[k] = v
 
-                    # Envio da mensagem para o Telegram (mantido)
-                    try:
-                        TELEGRAM_TOKEN_SECRET = st.secrets.get("telegram_token", HARDCODED_TELEGRAM_TOKEN)
-                        TELEGRAM_CHAT_ID_PROD = TELEGRAM_CHAT_ID
-                        THREAD_ID_PROD = 43
-
-                        mensagem = f"<b>📦 Novo Produto Cadastrado:</b>\n"
-                        mensagem += f"<b>Produto:</b> {nome_produto}\n"
-                        mensagem += "<b>Insumos:</b>\n"
-
-                        for insumo in insumos_usados:
-                            nome = insumo['Insumo']
-                            qtd = insumo['Quantidade Usada']
-                            un = insumo['Unidade']
-                            custo = insumo['Custo']
-                            mensagem += f"• {nome} - {qtd} {un} ({formatar_brl(custo)})\n" # Formatado em BRL
-
-                        mensagem += f"\n<b>Custo Total:</b> {formatar_brl(custo_total)}\n" # Formatado em BRL
-                        mensagem += f"\n<b>Preço à Vista:</b> {formatar_brl(preco_vista)}\n" # Formatado em BRL
-                        mensagem += f"\n<b>Preço no Cartão:</b> {formatar_brl(preco_cartao)}\n" # Formatado em BRL
-
-                        telegram_url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN_SECRET}/sendMessage"
-                        payload = {
-                            "chat_id": TELEGRAM_CHAT_ID_PROD,
-                            "message_thread_id": THREAD_ID_PROD,
-                            "text": mensagem,
-                            "parse_mode": "HTML"
-                        }
+                    # Notificação no Telegram: só entra na fila, o envio é em segundo plano
+                    TELEGRAM_TOKEN_SECRET = st.secrets.get("telegram_token", HARDCODED_TELEGRAM_TOKEN)
+                    THREAD_ID_PROD = 43
+
+                    mensagem = f"<b>📦 Novo Produto Cadastrado:</b>\n"
+                    mensagem += f"<b>Produto:</b> {nome_produto}\n"
+                    mensagem += "<b>Insumos:</b>\n"
+
+                    for insumo in insumos_usados:
+                        nome = insumo['Insumo']
+                        qtd = insumo['Quantidade Usada']
+                        un = insumo['Unidade']
+                        custo = insumo['Custo']
+                        mensagem += f"• {nome} - {qtd} {un} ({formatar_brl(custo)})\n" # Formatado em BRL
 
-                        response = requests.post(telegram_url, json=payload)
-                        if response.status_code != 200:
-                            st.warning(f"⚠️ Erro ao enviar para Telegram: {response.text}")
-                        else:
-                             st.success("✅ Mensagem enviada para o Telegram!")
+                    mensagem += f"\n<b>Custo Total:</b> {formatar_brl(custo_total)}\n" # Formatado em BRL
+                    mensagem += f"\n<b>Preço à Vista:</b> {formatar_brl(preco_vista)}\n" # Formatado em BRL
+                    mensagem += f"\n<b>Preço no Cartão:</b> {formatar_brl(preco_cartao)}\n" # Formatado em BRL
 
+                    try:
+                        obter_fila_telegram().enviar_mensagem(
+                            TELEGRAM_TOKEN_SECRET, TELEGRAM_CHAT_ID, mensagem, thread_id=THREAD_ID_PROD,
+                            parse_mode="HTML",
+                        )
+                        st.success("📨 Mensagem na fila de envio do Telegram.")
                     except Exception as e:
-                        st.warning(f"⚠️ Falha ao tentar enviar para o Telegram: {e}")
+                        st.warning(f"⚠️ Falha ao colocar a mensagem na fila do Telegram: {e}")
 
                     # Salva no DataFrame local
                     st.session_state.produtos = garantir_colunas_extras(st.session_state.produtos, "Produtos")
@@ -1516,6 +1876,11 @@ def papelaria_aba():
                         [st.session_state.produtos, pd.DataFrame([novo])],
                         ignore_index=True
                     ).reset_index(drop=True)
+                    rastreador("produtos", colunas_ignoradas=()).marcar_inclusao(1)
+                    atualizar_composicao(
+                        novo["Produto"], novo["Produto"],
+                        {item["Insumo"]: item["Quantidade Usada"] for item in insumos_usados}
+                    )
                     st.success(f"Produto '{nome_produto}' adicionado!")
                     st.rerun()
 
@@ -1524,9 +1889,13 @@ def papelaria_aba():
         st.dataframe(st.session_state.produtos.reindex(columns=ordem_cols_p), use_container_width=True)
 
         if not st.session_state.produtos.empty:
+            opcoes_produtos = opcoes_com_busca(
+                "🔎 Buscar produto", st.session_state.produtos, "produtos", "Produto",
+                ["Produto"] + col_defs_para("Produtos")["Campo"].tolist(), key="busca_produto"
+            )
             produto_selecionado = st.selectbox(
                 "Selecione um produto",
-                [""] + st.session_state.produtos["Nome"].astype(str).fillna("").tolist(),
+                opcoes_produtos,
                 key="produto_escolhido_edit_del"
             )
         else:
@@ -1540,12 +1909,14 @@ def papelaria_aba():
                 key=f"acao_produto_{produto_selecionado}"
             )
 
-            idxs_p = st.session_state.produtos.index[st.session_state.produtos["Produto"] == produto_selecionado].tolist()
-            idx_p = idxs_p[0] if idxs_p else None
+            pos_produto = indice_nomes("produtos", "Produto").posicao(st.session_state.produtos, produto_selecionado)
+            idx_p = st.session_state.produtos.index[pos_produto] if pos_produto is not None else None
 
             if acao_produto == "Excluir" and idx_p is not None:
                 if st.button("Confirmar Exclusão", key=f"excluir_produto_{idx_p}"):
                     st.session_state.produtos = st.session_state.produtos.drop(index=idx_p).reset_index(drop=True)
+                    rastreador("produtos", colunas_ignoradas=()).marcar_exclusao([idx_p])
+                    atualizar_composicao(produto_selecionado, produto_selecionado, {})
                     st.success(f"Produto '{produto_selecionado}' removido!")
                     st.rerun()
 
@@ -1555,29 +1926,24 @@ def papelaria_aba():
                     novo_nome = st.text_input("Nome do Produto", value=str(atual_p.get("Produto","")), key=f"edit_produto_nome_{idx_p}")
                     nova_margem = st.number_input("Margem (%)", min_value=0.0, format="%.2f", value=float(atual_p.get("Margem (%)", 0.0)), key=f"edit_produto_margem_{idx_p}")
 
-                    try:
-                        insumos_atual = ast.literal_eval(atual_p.get("Insumos Usados", "[]"))
-                        if not isinstance(insumos_atual, list):
-                            insumos_atual = []
-                    except Exception:
-                        insumos_atual = []
-
-                    insumos_disponiveis = st.session_state.insumos["Nome"].dropna().unique().tolist()
-                    nomes_pre_selecionados = [i["Insumo"] for i in insumos_atual]
+                    # Composição atual vem da tabela de composição (insumo -> quantidade)
+                    itens_atuais = itens_do_produto(st.session_state.composicao, atual_p.get("Produto", ""))
+                    quantidades_atuais = dict(zip(itens_atuais["Insumo"], itens_atuais["Quantidade"]))
+
+                    indice_insumos = indice_nomes("insumos", "Nome")
+                    insumos_disponiveis = indice_insumos.nomes(st.session_state.insumos)
+                    nomes_pre_selecionados = [i for i in quantidades_atuais if indice_insumos.contem(st.session_state.insumos, i)]
                     insumos_editados = st.multiselect("Selecione os insumos usados", insumos_disponiveis, default=nomes_pre_selecionados, key=f"edit_produto_insumos_selecionados_{idx_p}")
 
                     insumos_usados_edit = []
                     novo_custo = 0.0
 
                     for insumo in insumos_editados:
-                        dados_insumo = st.session_state.insumos.loc[st.session_state.insumos["Nome"] == insumo].iloc[0]
+                        dados_insumo = indice_insumos.linha(st.session_state.insumos, insumo)
                         preco_unit = float(dados_insumo.get("Preço Unitário (R$)", 0.0))
                         unidade = str(dados_insumo.get("Unidade", ""))
 
-                        qtd_default = 0.0
-                        for item in insumos_atual:
-                            if item.get("Insumo") == insumo:
-                                qtd_default = float(item.get("Quantidade Usada", 0.0))
+                        qtd_default = float(quantidades_atuais.get(insumo, 0.0))
 
                         qtd_usada = st.number_input(
                             f"Quantidade usada de {insumo} ({unidade}) - Preço unitário R$ {preco_unit:.2f}",
@@ -1598,8 +1964,8 @@ def papelaria_aba():
                             "Custo": custo_insumo
                         })
 
-                    novo_vista = novo_custo * (1 + nova_margem / 100)
-                    novo_cartao = novo_vista / 0.8872
+                    novo_vista = motor.preco_a_vista(novo_custo, nova_margem)
+                    novo_cartao = motor.preco_cartao(novo_vista)
 
                     st.markdown(f"**Novo custo calculado: {formatar_brl(novo_custo)}**")
                     st.markdown(f"💸 **Preço à Vista Recalculado:** {formatar_brl(novo_vista)}")
@@ -1631,6 +1997,11 @@ def papelaria_aba():
                         st.session_state.produtos.loc[idx_p, "Insumos Usados"] = str(insumos_usados_edit)
                         for k, v in valores_extras_edit_p.items():
                             st.session_state.produtos.loc[idx_p, k] = v
+                        rastreador("produtos", colunas_ignoradas=()).marcar_linhas([idx_p])
+                        atualizar_composicao(
+                            atual_p.get("Produto", ""), novo_nome,
+                            {item["Insumo"]: item["Quantidade Usada"] for item in insumos_usados_edit}
+                        )
                         st.success("Produto atualizado!")
                         st.rerun()
 
@@ -1645,6 +2016,9 @@ def papelaria_aba():
 # ROTEAMENTO FINAL
 # =====================================
 
+pre_carregar_catalogo()
+retomar_fila_telegram()
+
 if 'main_page_select' not in st.session_state:
     st.session_state.main_page_select = "Precificação"
 
@@ -1656,5 +2030,11 @@ pagina = st.sidebar.radio(
 
 if pagina == "Precificação":
     precificacao_completa()
+    nomes_compartilhados = ["produtos_manuais"]
 elif pagina == "Papelaria":
     papelaria_aba()
+    nomes_compartilhados = ["insumos", "produtos", "campos", "composicao"]
+
+# Traz para esta sessão as alterações que outras sessões publicarem enquanto ela está aberta
+with st.sidebar:
+    verificar_catalogo_compartilhado(nomes_compartilhados)
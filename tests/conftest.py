@@ -0,0 +1,58 @@
+"""Servidor HTTP local para testar os clientes do GitHub e do Telegram sem rede."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+
+class Requisicao:
+    def __init__(self, metodo, caminho, consulta, headers, corpo):
+        self.metodo = metodo
+        self.caminho = caminho
+        self.consulta = consulta
+        self.headers = headers
+        self.corpo = corpo
+
+    def json(self):
+        return json.loads(self.corpo or b"{}")
+
+
+@pytest.fixture
+def servidor_http():
+    """
+    `servidor_http(responder)` sobe um servidor em 127.0.0.1 e retorna a URL base.
+    `responder(req)` devolve (status, corpo): dict vira JSON. Servidores param no fim do teste.
+    """
+    servidores = []
+
+    def iniciar(responder):
+        class Handler(BaseHTTPRequestHandler):
+            def _responder(self):
+                url = urlsplit(self.path)
+                tamanho = int(self.headers.get("Content-Length") or 0)
+                req = Requisicao(self.command, url.path, parse_qs(url.query), dict(self.headers),
+                                 self.rfile.read(tamanho))
+                status, corpo = responder(req)
+                dados = json.dumps(corpo).encode() if isinstance(corpo, (dict, list)) else (corpo or b"")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _responder
+
+            def log_message(self, *args):
+                pass
+
+        servidor = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=servidor.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        servidores.append(servidor)
+        return f"http://127.0.0.1:{servidor.server_address[1]}"
+
+    yield iniciar
+    for servidor in servidores:
+        servidor.shutdown()
+        servidor.server_close()
@@ -0,0 +1,154 @@
+"""Backends de armazenamento locais e a réplica."""
+import json
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from precificar import armazenamento
+from precificar.armazenamento import (
+    Armazenamento, ArmazenamentoRegistro, ArmazenamentoReplicado, ArmazenamentoSQLite,
+)
+from precificar.rastreamento import RastreadorAlteracoes
+
+
+class ReplicaFalsa(Armazenamento):
+    """Réplica em memória; conta as leituras com `revalidar`."""
+
+    def __init__(self, conjuntos=None):
+        self.conjuntos = dict(conjuntos or {})
+        self.revalidacoes = 0
+
+    @property
+    def le_do_github(self) -> bool:
+        return True
+
+    def carregar(self, nome, revalidar=False):
+        self.revalidacoes += revalidar
+        return self.conjuntos.get(nome, pd.DataFrame()).copy()
+
+    def contem(self, nome):
+        return nome in self.conjuntos
+
+    def salvar_varios(self, dataframes, mensagem="Atualização via app"):
+        self.conjuntos.update({nome: df.copy() for nome, df in dataframes.items()})
+
+
+def _df(*precos) -> pd.DataFrame:
+    return pd.DataFrame({"Produto": [f"P{i}" for i in range(len(precos))], "Custo Unitário": list(precos)})
+
+
+def test_recarga_traz_a_replica_e_sobrescreve_a_copia_local(tmp_path):
+    local = ArmazenamentoSQLite(str(tmp_path / "dados.sqlite3"))
+    replica = ReplicaFalsa({"precificacao.csv": _df(1.0, 2.0)})
+    backend = ArmazenamentoReplicado(local, replica)
+
+    assert_frame_equal(backend.carregar("precificacao.csv"), _df(1.0, 2.0))  # Primeira vez: copia da réplica
+    replica.conjuntos["precificacao.csv"] = _df(5.0, 6.0, 7.0)  # Editado direto no GitHub
+
+    assert_frame_equal(backend.carregar("precificacao.csv"), _df(1.0, 2.0))  # Leitura normal: cópia local
+    assert_frame_equal(backend.carregar("precificacao.csv", revalidar=True), _df(5.0, 6.0, 7.0))
+    assert replica.revalidacoes == 1
+    assert_frame_equal(local.carregar("precificacao.csv"), _df(5.0, 6.0, 7.0))
+
+
+def test_recarga_sem_resposta_da_replica_fica_com_a_copia_local(tmp_path):
+    local = ArmazenamentoSQLite(str(tmp_path / "dados.sqlite3"))
+    local.salvar("precificacao.csv", _df(1.0))
+    backend = ArmazenamentoReplicado(local, ReplicaFalsa())  # Ex.: GitHub fora do ar
+
+    assert_frame_equal(backend.carregar("precificacao.csv", revalidar=True), _df(1.0))
+    assert not ArmazenamentoReplicado(local, None).le_do_github
+
+
+def _operacoes(backend: ArmazenamentoRegistro, nome: str) -> list:
+    return [json.loads(t) for t in open(backend._caminhos(nome)[1], encoding="utf-8")]
+
+
+def _editar_ao_acaso(rng, df: pd.DataFrame, rastreio: RastreadorAlteracoes) -> pd.DataFrame:
+    """Uma edição, inclusão ou exclusão como as do app, marcada no rastreador."""
+    acao = rng.integers(3) if len(df) else 1
+    if acao == 0:
+        i = int(rng.integers(len(df)))
+        df.loc[i, "Custo Unitário"] = float(rng.integers(100))
+        if rng.random() < 0.2:
+            df.loc[i, "Produto"] = f"Renomeado {rng.integers(1000)}"
+        rastreio.marcar_linhas([i])
+    elif acao == 1:
+        novas = int(rng.integers(1, 4))
+        df = pd.concat([df, pd.DataFrame({
+            "Produto": [f"Novo {rng.integers(5)}" for _ in range(novas)],  # Nomes repetidos de propósito
+            "Custo Unitário": rng.integers(100, size=novas).astype(float),
+        })], ignore_index=True)
+        rastreio.marcar_inclusao(novas)
+    else:
+        posicoes = sorted(set(rng.integers(len(df), size=int(rng.integers(1, 3))).tolist()))
+        df = df.drop(index=posicoes).reset_index(drop=True)
+        rastreio.marcar_exclusao(posicoes)
+    return df
+
+
+def test_registro_com_alteracoes_do_rastreador_reproduz_o_df(tmp_path):
+    for semente in range(10):
+        rng = np.random.default_rng(semente)
+        backend = ArmazenamentoRegistro(str(tmp_path / str(semente)), limite_operacoes=10_000)
+        df = _df(*rng.integers(100, size=30).astype(float))
+        rastreio = RastreadorAlteracoes(colunas_ignoradas=())
+        rastreio.reiniciar(df)
+        backend.salvar_varios({"precificacao.csv": df}, alteracoes={"precificacao.csv": rastreio.alteracoes()})
+        for _ in range(15):
+            for _ in range(int(rng.integers(1, 4))):
+                df = _editar_ao_acaso(rng, df, rastreio)
+            if rastreio.sincronizar(df):
+                backend.salvar_varios({"precificacao.csv": df}, alteracoes={"precificacao.csv": rastreio.alteracoes()})
+                rastreio.marcar_salvo()
+            # Relê do disco: o registro gravado reproduz o DF da sessão
+            assert_frame_equal(ArmazenamentoRegistro(backend.diretorio).carregar("precificacao.csv"), df)
+
+
+def test_registro_hasheia_so_as_linhas_marcadas(tmp_path, monkeypatch):
+    backend = ArmazenamentoRegistro(str(tmp_path))
+    df = _df(*range(1000))
+    rastreio = RastreadorAlteracoes(colunas_ignoradas=())
+    rastreio.reiniciar(df)
+    backend.salvar_varios({"precificacao.csv": df}, alteracoes={"precificacao.csv": rastreio.alteracoes()})
+
+    tamanhos = []
+    hash_original = armazenamento.hash_linhas
+    monkeypatch.setattr(armazenamento, "hash_linhas", lambda trecho: tamanhos.append(len(trecho)) or hash_original(trecho))
+    df.loc[10, "Custo Unitário"] = -1.0
+    rastreio.marcar_linhas([10])
+    df = df.drop(index=[500]).reset_index(drop=True)
+    rastreio.marcar_exclusao([500])
+    df = pd.concat([df, _df(7.0)], ignore_index=True)
+    rastreio.marcar_inclusao(1)
+    assert rastreio.sincronizar(df)
+    backend.salvar_varios({"precificacao.csv": df}, alteracoes={"precificacao.csv": rastreio.alteracoes()})
+    rastreio.marcar_salvo()
+
+    assert tamanhos == [2]  # A linha editada e a incluída
+    assert [(op["op"], op["chave"]) for op in _operacoes(backend, "precificacao.csv")] == [
+        ("excluir", "P500\x1f0"), ("editar", "P10\x1f0"), ("incluir", "P0\x1f1"),
+    ]
+    assert_frame_equal(ArmazenamentoRegistro(backend.diretorio).carregar("precificacao.csv"), df)
+
+
+def test_registro_compara_o_df_inteiro_se_outra_sessao_salvou(tmp_path):
+    backend = ArmazenamentoRegistro(str(tmp_path))
+    df = _df(1.0, 2.0, 3.0)
+    minha, outra = RastreadorAlteracoes(colunas_ignoradas=()), RastreadorAlteracoes(colunas_ignoradas=())
+    minha.reiniciar(df)
+    backend.salvar_varios({"precificacao.csv": df}, alteracoes={"precificacao.csv": minha.alteracoes()})
+
+    # Outra sessão exclui a primeira linha; as posições desta sessão não valem mais para o registro
+    df_outra = df.drop(index=[0]).reset_index(drop=True)
+    outra.reiniciar(df)
+    outra.marcar_exclusao([0])
+    outra.sincronizar(df_outra)
+    backend.salvar_varios({"precificacao.csv": df_outra}, alteracoes={"precificacao.csv": outra.alteracoes()})
+
+    df.loc[2, "Custo Unitário"] = 30.0
+    minha.marcar_linhas([2])
+    minha.sincronizar(df)
+    backend.salvar_varios({"precificacao.csv": df}, alteracoes={"precificacao.csv": minha.alteracoes()})
+    assert_frame_equal(ArmazenamentoRegistro(backend.diretorio).carregar("precificacao.csv"), df)
@@ -0,0 +1,199 @@
+"""GravadorGitHub contra um GitHub falso local (API de conteúdos e Git Data API)."""
+import base64
+import hashlib
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from precificar import autosave
+from precificar.autosave import GravadorGitHub, _sha_blob
+
+REPO = "dono/repo"
+
+
+def _sha(*partes) -> str:
+    return hashlib.sha1(repr(partes).encode()).hexdigest()
+
+
+class GitHubFalso:
+    """Um repositório em memória: árvores (caminho -> conteúdo), commits e a ref `main`."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.arvores, self.commits = {}, {}
+        self.requisicoes = []  # (método, caminho)
+        self.falhas = {}  # (método, trecho do caminho) -> status a devolver nas próximas chamadas
+        self.head = self._commit({"README.md": "inicial"}, None, "inicial")
+
+    def _commit(self, arquivos: dict, pai, mensagem: str) -> str:
+        arvore = _sha("arvore", sorted(arquivos.items()))
+        self.arvores[arvore] = dict(arquivos)
+        commit = _sha("commit", arvore, pai, mensagem)
+        self.commits[commit] = {"tree": arvore, "parents": [pai] if pai else []}
+        return commit
+
+    def arquivos(self, commit=None) -> dict:
+        return self.arvores[self.commits[commit or self.head]["tree"]]
+
+    def avancar(self, arquivos: dict):
+        """Commit feito por fora do app (ex.: edição no site do GitHub)."""
+        with self.lock:
+            self.head = self._commit({**self.arquivos(), **arquivos}, self.head, "externo")
+
+    def chamadas(self, metodo: str, trecho: str) -> int:
+        return sum(1 for m, c in self.requisicoes if m == metodo and trecho in c)
+
+    def responder(self, req):
+        with self.lock:
+            self.requisicoes.append((req.metodo, req.caminho))
+            for (metodo, trecho), status in self.falhas.items():
+                if metodo == req.metodo and trecho in req.caminho and status:
+                    return status.pop(0), {"message": "falha simulada"}
+
+            prefixo = f"/repos/{REPO}"
+            caminho = req.caminho[len(prefixo):]
+            if caminho.startswith("/contents/"):
+                return self._conteudos(req, caminho[len("/contents/"):])
+            if req.metodo == "GET" and caminho == "/git/ref/heads/main":
+                return 200, {"object": {"sha": self.head}}
+            if req.metodo == "GET" and caminho.startswith("/git/commits/"):
+                sha = caminho.rsplit("/", 1)[1]
+                return 200, {"sha": sha, "tree": {"sha": self.commits[sha]["tree"]}}
+            if req.metodo == "POST" and caminho == "/git/trees":
+                corpo = req.json()
+                arquivos = dict(self.arvores[corpo["base_tree"]])
+                arquivos.update({e["path"]: e["content"] for e in corpo["tree"]})
+                sha = _sha("arvore", sorted(arquivos.items()))
+                self.arvores[sha] = arquivos
+                return 201, {"sha": sha}
+            if req.metodo == "POST" and caminho == "/git/commits":
+                corpo = req.json()
+                sha = _sha("commit", corpo["tree"], tuple(corpo["parents"]), corpo["message"])
+                self.commits[sha] = {"tree": corpo["tree"], "parents": corpo["parents"]}
+                return 201, {"sha": sha}
+            if req.metodo == "PATCH" and caminho == "/git/refs/heads/main":
+                sha = req.json()["sha"]
+                if self.commits[sha]["parents"] != [self.head]:
+                    return 422, {"message": "Update is not a fast forward"}
+                self.head = sha
+                return 200, {"object": {"sha": sha}}
+            return 404, {"message": "Not Found"}
+
+    def _conteudos(self, req, path: str):
+        arquivos = self.arquivos()
+        atual = _sha_blob(arquivos[path].encode()) if path in arquivos else None
+        if req.metodo == "GET":
+            return (200, {"sha": atual}) if atual else (404, {"message": "Not Found"})
+        corpo = req.json()
+        if atual is not None and corpo.get("sha") != atual:
+            return 409, {"message": f"{path} does not match {corpo.get('sha')}"}
+        conteudo = base64.b64decode(corpo["content"]).decode()
+        self.head = self._commit({**arquivos, path: conteudo}, self.head, corpo["message"])
+        return 200, {
+            "content": {"sha": _sha_blob(conteudo.encode())},
+            "commit": {"sha": self.head, "tree": {"sha": self.commits[self.head]["tree"]}},
+        }
+
+
+@pytest.fixture
+def github(servidor_http):
+    falso = GitHubFalso()
+    falso.url = servidor_http(falso.responder)
+    return falso
+
+
+@pytest.fixture
+def gravador(github):
+    return GravadorGitHub(debounce=0, espera_maxima=0, api=github.url)
+
+
+def _df(n: int) -> pd.DataFrame:
+    return pd.DataFrame({"Produto": [f"P{i}" for i in range(n)], "Custo": [float(i) for i in range(n)]})
+
+
+def test_arquivo_unico_reaproveita_o_sha_do_put_anterior(github, gravador):
+    gravador.agendar("t", REPO, "a.csv", _df(2))
+    assert gravador.esperar(5)
+    gravador.agendar("t", REPO, "a.csv", _df(3))
+    assert gravador.esperar(5)
+
+    assert github.arquivos()["a.csv"] == _df(3).to_csv(index=False)
+    assert github.chamadas("GET", "/contents/a.csv") == 1  # Só antes do primeiro PUT
+    assert github.chamadas("PUT", "/contents/a.csv") == 2
+    assert gravador.consumir_erros() == []
+
+
+def test_arquivo_alterado_por_fora_busca_o_sha_e_repete(github, gravador):
+    gravador.agendar("t", REPO, "a.csv", _df(2))
+    assert gravador.esperar(5)
+    github.avancar({"a.csv": "editado no site\n"})
+
+    gravador.agendar("t", REPO, "a.csv", _df(4))
+    assert gravador.esperar(5)
+
+    assert github.arquivos()["a.csv"] == _df(4).to_csv(index=False)
+    assert github.chamadas("PUT", "/contents/a.csv") == 3  # 200, 409, 200
+    assert github.chamadas("GET", "/contents/a.csv") == 2
+    assert gravador.consumir_erros() == []
+
+
+def test_varios_arquivos_vao_num_unico_commit(github, gravador):
+    head_antes = github.head
+    dfs = {"insumos.csv": _df(1), "produtos.csv": _df(2), "composicao.csv": _df(3)}
+    gravador.agendar_varios("t", REPO, dfs, mensagem="papelaria")
+    assert gravador.esperar(5)
+
+    assert github.commits[github.head]["parents"] == [head_antes]
+    for caminho, df in dfs.items():
+        assert github.arquivos()[caminho] == df.to_csv(index=False)
+    assert github.arquivos()["README.md"] == "inicial"
+    assert (github.chamadas("POST", "/git/trees"), github.chamadas("POST", "/git/commits"),
+            github.chamadas("PATCH", "/git/refs")) == (1, 1, 1)
+
+
+def test_lote_refaz_do_topo_quando_a_branch_andou(github, gravador):
+    dfs = {"insumos.csv": _df(1), "produtos.csv": _df(2)}
+    gravador.agendar_varios("t", REPO, dfs)
+    assert gravador.esperar(5)
+    assert github.chamadas("GET", "/git/ref/heads/main") == 1
+
+    github.avancar({"externo.csv": "x\n"})
+    dfs = {"insumos.csv": _df(5), "produtos.csv": _df(6)}
+    gravador.agendar_varios("t", REPO, dfs)
+    assert gravador.esperar(5)
+
+    # O topo em cache ficou velho: PATCH recusado (422) e o lote refeito a partir da ref atual
+    assert github.chamadas("PATCH", "/git/refs") == 3
+    assert github.chamadas("GET", "/git/ref/heads/main") == 2
+    arquivos = github.arquivos()
+    assert arquivos["externo.csv"] == "x\n"
+    assert arquivos["insumos.csv"] == _df(5).to_csv(index=False)
+    assert gravador.consumir_erros() == []
+
+
+def test_falha_volta_para_a_fila_com_backoff(github, gravador, monkeypatch):
+    monkeypatch.setattr(autosave, "BACKOFF_BASE", 0.05)
+    github.falhas[("POST", "/git/trees")] = [500, 500]
+    dfs = {"insumos.csv": _df(1), "produtos.csv": _df(2)}
+    gravador.agendar_varios("t", REPO, dfs)
+
+    assert gravador.esperar(5)
+    assert github.chamadas("POST", "/git/trees") == 3
+    assert github.arquivos()["produtos.csv"] == _df(2).to_csv(index=False)
+    erros = gravador.consumir_erros()
+    assert len(erros) == 1 and "nova tentativa" in erros[0]
+
+
+def test_versao_nova_agendada_durante_o_backoff_substitui_a_que_falhou(github, gravador, monkeypatch):
+    monkeypatch.setattr(autosave, "BACKOFF_BASE", 0.3)
+    github.falhas[("PUT", "/contents/a.csv")] = [400]
+    gravador.agendar("t", REPO, "a.csv", _df(1))
+    while github.chamadas("PUT", "/contents/a.csv") == 0:
+        time.sleep(0.01)
+    gravador.agendar("t", REPO, "a.csv", _df(7))
+
+    assert gravador.esperar(5)
+    assert github.arquivos()["a.csv"] == _df(7).to_csv(index=False)
+    assert github.chamadas("PUT", "/contents/a.csv") == 2
@@ -0,0 +1,121 @@
+"""Catálogo compartilhado entre sessões: isolamento das cópias e mesclagem."""
+import itertools
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from precificar import catalogo_compartilhado
+from precificar.catalogo_compartilhado import CatalogoCompartilhado, _mesclar
+from precificar.rastreamento import RastreadorAlteracoes
+
+
+def _df(n: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "Produto": [f"P{i}" for i in range(n)],
+        "Custo Unitário": np.arange(n, dtype=float),
+        "Marca": ["Tilibra"] * n,
+    })
+
+
+def _sessao(catalogo: CatalogoCompartilhado, nome: str = "produtos_manuais"):
+    versao, df = catalogo.obter(nome)
+    rastreio = RastreadorAlteracoes(colunas_ignoradas=())
+    rastreio.reiniciar(df)
+    return versao, df, rastreio
+
+
+def _editar(rng, df: pd.DataFrame, rastreio: RastreadorAlteracoes, nomes) -> pd.DataFrame:
+    """Edição, renomeação, inclusão ou exclusão (com nomes únicos), marcada no rastreador."""
+    acao = rng.integers(4) if len(df) else 2
+    if acao in (0, 1):
+        i = int(rng.integers(len(df)))
+        if acao == 0:
+            df.loc[i, "Custo Unitário"] = float(rng.integers(1000))
+        else:
+            df.loc[i, "Produto"] = next(nomes)
+        rastreio.marcar_linhas([i])
+    elif acao == 2:
+        df = pd.concat([df, pd.DataFrame({"Produto": [next(nomes)], "Custo Unitário": [1.0], "Marca": ["BIC"]})],
+                       ignore_index=True)
+        rastreio.marcar_inclusao(1)
+    else:
+        i = int(rng.integers(len(df)))
+        df = df.drop(index=[i]).reset_index(drop=True)
+        rastreio.marcar_exclusao([i])
+    return df
+
+
+def test_copias_das_sessoes_sao_isoladas():
+    catalogo = CatalogoCompartilhado()
+    catalogo.substituir("produtos_manuais", _df(5))
+    _, minha = catalogo.obter("produtos_manuais")
+    _, outra = catalogo.obter("produtos_manuais")
+
+    minha.loc[0, "Custo Unitário"] = 99.0
+    minha.loc[1, "Marca"] = "Faber"
+
+    assert outra.loc[0, "Custo Unitário"] == 0.0 and outra.loc[1, "Marca"] == "Tilibra"
+    assert_frame_equal(catalogo.obter("produtos_manuais")[1], _df(5))
+
+
+def test_mesclagem_pelas_linhas_marcadas_igual_a_completa():
+    nomes = (f"N{i}" for i in itertools.count())
+    for semente in range(30):
+        rng = np.random.default_rng(semente)
+        base = _df(20)
+        meu, atual = base.copy(), base.copy()
+        rastreio = RastreadorAlteracoes(colunas_ignoradas=())
+        rastreio.reiniciar(meu)
+        outro = RastreadorAlteracoes(colunas_ignoradas=())
+        outro.reiniciar(atual)
+        for _ in range(int(rng.integers(1, 6))):
+            meu = _editar(rng, meu, rastreio, nomes)
+            atual = _editar(rng, atual, outro, nomes)
+        rastreio.sincronizar(meu)
+
+        esperado = _mesclar(base, atual, meu, "Produto")
+        assert_frame_equal(_mesclar(base, atual, meu, "Produto", rastreio.alteracoes()), esperado)
+
+
+def test_publicar_com_alteracoes_hasheia_so_as_linhas_marcadas(monkeypatch):
+    catalogo = CatalogoCompartilhado()
+    catalogo.substituir("produtos_manuais", _df(1000))
+    versao_a, df_a, rastreio_a = _sessao(catalogo)
+    versao_b, df_b, rastreio_b = _sessao(catalogo)
+
+    tamanhos = []
+    hash_original = catalogo_compartilhado.hash_linhas
+    monkeypatch.setattr(catalogo_compartilhado, "hash_linhas",
+                        lambda df: tamanhos.append(len(df)) or hash_original(df))
+
+    # Sem nada marcado (ex.: só o frete mudou) a versão não muda
+    rastreio_a.sincronizar(df_a)
+    assert catalogo.publicar("produtos_manuais", df_a, versao_a, rastreio_a.alteracoes())[0] == versao_a
+
+    df_a.loc[3, "Custo Unitário"] = -3.0
+    rastreio_a.marcar_linhas([3])
+    rastreio_a.sincronizar(df_a)
+    versao_a, _, mesclado = catalogo.publicar("produtos_manuais", df_a, versao_a, rastreio_a.alteracoes())
+    rastreio_a.marcar_salvo()
+    assert not mesclado
+
+    df_b.loc[7, "Custo Unitário"] = -7.0
+    rastreio_b.marcar_linhas([7])
+    rastreio_b.sincronizar(df_b)
+    _, mesclado_b, mesclado = catalogo.publicar("produtos_manuais", df_b, versao_b, rastreio_b.alteracoes())
+    assert mesclado and mesclado_b.loc[3, "Custo Unitário"] == -3.0 and mesclado_b.loc[7, "Custo Unitário"] == -7.0
+    assert max(tamanhos) == 1000  # B adotou a versão por obter(): a mesclagem dele compara tudo
+    tamanhos.clear()
+
+    # A publicou a versão em que se baseia, então a mesclagem dele usa as posições marcadas
+    df_a.loc[500, "Marca"] = "Faber"
+    rastreio_a.marcar_linhas([500])
+    df_a = df_a.drop(index=[10]).reset_index(drop=True)
+    rastreio_a.marcar_exclusao([10])
+    rastreio_a.sincronizar(df_a)
+    _, final, mesclado = catalogo.publicar("produtos_manuais", df_a, versao_a, rastreio_a.alteracoes())
+    assert mesclado and tamanhos == [1, 1]
+    assert "P10" not in set(final["Produto"]) and len(final) == 999
+    linha = final.set_index("Produto")
+    assert linha.loc["P500", "Marca"] == "Faber" and linha.loc["P7", "Custo Unitário"] == -7.0
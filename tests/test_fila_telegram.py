@@ -0,0 +1,194 @@
+"""FilaTelegram contra um servidor falso da Bot API."""
+import json
+import re
+import socket
+import threading
+import time
+from urllib.parse import parse_qs
+
+import pytest
+
+from precificar import fila_telegram
+from precificar.fila_telegram import FilaTelegram
+
+TOKEN = "123:ABC-segredo"
+FOLGA = 0.01  # Imprecisão do relógio/agendador
+
+
+class TelegramFalso:
+    """Registra as chamadas (instante, método, campos do formulário) e responde conforme `responder`."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.chamadas = []
+        self.responder = lambda metodo, campos, n: (200, {"ok": True, "result": {}})
+
+    def __call__(self, req):
+        token, metodo = re.fullmatch(r"/bot(.+)/(\w+)", req.caminho).groups()
+        campos = _campos(req)
+        with self.lock:
+            self.chamadas.append((time.monotonic(), metodo, campos, token))
+            return self.responder(metodo, campos, len(self.chamadas))
+
+    def do_chat(self, chat_id: str) -> list:
+        return [c for c in self.chamadas if c[2].get("chat_id") == chat_id]
+
+
+def _campos(req) -> dict:
+    """Campos de texto do formulário (urlencoded ou multipart; os arquivos ficam de fora)."""
+    tipo = req.headers.get("Content-Type", "")
+    if tipo.startswith("multipart/"):
+        corpo = req.corpo.decode("latin-1")
+        return dict(re.findall(r'name="([^"]+)"\r\n\r\n(.*?)\r\n--', corpo, re.S))
+    return {k: v[0] for k, v in parse_qs(req.corpo.decode()).items()}
+
+
+def _intervalos(chamadas: list) -> list:
+    return [b[0] - a[0] for a, b in zip(chamadas, chamadas[1:])]
+
+
+@pytest.fixture(autouse=True)
+def limites_curtos(monkeypatch):
+    monkeypatch.setattr(fila_telegram, "INTERVALO_CHAT", 0.2)
+    monkeypatch.setattr(fila_telegram, "INTERVALO_GRUPO", 0.4)
+    monkeypatch.setattr(fila_telegram, "INTERVALO_GLOBAL", 0.05)
+    monkeypatch.setattr(fila_telegram, "BACKOFF_BASE", 0.05)
+    monkeypatch.setattr(fila_telegram, "MAX_TENTATIVAS", 3)
+
+
+@pytest.fixture
+def telegram(servidor_http):
+    falso = TelegramFalso()
+    falso.url = servidor_http(falso)
+    return falso
+
+
+@pytest.fixture
+def fila(telegram, tmp_path):
+    return FilaTelegram(str(tmp_path / "fila.sqlite3"), api=telegram.url)
+
+
+def test_espacamento_por_chat_grupo_e_global(fila, telegram):
+    with fila._cond:  # Enfileira tudo antes de a thread começar a enviar
+        for i in range(3):
+            fila.enviar_mensagem(TOKEN, 1, f"privado {i}")
+            fila.enviar_mensagem(TOKEN, -100, f"grupo {i}")
+    assert fila.esperar(10)
+
+    privado, grupo = telegram.do_chat("1"), telegram.do_chat("-100")
+    assert [c[2]["text"] for c in privado] == ["privado 0", "privado 1", "privado 2"]
+    assert [c[2]["text"] for c in grupo] == ["grupo 0", "grupo 1", "grupo 2"]
+    assert min(_intervalos(privado)) >= 0.2 - FOLGA
+    assert min(_intervalos(grupo)) >= 0.4 - FOLGA
+    assert min(_intervalos(telegram.chamadas)) >= 0.05 - FOLGA
+    assert {c[3] for c in telegram.chamadas} == {TOKEN}
+
+
+def test_429_espera_o_retry_after_sem_contar_tentativa(fila, telegram, monkeypatch):
+    monkeypatch.setattr(fila_telegram, "MAX_TENTATIVAS", 1)
+    telegram.responder = lambda metodo, campos, n: (
+        (429, {"ok": False, "description": "Too Many Requests", "parameters": {"retry_after": 0.5}})
+        if n == 1 else (200, {"ok": True, "result": {}})
+    )
+    fila.enviar_mensagem(TOKEN, 1, "oi")
+    assert fila.esperar(5)
+
+    assert len(telegram.chamadas) == 2
+    assert _intervalos(telegram.chamadas)[0] >= 0.5 - FOLGA
+    assert fila.consumir_erros() == []
+
+
+def test_5xx_repete_com_backoff_ate_max_tentativas(fila, telegram, monkeypatch):
+    monkeypatch.setattr(fila_telegram, "BACKOFF_BASE", 0.3)
+    telegram.responder = lambda metodo, campos, n: (502, {"ok": False, "description": "Bad Gateway"})
+    fila.enviar_mensagem(TOKEN, 1, "oi")
+    assert fila.esperar(5)
+
+    assert len(telegram.chamadas) == 3
+    intervalos = _intervalos(telegram.chamadas)
+    assert intervalos[0] >= 0.3 - FOLGA  # Backoff dobra a cada tentativa
+    assert intervalos[1] >= 0.6 - FOLGA
+    erros = fila.consumir_erros()
+    assert len(erros) == 1 and "Bad Gateway" in erros[0]
+    assert fila.pendentes() == 0
+
+
+def test_falha_de_rede_nao_grava_nem_mostra_o_token(tmp_path):
+    with socket.socket() as s:  # Porta livre e fechada: a conexão é recusada
+        s.bind(("127.0.0.1", 0))
+        porta = s.getsockname()[1]
+    fila = FilaTelegram(str(tmp_path / "fila.sqlite3"), api=f"http://127.0.0.1:{porta}")
+    fila.enviar_mensagem(TOKEN, 1, "oi")
+    assert fila.esperar(10)
+
+    erros = fila.consumir_erros()
+    assert len(erros) == 1 and "<token>" in erros[0] and TOKEN not in erros[0]
+    assert TOKEN not in fila._conexao.execute("SELECT erro FROM mensagens").fetchone()[0]
+    for arquivo in tmp_path.iterdir():
+        assert TOKEN.encode() not in arquivo.read_bytes()
+
+
+def test_fotos_seguidas_vao_num_album(fila, telegram):
+    with fila._cond:
+        for i in range(3):
+            fila.enviar_foto(TOKEN, 1, b"\xff\xd8foto%d" % i, f"foto {i}")
+    assert fila.esperar(5)
+
+    assert [c[1] for c in telegram.chamadas] == ["sendMediaGroup"]
+    midias = json.loads(telegram.chamadas[0][2]["media"])
+    assert [m["media"] for m in midias] == ["attach://foto0", "attach://foto1", "attach://foto2"]
+    assert [m["caption"] for m in midias] == ["foto 0", "foto 1", "foto 2"]
+
+
+def test_album_recusado_envia_as_fotos_uma_a_uma(fila, telegram):
+    telegram.responder = lambda metodo, campos, n: (
+        (400, {"ok": False, "description": "Bad Request: wrong file"}) if metodo == "sendMediaGroup"
+        else (200, {"ok": True, "result": {}})
+    )
+    with fila._cond:
+        for i in range(3):
+            fila.enviar_foto(TOKEN, 1, b"\xff\xd8foto%d" % i, f"foto {i}")
+    assert fila.esperar(5)
+
+    assert [c[1] for c in telegram.chamadas] == ["sendMediaGroup", "sendPhoto", "sendPhoto", "sendPhoto"]
+    assert [c[2]["caption"] for c in telegram.chamadas[1:]] == ["foto 0", "foto 1", "foto 2"]
+    assert fila.consumir_erros() == []
+
+
+def test_pendentes_sobrevivem_ao_reinicio_sem_gravar_o_token(telegram, tmp_path, monkeypatch):
+    caminho = str(tmp_path / "fila.sqlite3")
+    with monkeypatch.context() as m:
+        m.setattr(FilaTelegram, "_iniciar", lambda self: None)  # Processo cai antes de enviar
+        anterior = FilaTelegram(caminho, api=telegram.url)
+        anterior.enviar_mensagem(TOKEN, 1, "primeira")
+        anterior.enviar_documento(TOKEN, 1, b"%PDF-1.4", "relatorio.pdf", "segunda")
+    anterior._conexao.close()
+    for arquivo in tmp_path.iterdir():
+        assert TOKEN.encode() not in arquivo.read_bytes()
+
+    reiniciada = FilaTelegram(caminho, api=telegram.url)
+    assert reiniciada.pendentes() == 2
+    assert not reiniciada.esperar(0.3)  # Sem o token, as mensagens esperam
+    assert telegram.chamadas == []
+
+    reiniciada.registrar_token(TOKEN)
+    assert reiniciada.esperar(5)
+    assert [c[1] for c in telegram.chamadas] == ["sendMessage", "sendDocument"]
+    assert [c[3] for c in telegram.chamadas] == [TOKEN, TOKEN]
+
+
+def test_fila_antiga_com_token_em_texto_puro_e_migrada(telegram, tmp_path):
+    caminho = str(tmp_path / "fila.sqlite3")
+    antiga = FilaTelegram(caminho, api="http://127.0.0.1:9")
+    with antiga._conexao:
+        antiga._conexao.execute(
+            "INSERT INTO mensagens (token, metodo, chat_id, dados, proxima_em, criada_em)"
+            " VALUES (?, 'sendMessage', '1', ?, 0, 0)", (TOKEN, json.dumps({"text": "oi"}))
+        )
+    antiga._conexao.close()
+
+    migrada = FilaTelegram(caminho, api=telegram.url)
+    assert migrada.esperar(5)
+    assert [(c[1], c[3]) for c in telegram.chamadas] == [("sendMessage", TOKEN)]
+    for arquivo in tmp_path.iterdir():
+        assert TOKEN.encode() not in arquivo.read_bytes()
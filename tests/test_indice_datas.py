@@ -0,0 +1,16 @@
+"""Índice de datas de cadastro do filtro por período."""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from precificar.indice_datas import converter_datas
+
+
+def test_converter_datas_misturadas_sem_aviso():
+    valores = pd.Series(["05/02/2024", "2024-01-05", "2024-01-06 10:30:00", "13/02/2024", "", None, "lixo"], dtype=object)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")  # Sem o "Could not infer format" a cada atualização
+        datas = converter_datas(valores)
+    esperado = ["2024-02-05", "2024-01-05", "2024-01-06", "2024-02-13", "NaT", "NaT", "NaT"]
+    np.testing.assert_array_equal(datas, np.array(esperado, dtype="datetime64[ns]"))
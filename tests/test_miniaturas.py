@@ -0,0 +1,79 @@
+"""Cache de miniaturas: limite de download e limpeza das estruturas por URL."""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from precificar import miniaturas
+from precificar.miniaturas import CacheMiniaturas
+
+
+def _png() -> bytes:
+    saida = BytesIO()
+    Image.new("RGB", (600, 300), "red").save(saida, format="PNG")
+    return saida.getvalue()
+
+
+@pytest.fixture
+def servidor_sem_tamanho():
+    """
+    Servidor que responde /infinita sem Content-Length, mandando bytes até o cliente desistir
+    (ou até 50 MB); `enviados["total"]` conta o que foi escrito.
+    """
+    enviados = {"total": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.0"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.end_headers()
+            bloco = b"\0" * 65536
+            try:
+                while enviados["total"] < 50 * 1024 * 1024:
+                    self.wfile.write(bloco)
+                    enviados["total"] += len(bloco)
+            except OSError:
+                pass  # O cliente fechou a conexão
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=servidor.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    yield f"http://127.0.0.1:{servidor.server_address[1]}", enviados
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def test_imagem_grande_demais_nao_e_baixada_inteira(servidor_http, servidor_sem_tamanho, tmp_path, monkeypatch):
+    monkeypatch.setattr(miniaturas, "TAMANHO_MAXIMO_ORIGINAL", 256 * 1024)
+    cache = CacheMiniaturas(str(tmp_path))
+
+    # Content-Length acima do limite: recusada antes de ler o corpo
+    url = servidor_http(lambda req: (200, b"\0" * (512 * 1024)))
+    assert cache.obter(url + "/grande.png") is None
+
+    # Sem Content-Length: a leitura para logo depois de passar do limite
+    url, enviados = servidor_sem_tamanho
+    assert cache.obter(url + "/infinita.png") is None
+    assert enviados["total"] < 20 * 1024 * 1024
+
+
+def test_falhas_vencidas_e_locks_sem_uso_sao_descartados(servidor_http, tmp_path, monkeypatch):
+    url = servidor_http(lambda req: (404, b"") if req.caminho.startswith("/falta") else (200, _png()))
+    cache = CacheMiniaturas(str(tmp_path))
+
+    assert cache.obter(url + "/foto.png") is not None
+    for i in range(5):
+        assert cache.obter(f"{url}/falta{i}.png") is None
+    assert len(cache._falhas) == 5
+    assert cache._locks_chave == {}
+
+    monkeypatch.setattr(miniaturas, "ESPERA_APOS_FALHA", 0)
+    assert cache.obter(url + "/foto.png") is not None  # Do cache em disco
+    assert cache.obter(url + "/falta9.png") is None
+    assert list(cache._falhas) == [url + "/falta9.png"]
@@ -0,0 +1,80 @@
+"""PrecificacaoIncremental tem de devolver exatamente o mesmo DF que processar_dataframe."""
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from precificar.precificacao import PrecificacaoIncremental, atribuir_linhas, processar_dataframe
+
+MARGEM_FIXA = 30.0
+
+
+def _linhas(rng: np.random.Generator, n: int, qtd_texto: bool) -> pd.DataFrame:
+    qtd = rng.integers(0, 20, n)
+    df = pd.DataFrame({
+        "Produto": [f"P{rng.integers(1_000_000)}" for _ in range(n)],
+        "Qtd": [str(q) for q in qtd] if qtd_texto else qtd,
+        "Custo Unitário": rng.uniform(0, 500, n).round(rng.integers(0, 4)),
+        "Margem (%)": rng.choice([0.0, 15.5, 30.0, 100.0], n),
+        "Custos Extras Produto": rng.choice([0.0, 1.25, 7.0], n),
+        "Imagem": [None] * n,
+        "Imagem_URL": rng.choice(["", "https://exemplo.com/a.jpg"], n),
+        "Cor": rng.choice(["azul", "", "verde"], n),
+        "Marca": rng.choice(["Acme", "Outra"], n),
+        "Data_Cadastro": rng.choice(["2024-01-02", "2024-03-05"], n),
+    })
+    if qtd_texto:
+        df["Qtd"] = df["Qtd"].astype(object)
+    return df
+
+
+def _editar(rng: np.random.Generator, df: pd.DataFrame, posicoes: np.ndarray):
+    """Edição como a do data_editor: algumas colunas das linhas `posicoes`."""
+    col = rng.choice([c for c in ("Qtd", "Custo Unitário", "Margem (%)", "Custos Extras Produto", "Cor", "Produto")
+                      if c in df.columns])
+    k = len(posicoes)
+    if col == "Qtd":
+        valores = rng.integers(0, 30, k) if rng.random() < 0.7 else rng.integers(0, 30, k) + 0.5
+        if df["Qtd"].dtype == object:
+            valores = np.array([str(v) for v in valores], dtype=object)
+    elif col in ("Cor", "Produto"):
+        valores = np.array([f"{col}{rng.integers(100)}" for _ in range(k)], dtype=object)
+    else:
+        valores = rng.uniform(0, 200, k)
+    atribuir_linhas(df, col, posicoes, valores)
+
+
+@pytest.mark.parametrize("semente", range(40))
+def test_incremental_igual_ao_calculo_completo(semente):
+    rng = np.random.default_rng(semente)
+    qtd_texto = semente % 4 == 3  # Qtd como texto (ex.: planilha importada sem conversão)
+    df = _linhas(rng, int(rng.integers(1, 40)), qtd_texto)
+    if semente % 5 == 4:
+        df = df.drop(columns=["Cor", "Data_Cadastro"])  # Colunas de texto ausentes
+    frete, extras = 100.0, 0.0
+    incremental = PrecificacaoIncremental()
+
+    for _ in range(60):
+        operacao = rng.choice(["inclusao", "edicao", "exclusao", "frete", "extras", "calcular"],
+                              p=[0.15, 0.3, 0.1, 0.1, 0.05, 0.3])
+        if operacao == "inclusao":
+            k = int(rng.integers(1, 5))
+            novos = _linhas(rng, k, qtd_texto)[list(df.columns)]
+            df = pd.concat([df, novos], ignore_index=True)
+            incremental.marcar_inclusao(k)
+        elif operacao == "edicao" and len(df):
+            posicoes = np.unique(rng.integers(0, len(df), int(rng.integers(1, 4))))
+            _editar(rng, df, posicoes)
+            incremental.marcar_linhas(posicoes)
+        elif operacao == "exclusao" and len(df) > 1:
+            posicoes = sorted(set(rng.integers(0, len(df), int(rng.integers(1, 3))).tolist()))
+            df = df.drop(df.index[posicoes]).reset_index(drop=True)
+            incremental.marcar_exclusao(posicoes)
+        elif operacao == "frete":
+            frete = float(rng.choice([0.0, 37.5, 100.0, 1234.56]))
+        elif operacao == "extras":
+            extras = float(rng.choice([0.0, 12.3]))
+        elif operacao == "calcular":
+            resultado = incremental.calcular(df, frete, extras, "Margem fixa", MARGEM_FIXA)
+            esperado = processar_dataframe(df, frete, extras, "Margem fixa", MARGEM_FIXA)
+            assert_frame_equal(resultado, esperado, check_exact=True, check_dtype=True)
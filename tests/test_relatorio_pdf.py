@@ -0,0 +1,37 @@
+"""Cache de PDFs do GeradorRelatorios."""
+import pandas as pd
+
+from precificar import catalogo_pdf, relatorio_pdf
+from precificar.relatorio_pdf import GeradorRelatorios
+
+
+def test_catalogo_com_fotos_faltando_nao_fica_em_cache(monkeypatch):
+    chamadas = []
+
+    def gerar(df, **opcoes):
+        chamadas.append(len(df))
+        return b"%PDF", 1 if len(chamadas) == 1 else 0  # Na 1ª geração uma foto falhou
+
+    monkeypatch.setitem(relatorio_pdf.GERADORES, "catalogo", (gerar, ["Produto", "Imagem_URL"]))
+    df = pd.DataFrame({"Produto": ["Caneta"], "Imagem_URL": ["https://exemplo.com/caneta.jpg"]})
+    gerador = GeradorRelatorios()
+
+    assert gerador.solicitar(df, "catalogo").result() == b"%PDF"
+    assert gerador.solicitar(df, "catalogo").result() == b"%PDF"  # Gerado de novo: a foto pode ter voltado
+    assert gerador.solicitar(df, "catalogo").result() == b"%PDF"  # Completo: vem do cache
+    assert chamadas == [1, 1]
+
+
+def test_catalogo_conta_so_as_fotos_que_falharam(monkeypatch):
+    class SemRede:
+        def obter(self, url, largura):
+            return None  # Download falhou
+
+    monkeypatch.setattr(catalogo_pdf, "obter_miniaturas", SemRede)
+    df = pd.DataFrame({
+        "Produto": ["Com URL", "Sem foto"],
+        "Imagem_URL": ["https://exemplo.invalid/a.jpg", ""],
+        "Preço à Vista": [10.0, 20.0],
+    })
+    pdf, fotos_faltando = catalogo_pdf.gerar_catalogo_pdf(df)
+    assert pdf.startswith(b"%PDF") and fotos_faltando == 1